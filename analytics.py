@@ -0,0 +1,356 @@
+import csv
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+
+import click
+from flask import Blueprint, current_app, jsonify, request
+
+import migrations
+from db import get_read_db
+
+# 出庫実績からの消費ペース分析（/analytics/velocity、flask stock-velocity）
+# stockout を日次の出庫量に集計し、全品目まとめて（品目ごとの Python ループなしで）次を求める。
+#   sma            : 直近 window 日の移動平均（1 日あたり）
+#   ewma           : 指数平滑（s = alpha * x + (1 - alpha) * s を日ごとに適用した最終値）
+#   std            : 日次出庫量の標準偏差（days 日間）
+#   position       : quantity - allocated + ordered（引当を除いた手持ち + 入荷待ち）
+#   days_of_cover  : position / ewma（出庫実績がなければ null）
+#   suggested_reorder_point : ceil(ewma * lead_time + z * std * sqrt(lead_time))
+#
+# 対象は今日（UTC）より前の days 日（当日分は途中なので含めない）。
+# 日次の出庫量は 1 日ずつ SQL で品目別に合計し（idx_stockout_date_item の範囲読み + その日の行だけの集計）、
+# BLOCK_DAYS 日分（BLOCK_DAYS × 品目数の行列）ごとに移動平均・指数平滑・二乗和を積み上げる。
+# メモリは履歴の長さによらず一定。
+# 計算結果は引数ごとに VELOCITY_TTL 秒プロセス内に保持する（日次の集計なので入出庫のたびには作り直さない）
+# numpy は使う関数の中で import する（ワーカーの起動・他のルートでは読み込まない）
+#
+# ページングは OFFSET ではなく、前のページの最後の行の (並び順の値, item_id) をカーソルにして、それより後ろの行だけを返す
+
+bp = Blueprint("analytics", __name__)
+
+HISTORY_DAYS_MAX = 1096
+BLOCK_DAYS = 32
+VELOCITY_PAGE_MAX = 5000
+CACHE_ENTRIES = 4
+
+# sort= の指定と並び順（True は降順）
+SORT_KEYS = {
+    "days_of_cover": False,
+    "ewma": True,
+    "sma": True,
+    "reorder_gap": True,
+}
+
+
+def velocity_params(args):
+    # 引数を検証して (days, window, alpha, lead_time, z) を返す（不正なら ValueError）
+    try:
+        days = int(args.get("days", 365))
+        window = int(args.get("window", 28))
+        alpha = float(args.get("alpha", 0.1))
+        lead_time = float(args.get("lead_time", 7))
+        z = float(args.get("z", 1.65))
+    except (TypeError, ValueError):
+        raise ValueError("days / window は整数、alpha / lead_time / z は数値で指定してください")
+    if not 1 <= days <= HISTORY_DAYS_MAX:
+        raise ValueError(f"days は 1〜{HISTORY_DAYS_MAX} で指定してください")
+    if not 1 <= window <= days:
+        raise ValueError("window は 1〜days で指定してください")
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha は 0 より大きく 1 以下で指定してください")
+    if not 0 <= lead_time <= 365:
+        raise ValueError("lead_time は 0〜365 で指定してください")
+    if not 0 <= z <= 10:
+        raise ValueError("z は 0〜10 で指定してください")
+    return days, window, alpha, lead_time, z
+
+
+def int_rows(rows, width):
+    # 整数の行のリストを (行数, width) の配列にする（np.array にタプルのリストを渡すより速い）
+    import numpy as np
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=width * len(rows)).reshape(-1, width)
+
+
+def item_index(item_ids, ids):
+    # ids（item_id の配列）の item_ids 内の添字と、items に存在するかどうか（削除済みの品目は False）
+    import numpy as np
+    idx = np.searchsorted(item_ids, ids)
+    idx[idx == len(item_ids)] = 0
+    known = item_ids[idx] == ids if len(item_ids) else np.zeros(len(ids), dtype=bool)
+    return idx, known
+
+
+def compute_velocity(conn, days=365, window=28, alpha=0.1, lead_time=7, z=1.65, today=None):
+    # 全品目の指標を item_id 順の配列で返す（names / categories は list）
+    import numpy as np
+
+    today = today or datetime.now(timezone.utc).date()
+    start = today - timedelta(days=days)
+    cur = conn.cursor()
+
+    cur.execute("SELECT item_id, item_name, category, reorder_point FROM items ORDER BY item_id")
+    items = cur.fetchall()
+    n = len(items)
+    item_ids = np.fromiter((row[0] for row in items), dtype=np.int64, count=n)
+    reorder_points = np.fromiter((row[3] or 0 for row in items), dtype=np.int64, count=n)
+    names = [row[1] for row in items]
+    categories = [row[2] for row in items]
+    del items
+
+    total = np.zeros(n)
+    sumsq = np.zeros(n)
+    sma_sum = np.zeros(n)
+    ewma = np.zeros(n)
+    decay = 1.0 - alpha
+    sma_from = days - window
+
+    for block_start in range(0, days, BLOCK_DAYS):
+        block_len = min(BLOCK_DAYS, days - block_start)
+        block = np.zeros((block_len, n))
+        for r in range(block_len):
+            lo = (start + timedelta(days=block_start + r)).isoformat()
+            hi = (start + timedelta(days=block_start + r + 1)).isoformat()
+            cur.execute("""
+                SELECT item_id, SUM(quantity) FROM stockout
+                WHERE date >= ? AND date < ?
+                GROUP BY item_id
+            """, (lo, hi))
+            day = int_rows(cur.fetchall(), 2)
+            idx, known = item_index(item_ids, day[:, 0])
+            block[r, idx[known]] = day[known, 1]
+
+        total += block.sum(axis=0)
+        sumsq += np.einsum("ij,ij->j", block, block)
+        if block_start + block_len > sma_from:
+            sma_sum += block[max(0, sma_from - block_start):].sum(axis=0)
+        # ブロック内の日ごとの平滑化をまとめて適用: s' = decay^len * s + Σ alpha * decay^(len-1-r) * x_r
+        weights = alpha * decay ** np.arange(block_len - 1, -1, -1)
+        ewma = decay ** block_len * ewma + weights @ block
+
+    mean = total / days
+    std = np.sqrt(np.maximum(sumsq / days - mean * mean, 0.0))
+    sma = sma_sum / window
+
+    cur.execute("""
+        SELECT item_id, COALESCE(quantity,0) - COALESCE(allocated,0) + COALESCE(ordered,0) FROM inventory
+    """)
+    inv = int_rows(cur.fetchall(), 2)
+    idx, known = item_index(item_ids, inv[:, 0])
+    position = np.bincount(idx[known], weights=inv[known, 1], minlength=n).astype(float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(ewma > 0, position / ewma, np.inf)
+    suggested = np.ceil(ewma * lead_time + z * std * math.sqrt(lead_time)).astype(np.int64)
+
+    return {
+        "as_of": today.isoformat(),
+        "params": {"days": days, "window": window, "alpha": alpha, "lead_time": lead_time, "z": z},
+        "item_id": item_ids,
+        "item_name": names,
+        "category": categories,
+        "total": total,
+        "sma": sma,
+        "ewma": ewma,
+        "std": std,
+        "position": position,
+        "days_of_cover": days_of_cover,
+        "reorder_point": reorder_points,
+        "suggested_reorder_point": suggested,
+    }
+
+
+def result_rows(result, order):
+    # order（添字の配列）の順に dict の行を作る
+    for i in order.tolist():
+        cover = result["days_of_cover"][i]
+        yield {
+            "item_id": int(result["item_id"][i]),
+            "item_name": result["item_name"][i],
+            "category": result["category"][i],
+            "total": float(result["total"][i]),
+            "sma": round(float(result["sma"][i]), 4),
+            "ewma": round(float(result["ewma"][i]), 4),
+            "std": round(float(result["std"][i]), 4),
+            "position": float(result["position"][i]),
+            "days_of_cover": None if math.isinf(cover) else round(float(cover), 2),
+            "reorder_point": int(result["reorder_point"][i]),
+            "suggested_reorder_point": int(result["suggested_reorder_point"][i]),
+        }
+
+
+def sort_values(result, sort):
+    if sort == "reorder_gap":
+        return result["suggested_reorder_point"] - result["reorder_point"]
+    return result[sort]
+
+
+def parse_cursor(value):
+    # <並び順の値>,<item_id>（days_of_cover の null は inf）
+    parts = value.rsplit(",", 1)
+    try:
+        return float(parts[0]), int(parts[1])
+    except (IndexError, ValueError):
+        raise ValueError("cursor の形式が不正です（<値>,<item_id>）")
+
+
+def sort_order(result, sort, mask=None, after=None):
+    # 並び順の添字。after=(値, item_id) のときはその行より後ろだけ
+    import numpy as np
+
+    sign = -1 if SORT_KEYS[sort] else 1
+    keys = sign * sort_values(result, sort)
+    candidates = np.arange(len(keys)) if mask is None else np.flatnonzero(mask)
+    if after is not None:
+        key, item_id = sign * after[0], after[1]
+        k = keys[candidates]
+        candidates = candidates[(k > key) | ((k == key) & (result["item_id"][candidates] > item_id))]
+    # 同じ値は item_id 順（安定ソート）
+    return candidates[np.argsort(keys[candidates], kind="stable")]
+
+
+# 引数ごとの計算結果 (計算時刻, 結果)。_lock は表の参照・更新の間だけ持ち、計算は引数ごとのロックで
+# 1 つずつ行う（同じ引数の要求は先の計算を待ってその結果を使い、別の引数の計算は並行して進む）
+_lock = threading.Lock()
+_cache = OrderedDict()
+_computing = {}  # key -> [引数ごとのロック, 待っている要求の数]
+
+
+def fresh(entry):
+    return entry is not None and time.monotonic() - entry[0] < current_app.config["VELOCITY_TTL"]
+
+
+def cached_velocity(params):
+    key = (current_app.config["DB_PATH"], params, datetime.now(timezone.utc).date())
+    with _lock:
+        entry = _cache.get(key)
+        if fresh(entry):
+            _cache.move_to_end(key)
+            return entry[1]
+        flight = _computing.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    try:
+        with flight[0]:
+            with _lock:
+                entry = _cache.get(key)
+            if not fresh(entry):
+                entry = (time.monotonic(), compute_velocity(get_read_db(), *params))
+                with _lock:
+                    _cache[key] = entry
+                    _cache.move_to_end(key)
+                    while len(_cache) > CACHE_ENTRIES:
+                        _cache.popitem(last=False)
+    finally:
+        with _lock:
+            flight[1] -= 1
+            if not flight[1]:
+                del _computing[key]
+    return entry[1]
+
+
+# GET /analytics/velocity?days=365&window=28&alpha=0.1&lead_time=7&z=1.65
+#                         [&sort=days_of_cover|ewma|sma|reorder_gap&category=&item_id=&limit=100&cursor=<値>,<item_id>]
+@bp.route("/analytics/velocity", methods=["GET"])
+def velocity():
+    import numpy as np
+
+    try:
+        params = velocity_params(request.args)
+        sort = request.args.get("sort", "days_of_cover")
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort は {', '.join(SORT_KEYS)} のいずれかで指定してください")
+        limit = request.args.get("limit", 100, type=int)
+        if not 1 <= limit <= VELOCITY_PAGE_MAX:
+            raise ValueError(f"limit は 1〜{VELOCITY_PAGE_MAX} で指定してください")
+        cursor = request.args.get("cursor")
+        after = parse_cursor(cursor) if cursor else None
+        item_id = request.args.get("item_id", type=int)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    result = cached_velocity(params)
+    mask = None
+    category = request.args.get("category")
+    if category is not None:
+        mask = np.fromiter((c == category for c in result["category"]), dtype=bool, count=len(result["category"]))
+    if item_id is not None:
+        hit = result["item_id"] == item_id
+        mask = hit if mask is None else mask & hit
+    count = len(result["item_id"]) if mask is None else int(mask.sum())
+    order = sort_order(result, sort, mask, after)
+    page = order[:limit]
+    next_cursor = None
+    if len(order) > limit:
+        last = page[-1]
+        next_cursor = f"{float(sort_values(result, sort)[last])!r},{int(result['item_id'][last])}"
+    return jsonify({
+        "as_of": result["as_of"],
+        "params": result["params"],
+        "count": count,
+        "items": list(result_rows(result, page)),
+        "next_cursor": next_cursor,
+    })
+
+
+# flask --app app stock-velocity [--days 365 ...] [--output velocity.csv] [--apply]
+@click.command("stock-velocity")
+@click.option("--days", type=int, default=365, help="集計する日数（今日より前）")
+@click.option("--window", type=int, default=28, help="移動平均の日数")
+@click.option("--alpha", type=float, default=0.1, help="指数平滑の係数")
+@click.option("--lead-time", type=float, default=7, help="発注から入荷までの日数")
+@click.option("--z", type=float, default=1.65, help="安全在庫の係数（1.65 で欠品率 約 5%）")
+@click.option("--output", type=click.Path(dir_okay=False, writable=True), default=None,
+              help="全品目の結果を書き出す CSV（既定は標準出力）")
+@click.option("--apply", is_flag=True, help="出庫実績のある品目の items.reorder_point を提案値で更新する")
+def velocity_command(days, window, alpha, lead_time, z, output, apply):
+    import numpy as np
+
+    try:
+        params = velocity_params({"days": days, "window": window, "alpha": alpha, "lead_time": lead_time, "z": z})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        started = time.perf_counter()
+        result = compute_velocity(conn, *params)
+        elapsed = time.perf_counter() - started
+
+        out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        try:
+            writer = None
+            for row in result_rows(result, sort_order(result, "days_of_cover")):
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+        finally:
+            if output:
+                out.close()
+
+        message = f"{len(result['item_id'])} 品目 × {days} 日を {elapsed:.2f} 秒で集計しました"
+        if apply:
+            changed = np.flatnonzero((result["total"] > 0)
+                                     & (result["suggested_reorder_point"] != result["reorder_point"]))
+            with conn:
+                conn.executemany(
+                    "UPDATE items SET reorder_point = ? WHERE item_id = ?",
+                    zip(result["suggested_reorder_point"][changed].tolist(), result["item_id"][changed].tolist()),
+                )
+            message += f"、{len(changed)} 品目の発注点を更新しました"
+        click.echo(message, err=True)
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault("VELOCITY_TTL", float(os.environ.get("INVENTORY_VELOCITY_TTL", 600)))
+    app.register_blueprint(bp)
+    app.cli.add_command(velocity_command)
@@ -1,79 +1,93 @@
-from flask import Flask, request, jsonify, session, redirect, url_for, render_template
-from functools import wraps
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, session, redirect, url_for, render_template, stream_with_context
+import click
+import csv
+import io
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from datetime import datetime
+import json
 import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "inventory.db")
-
-def get_db():
-    conn = sqlite3.connect(DB_PATH, timeout=5)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-app = Flask(__name__)
-app.secret_key = "secret_key_here"  # セッション用
-
-# DB接続
-def get_db():
-    conn = sqlite3.connect("inventory.db",timeout=5)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# 権限デコレーター
-def role_required(*roles):
-    def wrapper(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            if 'user' not in session:
-                return redirect(url_for('login'))
-            if session['role'] not in roles:
-                return "権限がありません", 403
-            return f(*args, **kwargs)
-        return decorated
-    return wrapper
-
-@app.route("/dbcheck")
+import analytics
+import checkpoints
+import db
+import history
+import lots
+import metrics
+import migrations
+import reorder
+import replenish
+import reports
+import search
+import stream
+import tokens
+from auth import role_required
+from cache import ResponseCache
+from db import get_db, get_read_db, get_snapshot_db, run_grouped, run_write
+from lots import add_lot, add_lots_from_stockin, allocate_lots, consume_lots, parse_expiration
+from metrics import log
+from replenish import receive_orders
+
+bp = Blueprint("inventory", __name__)
+
+
+@bp.app_errorhandler(db.WriteConflict)
+def write_conflict(e):
+    return jsonify({"status": "error", "message": str(e)}), 503
+
+
+@bp.route("/dbcheck")
 def dbcheck():
-    import os
-    return jsonify({"DB_PATH": DB_PATH, "exists": os.path.exists(DB_PATH)})
+    path = current_app.config["DB_PATH"]
+    snap = db.get_snapshot()
+    writer = db.get_group_writer()
+    return jsonify({
+        "DB_PATH": path,
+        "exists": os.path.exists(path),
+        "pool": db.get_pool().stats(),
+        "read_pool": db.get_read_pool().stats(),
+        "snapshot": snap.stats() if snap else {"enabled": False},
+        "stock_cache": current_app.extensions["stock_cache"].stats(),
+        "reorder_cache": current_app.extensions["reorder_cache"].stats(),
+        "token_cache": current_app.extensions["token_cache"].stats(),
+        "group_commit": writer.stats() if writer else {"enabled": False},
+    })
 
 
 # --- ログイン ---
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
-        conn = get_db()
+        conn = get_read_db()
         cur = conn.cursor()
         cur.execute("SELECT * FROM users WHERE username = ?", (username,))
         user = cur.fetchone()
         if user and check_password_hash(user["password"], password):
             session["user"] = user["username"]
             session["role"] = user["role"]
-            return redirect(url_for("index"))
+            return redirect(url_for(".index"))
         return "ユーザー名またはパスワードが間違っています"
     return render_template("login.html")
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
-    return redirect(url_for("login"))
+    return redirect(url_for(".login"))
 
-@app.route("/")
+@bp.route("/")
 def index():
     if "user" not in session:
-        return redirect(url_for("login"))
+        return redirect(url_for(".login"))
     return render_template("index.html")
 
 # --- 品目追加 ---
-@app.route("/item/add", methods=["POST"])
+@bp.route("/item/add", methods=["POST"])
 @role_required("owner", "manager")
 def add_item():
     data = request.json
-    print("POST data:", data)
+    log.debug("POST data: %s", data)
     
     item_name = data.get("item_name")
     category = data.get("category", "")
@@ -88,7 +102,7 @@ def add_item():
         # 重複チェック
         cur.execute("SELECT item_id FROM items WHERE item_name = ?", (item_name,))
         if cur.fetchone():
-            print("重複商品名:", item_name)
+            log.debug("重複商品名: %s", item_name)
             return jsonify({"status": "error", "message": "同じ商品名が既に存在します"}), 400
 
         # items に追加
@@ -97,28 +111,33 @@ def add_item():
             VALUES (?, ?, ?, ?, ?)
         """, (item_name, category, unit, reorder_point, standard_price))
         item_id = cur.lastrowid
-        print("追加 item_id:", item_id)
+        log.debug("追加 item_id: %s", item_id)
 
         # inventory に初期在庫作成
         cur.execute("""
-            INSERT INTO inventory (item_id, quantity)
-            VALUES (?, ?)
+            INSERT INTO inventory (item_id, quantity, last_update)
+            VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
         """, (item_id, 0))
 
         conn.commit()
-        print("DB commit 成功")
+        log.debug("DB commit 成功")
         return jsonify({"status": "ok", "item_id": item_id})
 
+    except sqlite3.IntegrityError:
+        # 同時追加で UNIQUE(item_name) に当たった場合
+        conn.rollback()
+        return jsonify({"status": "error", "message": "同じ商品名が既に存在します"}), 400
+
     except Exception as e:
-        print("例外発生:", e)
+        log.exception("例外発生: %s", e)
+        conn.rollback()
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    finally:
-        conn.close()
-
 
 # --- 予約作成 ---
-@app.route("/reservation/create", methods=["POST"])
+# 可用在庫のチェックと引当を 1 つの条件付き UPDATE で行う（BEGIN IMMEDIATE 内）。
+# 同時リクエストが両方チェックを通って過剰引当になることはない
+@bp.route("/reservation/create", methods=["POST"])
 @role_required("owner", "manager")
 def create_reservation():
     data = request.json
@@ -126,46 +145,136 @@ def create_reservation():
     qty = data["qty"]
     usage = data.get("usage", "")
 
-    conn = get_db()
-    cur = conn.cursor()
+    body, status = run_grouped(lambda cur: reserve(cur, inventory_id, qty, usage))
+    return jsonify(body), status
+
 
-    # 在庫情報取得
-    cur.execute("SELECT item_id, quantity, allocated FROM inventory WHERE inventory_id = ?", (inventory_id,))
+def reserve(cur, inventory_id, qty, usage):
+    # inventory の allocated を可用在庫の範囲でのみ更新
+    cur.execute("""
+        UPDATE inventory
+        SET allocated = COALESCE(allocated,0) + ?,
+            last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE inventory_id = ? AND quantity - COALESCE(allocated,0) >= ?
+        RETURNING item_id
+    """, (qty, inventory_id, qty))
     inv = cur.fetchone()
     if not inv:
-        conn.close()
-        return jsonify({"status": "error", "message": "在庫が存在しません"}), 404
-
-    available = inv["quantity"] - (inv["allocated"] or 0)
-    if qty > available:
-        conn.close()
-        return jsonify({"status": "error", "message": f"可用在庫不足（{available}）"}), 400
+        return shortage(cur, inventory_id, "在庫が存在しません", "可用在庫不足（{}）")
+    allocate_lots(cur, inv["item_id"], qty)
 
     # reservation に追加
     cur.execute("""
-        INSERT INTO reservations (item_id, quantity, usage)
-        VALUES (?, ?, ?)
-    """, (inv["item_id"], qty, usage))
+        INSERT INTO reservations (item_id, quantity, reserved_qty, usage)
+        VALUES (?, ?, ?, ?)
+    """, (inv["item_id"], qty, qty, usage))
+    return {"status": "ok"}, 200
 
-    # inventory の allocated を更新
-    cur.execute("""
-        UPDATE inventory
-        SET allocated = COALESCE(allocated,0) + ?
-        WHERE inventory_id = ?
-    """, (qty, inventory_id))
 
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "ok"})
+def shortage(cur, inventory_id, missing, insufficient):
+    # 条件付き UPDATE が 0 件だった理由（在庫なし / 可用在庫不足）を判定する
+    cur.execute("SELECT quantity - COALESCE(allocated,0) AS available FROM inventory WHERE inventory_id = ?", (inventory_id,))
+    inv = cur.fetchone()
+    if not inv:
+        return {"status": "error", "message": missing}, 404
+    return {"status": "error", "message": insufficient.format(inv["available"])}, 400
 
 
 # --- 在庫取得（入荷待ち・予約割当・可用在庫を含む） ---
-@app.route("/stock", methods=["GET"])
+# ?snapshot=1 でスナップショットから取得（X-Snapshot-Age ヘッダーに鮮度を返す）
+# 通常取得はデータバージョン単位でキャッシュし、ETag / If-None-Match で 304 を返す
+#
+# ページング・絞り込みパラメータ（いずれかを指定すると {"items", "next_cursor", "sync_token", "last_event_id"} を返す）
+#   limit, cursor        : inventory_id によるキーセットページング
+#   category             : カテゴリー一致
+#   reorder_only=1       : 発注フラグが立っている行のみ
+#   available_lte=N      : 可用在庫が N 以下
+#   name_prefix          : 商品名の前方一致
+#   since=<sync_token>   : 前回同期以降に変更（stock_events に記録）された行のみ
+# 差分同期では最初のページの sync_token を次回の since に使う。sync_token は stock_events の event_id
+# （時刻ではなく単調増加の値なので、同じ時刻のコミットや時計の巻き戻りでも取りこぼさない）。
+# 保持期間（STOCK_EVENTS_RETENTION 件）より古い since は 410 を返すので、since なしで全件を読み直す
+STOCK_PAGE_PARAMS = ("limit", "cursor", "category", "reorder_only", "available_lte", "name_prefix", "since")
+STOCK_PAGE_MAX = 1000
+
+
+@bp.route("/stock", methods=["GET"])
 def get_stock():
-    conn = get_db()
-    cur = conn.cursor()
+    try:
+        page = parse_stock_params(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    cur.execute("""
+    try:
+        if request.args.get("snapshot") == "1":
+            return jsonify(query_stock(get_snapshot_db(), page))
+
+        version = db.data_version()
+        key = request.query_string
+        stock_cache = current_app.extensions["stock_cache"]
+        entry = stock_cache.get(key, version)
+        if entry is None:
+            body = jsonify(query_stock(get_read_db(), page)).get_data()
+            entry = stock_cache.put(key, version, body)
+    except SyncTokenExpired as e:
+        return jsonify({"status": "error", "message": str(e)}), 410
+
+    body, etag = entry
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+def parse_stock_params(args):
+    if not any(name in args for name in STOCK_PAGE_PARAMS):
+        return None
+    page = {
+        "limit": min(args.get("limit", 100, type=int) or 0, STOCK_PAGE_MAX),
+        "cursor": args.get("cursor", 0, type=int),
+        "category": args.get("category"),
+        "reorder_only": args.get("reorder_only") == "1",
+        "available_lte": args.get("available_lte", type=int),
+        "name_prefix": args.get("name_prefix"),
+        "since": args.get("since", type=int),
+    }
+    if page["limit"] <= 0:
+        raise ValueError("limit は 1 以上を指定してください")
+    if "available_lte" in args and page["available_lte"] is None:
+        raise ValueError("available_lte は整数で指定してください")
+    if args.get("since") and page["since"] is None:
+        raise ValueError("since には前回の sync_token（整数）を指定してください")
+    return page
+
+
+def stock_sql(page=None):
+    # 在庫一覧の SELECT と パラメータ（ORDER BY / LIMIT は呼び出し側で付ける）
+    where = []
+    params = []
+    if page:
+        where.append("inv.inventory_id > ?")
+        params.append(page["cursor"])
+        if page["category"] is not None:
+            where.append("it.category = ?")
+            params.append(page["category"])
+        if page["reorder_only"]:
+            # トリガーで維持している発注点以下の行の集合から引く
+            where.append("inv.inventory_id IN (SELECT inventory_id FROM reorder_alerts)")
+        if page["available_lte"] is not None:
+            where.append("inv.quantity - COALESCE(inv.allocated,0) <= ?")
+            params.append(page["available_lte"])
+        if page["name_prefix"]:
+            # LIKE はインデックスを使えないため範囲比較で前方一致
+            where.append("it.item_name >= ? AND it.item_name < ?")
+            params += [page["name_prefix"], page["name_prefix"] + "\U0010ffff"]
+        if page["since"] is not None:
+            where.append("inv.inventory_id IN (SELECT inventory_id FROM stock_events WHERE event_id > ?)")
+            params.append(page["since"])
+
+    sql = """
         SELECT 
             inv.inventory_id,
             it.item_name,
@@ -178,269 +287,684 @@ def get_stock():
             CASE WHEN inv.quantity <= it.reorder_point THEN 1 ELSE 0 END AS reorder_flag
         FROM inventory AS inv
         JOIN items AS it ON inv.item_id = it.item_id
-    """)
-    
-    rows = cur.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
-
-
-    # JSON に変換して返す
-    result = []
-    for row in rows:
-        result.append({
-            "inventory_id": row["inventory_id"],
-            "item_name": row["item_name"],
-            "category": row["category"],
-            "unit": row["unit"],
-            "quantity": row["quantity"],
-            "allocated": row["allocated"],
-            "ordered": row["ordered"],
-            "available": row["available"],
-            "reorder_flag": row["reorder_flag"]
-        })
-
-    return jsonify(result)
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+
+def query_stock(conn, page=None):
+    cur = conn.cursor()
+    sql, params = stock_sql(page)
+    if page:
+        sql += " ORDER BY inv.inventory_id LIMIT ?"
+        params.append(page["limit"] + 1)
+
+    # 同期トークンは一覧と同じ読み取りトランザクションで取得する
+    in_txn = page is not None and not conn.in_transaction
+    if in_txn:
+        cur.execute("BEGIN")
+    try:
+        if page is not None and page["since"] is not None:
+            low, high = stream.event_range(conn)
+            if page["since"] > (high or 0) or (low is not None and page["since"] < low - 1):
+                raise SyncTokenExpired("since が保持期間外です。since を付けずに全件を読み直してください")
+        cur.execute(sql, params)
+        rows = [dict(row) for row in cur.fetchall()]
+        if page is None:
+            return rows
+        # /stock/stream の event_id。この値以下の変更はページに反映済みなので、次回の since（sync_token）にも使う
+        cur.execute("SELECT MAX(event_id) FROM stock_events")
+        last_event_id = cur.fetchone()[0] or 0
+    finally:
+        if in_txn:
+            conn.rollback()
+
+    next_cursor = None
+    if len(rows) > page["limit"]:
+        rows = rows[:page["limit"]]
+        next_cursor = rows[-1]["inventory_id"]
+    return {"items": rows, "next_cursor": next_cursor, "sync_token": last_event_id, "last_event_id": last_event_id}
 
 # --- 入庫処理 ---
-@app.route("/stock/in", methods=["POST"])
+# {"inventory_id": 1, "qty": 10, "supplier_id": 2, "expiration_date": "2026-12-31"}
+# 入庫ごとにロットを作り、品目の発注残（orders）を古い順に消し込む（supplier_id は省略時 DEFAULT_SUPPLIER_ID、expiration_date は省略可）
+@bp.route("/stock/in", methods=["POST"])
 @role_required("owner", "manager")
 def stock_in():
     data = request.json
     inventory_id = data["inventory_id"]
     qty = data["qty"]
+    supplier_id = data.get("supplier_id")
+    try:
+        expiration_date = parse_expiration(data.get("expiration_date"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
+    body, status = run_grouped(lambda cur: receive(cur, inventory_id, qty, supplier_id, expiration_date))
+    return jsonify(body), status
+
+
+# 入庫の仕入先を省略したとき（発注残の消し込みは仕入先を問わず古い順、入庫履歴・ロットはこの仕入先）
+DEFAULT_SUPPLIER_ID = 1
+SUPPLIER_NOT_FOUND = "仕入先が見つかりません"
 
-    # 在庫取得
-    cur.execute("SELECT item_id, quantity, ordered, allocated FROM inventory WHERE inventory_id = ?", (inventory_id,))
+
+def receive(cur, inventory_id, qty, supplier_id=None, expiration_date=None):
+    if supplier_id is not None:
+        cur.execute("SELECT 1 FROM suppliers WHERE supplier_id = ?", (supplier_id,))
+        if cur.fetchone() is None:
+            return {"status": "error", "message": SUPPLIER_NOT_FOUND}, 404
+
+    # --- inventory 更新 ---
+    cur.execute("""
+        UPDATE inventory
+        SET quantity = quantity + ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE inventory_id = ?
+        RETURNING item_id, COALESCE(ordered,0) AS ordered
+    """, (qty, inventory_id))
     inv = cur.fetchone()
     if not inv:
-        conn.close()
-        return jsonify({"status": "error", "message": "在庫が見つかりません"}), 404
+        return {"status": "error", "message": "在庫が見つかりません"}, 404
 
     item_id = inv["item_id"]
-    new_qty = inv["quantity"] + qty
-    new_ordered = max(inv["ordered"] - qty, 0)
-
-    # --- inventory 更新 ---
-    cur.execute("UPDATE inventory SET quantity = quantity + ? WHERE inventory_id = ?", (qty, inventory_id))
 
+    # --- 発注残の消し込み（仕入先の指定があればその発注を優先） ---
+    received = receive_orders(cur, inventory_id, item_id, qty, supplier_id)
+    new_ordered = max(inv["ordered"] - received, 0)
 
-    # --- stockin 履歴 ---
+    # --- stockin 履歴・ロット ---
+    if supplier_id is None:
+        supplier_id = DEFAULT_SUPPLIER_ID
     cur.execute("""
-        INSERT INTO stockin (item_id, supplier_id, quantity, date)
-        VALUES (?, 1, ?, datetime('now'))
-    """, (item_id, qty))
+        INSERT INTO stockin (item_id, supplier_id, quantity, date, expiration_date)
+        VALUES (?, ?, ?, datetime('now'), ?)
+    """, (item_id, supplier_id, qty, expiration_date))
+    lot_id = add_lot(cur, item_id, cur.lastrowid, supplier_id, expiration_date, qty)
 
     # --- 予約割当の自動割当 ---
+    allocate_reservations(cur, inventory_id, item_id, qty)
+
+    return {"status": "ok", "ordered_remaining": new_ordered, "lot_id": lot_id}, 200
+
+
+def allocate_reservations(cur, inventory_id, item_id, qty):
+    # 入庫数量を予約へ古い順（reserved_date, reservation_id）に割り当てる。
+    # 累積和で「全量消化される先頭部分」と「一部消化される 1 件」を求め、予約件数によらず定数個の文で反映する
+    if qty <= 0:
+        return 0
+
+    # ROWS フレームの累積和は単調増加で、サブクエリは予約順にストリームされるため
+    # 外側に ORDER BY を付けなければ境界の行が見つかった時点で走査を打ち切れる
     cur.execute("""
-        SELECT reservation_id, quantity, status
-        FROM reservations
-        WHERE item_id = ? AND status = 'reserved'
-        ORDER BY reserved_date
-    """, (item_id,))
-    reservations = cur.fetchall()
-    remaining = qty
-
-    for r in reservations:
-        if remaining <= 0:
-            break
-        allocate_qty = min(remaining, r["quantity"])
-        # allocated 更新
-        cur.execute("UPDATE inventory SET allocated = allocated + ? WHERE inventory_id = ?", (allocate_qty, inventory_id))
-        # 予約数量更新（消化済みに変更する場合は status を 'consumed' に）
+        SELECT reservation_id, reserved_date, running
+        FROM (
+            SELECT reservation_id, reserved_date,
+                   SUM(quantity) OVER (ORDER BY reserved_date, reservation_id ROWS UNBOUNDED PRECEDING) AS running
+            FROM reservations
+            WHERE item_id = ? AND status = 'reserved'
+        )
+        WHERE running >= ?
+        LIMIT 1
+    """, (item_id, qty))
+    boundary = cur.fetchone()
+
+    if boundary is None:
+        # 入庫数量が予約残の合計以上 → 全予約を消化
+        cur.execute("""
+            SELECT COALESCE(SUM(quantity), 0) FROM reservations
+            WHERE item_id = ? AND status = 'reserved'
+        """, (item_id,))
+        allocated = cur.fetchone()[0]
+        cur.execute("""
+            UPDATE reservations SET quantity = 0, status = 'consumed'
+            WHERE item_id = ? AND status = 'reserved'
+        """, (item_id,))
+    else:
+        allocated = qty
+        # 境界より前の予約は全量消化
+        cur.execute("""
+            UPDATE reservations SET quantity = 0, status = 'consumed'
+            WHERE item_id = ? AND status = 'reserved'
+              AND (reserved_date, reservation_id) < (?, ?)
+        """, (item_id, boundary["reserved_date"], boundary["reservation_id"]))
+        # 境界の予約は累積和の超過分が残る
+        left = boundary["running"] - qty
         cur.execute("""
             UPDATE reservations
-            SET quantity = quantity - ?, status = CASE WHEN quantity - ? <= 0 THEN 'consumed' ELSE 'reserved' END
+            SET quantity = ?, status = CASE WHEN ? <= 0 THEN 'consumed' ELSE 'reserved' END
             WHERE reservation_id = ?
-        """, (allocate_qty, allocate_qty, r["reservation_id"]))
-        remaining -= allocate_qty
+        """, (left, left, boundary["reservation_id"]))
 
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "ok", "ordered_remaining": new_ordered})
+    if allocated:
+        cur.execute("""
+            UPDATE inventory
+            SET allocated = allocated + ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE inventory_id = ?
+        """, (allocated, inventory_id))
+        allocate_lots(cur, item_id, allocated)
+    return allocated
 
 
 # --- 出庫処理 ---
-@app.route("/stock/out", methods=["POST"])
+# 可用在庫のチェックと減算を 1 つの条件付き UPDATE で行う（BEGIN IMMEDIATE 内）
+@bp.route("/stock/out", methods=["POST"])
 @role_required("owner", "manager")
 def stock_out():
     data = request.json
     inventory_id = data["inventory_id"]
     qty = data["qty"]
 
-    conn = get_db()
-    cur = conn.cursor()
+    body, status = run_grouped(lambda cur: ship(cur, inventory_id, qty))
+    return jsonify(body), status
+
 
-    # 在庫取得
-    cur.execute("SELECT quantity, allocated, item_id FROM inventory WHERE inventory_id = ?", (inventory_id,))
+def ship(cur, inventory_id, qty):
+    # quantity 更新（総在庫は減らす）
+    cur.execute("""
+        UPDATE inventory
+        SET quantity = quantity - ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE inventory_id = ? AND quantity - COALESCE(allocated,0) >= ?
+        RETURNING item_id, COALESCE(allocated,0) AS allocated
+    """, (qty, inventory_id, qty))
     inv = cur.fetchone()
     if not inv:
-        return jsonify({"status": "error", "message": "在庫が見つかりません"}), 404
-
-    available_qty = inv["quantity"] - inv["allocated"]
-    if qty > available_qty:
-        return jsonify({"status": "error", "message": f"出庫可能在庫不足 ({available_qty} 利用可能)"}), 400
+        return shortage(cur, inventory_id, "在庫が見つかりません", "出庫可能在庫不足 ({} 利用可能)")
 
     # allocated があれば減らす
     new_allocated = max(inv["allocated"] - qty, 0)
 
-    # quantity 更新（総在庫は減らす）
-    cur.execute("UPDATE inventory SET quantity = quantity - ? WHERE inventory_id = ?", (qty, inventory_id))
-
-
     # 出庫履歴追加
     cur.execute("""
         INSERT INTO stockout (item_id, quantity, date, usage)
         VALUES (?, ?, datetime('now'), '消費')
     """, (inv["item_id"], qty))
 
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "ok", "allocated_remaining": new_allocated})
+    # 期限の早いロットから出庫
+    picked = consume_lots(cur, inv["item_id"], qty)
+
+    return {"status": "ok", "allocated_remaining": new_allocated, "lots": picked}, 200
+
+# --- 一括処理（入庫・出庫・予約） ---
+# {"lines": [{"inventory_id": 1, "qty": 3, "usage": "..."}, ...], "mode": "partial" | "atomic"}
+# 全行を 1 回の SELECT で検証し、1 トランザクション・executemany で反映する。
+# partial は検証を通った行のみ反映、atomic は 1 行でも失敗すれば何も反映しない
+BATCH_MAX_LINES = 5000
+
+
+def parse_batch(data):
+    if not isinstance(data, dict) or not isinstance(data.get("lines"), list):
+        raise ValueError("lines を配列で指定してください")
+    mode = data.get("mode", "partial")
+    if mode not in ("partial", "atomic"):
+        raise ValueError("mode は partial または atomic です")
+    if len(data["lines"]) > BATCH_MAX_LINES:
+        raise ValueError(f"1 回の一括処理は {BATCH_MAX_LINES} 行までです")
+    return data["lines"], mode
+
+
+def check_line(line):
+    # 行の形式チェック。問題なければ None
+    if not isinstance(line, dict):
+        return "行の形式が不正です"
+    if not isinstance(line.get("inventory_id"), int) or isinstance(line.get("inventory_id"), bool):
+        return "inventory_id が不正です"
+    qty = line.get("qty")
+    if not isinstance(qty, int) or isinstance(qty, bool) or qty <= 0:
+        return "qty は 1 以上の整数で指定してください"
+    return None
 
-# DB 初期化スクリプト
-def init_db():
-    conn = sqlite3.connect("inventory.db")
-    cur = conn.cursor()
 
-# DB 作成・接続
-conn = sqlite3.connect("inventory.db")
-cur = conn.cursor()
-
-# 外部キー有効化
-cur.execute("PRAGMA foreign_keys = ON;")
-
-# ---------------------------
-# テーブル作成
-# ---------------------------
-
-# 1. 品目マスタ
-cur.execute("""
-CREATE TABLE IF NOT EXISTS items (
-    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_name TEXT NOT NULL,
-    category TEXT,
-    unit TEXT,
-    reorder_point INTEGER,
-    standard_price REAL
-)
-""")
-
-# 2. 仕入先マスタ
-cur.execute("""
-CREATE TABLE IF NOT EXISTS suppliers (
-    supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    supplier_name TEXT NOT NULL,
-    contact TEXT,
-    email TEXT,
-    address TEXT
-)
-""")
-
-# 3. 在庫テーブル（修正版）
-cur.execute("""
-CREATE TABLE IF NOT EXISTS inventory (
-    inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL,
-    ordered INTEGER DEFAULT 0,
-    allocated INTEGER DEFAULT 0,
-    last_update DATETIME DEFAULT CURRENT_TIMESTAMP,
-    expiration_date DATE,
-    FOREIGN KEY (item_id) REFERENCES items(item_id)
-)
-""")
-
-# 4. 入庫履歴
-cur.execute("""
-CREATE TABLE IF NOT EXISTS stockin (
-    stockin_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_id INTEGER NOT NULL,
-    supplier_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL,
-    date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    expiration_date DATE,
-    FOREIGN KEY (item_id) REFERENCES items(item_id),
-    FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id)
-)
-""")
-
-# 5. 出庫履歴
-cur.execute("""
-CREATE TABLE IF NOT EXISTS stockout (
-    stockout_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL,
-    date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    usage TEXT,
-    FOREIGN KEY (item_id) REFERENCES items(item_id)
-)
-""")
-
-# 6. 発注履歴
-cur.execute("""
-CREATE TABLE IF NOT EXISTS orders (
-    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_id INTEGER NOT NULL,
-    supplier_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL,
-    order_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    status TEXT,
-    FOREIGN KEY (item_id) REFERENCES items(item_id),
-    FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id)
-)
-""")
-
-# 7. ユーザー管理
-cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    role TEXT NOT NULL
-)
-""")
-
-# 8. 出庫予約テーブル（コメント削除済）
-cur.execute("""
-CREATE TABLE IF NOT EXISTS reservations (
-    reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    item_id INTEGER NOT NULL,
-    quantity INTEGER NOT NULL,
-    reserved_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    expected_use_date DATE,
-    usage TEXT,
-    status TEXT DEFAULT 'reserved',
-    FOREIGN KEY (item_id) REFERENCES items(item_id)
-)
-""")
-
-# ---------------------------
-# 初期ユーザー作成
-# ---------------------------
-cur.execute("""
-INSERT OR IGNORE INTO users (username, password, role)
-VALUES (?, ?, ?)
-""", ("owner", generate_password_hash("ownerpass"), "owner"))
-
-cur.execute("""
-INSERT OR IGNORE INTO users (username, password, role)
-VALUES (?, ?, ?)
-""", ("staff", generate_password_hash("staffpass"), "staff"))
-
-# ---------------------------
-# 保存・終了
-# ---------------------------
-conn.commit()
-conn.close()
-
-print("inventory.db 作成完了、全テーブルと初期ユーザーも追加されました")
+def load_inventory(cur, lines):
+    # 対象在庫を 1 回の SELECT でまとめて取得
+    ids = sorted({line["inventory_id"] for line in lines if check_line(line) is None})
+    cur.execute("""
+        SELECT inventory_id, item_id, quantity, COALESCE(allocated,0) AS allocated, COALESCE(ordered,0) AS ordered
+        FROM inventory
+        WHERE inventory_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(ids),))
+    return {row["inventory_id"]: dict(row) for row in cur.fetchall()}
+
+
+def load_suppliers(cur, lines):
+    # 行で指定された仕入先のうち存在するものを 1 回の SELECT で取得
+    ids = sorted({line["supplier_id"] for line in lines if isinstance(line, dict)
+                  and isinstance(line.get("supplier_id"), int) and not isinstance(line.get("supplier_id"), bool)})
+    if not ids:
+        return set()
+    cur.execute("SELECT supplier_id FROM suppliers WHERE supplier_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),))
+    return {row[0] for row in cur.fetchall()}
+
+
+def run_batch(lines, mode, validate, apply, prepare=None):
+    # validate(line, inv) -> エラーメッセージ or None（inv は行ごとに更新される作業用の在庫）
+    # apply(cur, accepted) で検証済みの行をまとめて反映する。prepare(cur) は検証の前に 1 回呼ぶ（参照先の一括取得など）
+    def work(cur):
+        stock = load_inventory(cur, lines)
+        if prepare is not None:
+            prepare(cur)
+        results = []
+        accepted = []
+        for i, line in enumerate(lines):
+            error = check_line(line)
+            if error is None:
+                inv = stock.get(line["inventory_id"])
+                error = "在庫が見つかりません" if inv is None else validate(line, inv)
+            if error is None:
+                accepted.append((line, stock[line["inventory_id"]]))
+                results.append({"index": i, "status": "ok"})
+            else:
+                results.append({"index": i, "status": "error", "message": error})
+
+        failed = len(lines) - len(accepted)
+        if mode == "atomic" and failed:
+            return {"status": "error", "applied": 0, "failed": failed, "results": results}, 400
+
+        if accepted:
+            apply(cur, accepted)
+        status = "ok" if not failed else "partial"
+        return {"status": status, "applied": len(accepted), "failed": failed, "results": results}, 200
+
+    body, status = run_write(work)
+    return jsonify(body), status
+
+
+def sum_by_inventory(accepted):
+    totals = {}
+    for line, inv in accepted:
+        totals[inv["inventory_id"]] = totals.get(inv["inventory_id"], 0) + line["qty"]
+    return totals
+
+
+def sum_by_item(accepted):
+    totals = {}
+    for line, inv in accepted:
+        totals[inv["item_id"]] = totals.get(inv["item_id"], 0) + line["qty"]
+    return totals
+
+
+@bp.route("/stock/in/batch", methods=["POST"])
+@role_required("owner", "manager")
+def stock_in_batch():
+    try:
+        lines, mode = parse_batch(request.json)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    suppliers = set()
+
+    def prepare(cur):
+        suppliers.update(load_suppliers(cur, lines))
+
+    def validate(line, inv):
+        supplier_id = line.get("supplier_id")
+        if supplier_id is not None:
+            if not isinstance(supplier_id, int) or isinstance(supplier_id, bool):
+                return "supplier_id が不正です"
+            if supplier_id not in suppliers:
+                return SUPPLIER_NOT_FOUND
+        try:
+            line["expiration_date"] = parse_expiration(line.get("expiration_date"))
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def apply(cur, accepted):
+        totals = sum_by_inventory(accepted)
+        cur.executemany("""
+            UPDATE inventory
+            SET quantity = quantity + ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE inventory_id = ?
+        """, [(qty, inventory_id) for inventory_id, qty in totals.items()])
+        cur.execute("SELECT COALESCE(MAX(stockin_id), 0) FROM stockin")
+        last_stockin_id = cur.fetchone()[0]
+        cur.executemany("""
+            INSERT INTO stockin (item_id, supplier_id, quantity, date, expiration_date)
+            VALUES (?, ?, ?, datetime('now'), ?)
+        """, [(inv["item_id"], DEFAULT_SUPPLIER_ID if line.get("supplier_id") is None else line["supplier_id"],
+               line["qty"], line["expiration_date"])
+              for line, inv in accepted])
+        items = {inv["inventory_id"]: inv["item_id"] for _, inv in accepted}
+        add_lots_from_stockin(cur, last_stockin_id, set(items.values()))
+        for line, inv in accepted:
+            receive_orders(cur, inv["inventory_id"], inv["item_id"], line["qty"], line.get("supplier_id"))
+        for inventory_id, qty in totals.items():
+            allocate_reservations(cur, inventory_id, items[inventory_id], qty)
+
+    return run_batch(lines, mode, validate, apply, prepare)
+
+
+@bp.route("/stock/out/batch", methods=["POST"])
+@role_required("owner", "manager")
+def stock_out_batch():
+    try:
+        lines, mode = parse_batch(request.json)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def validate(line, inv):
+        available_qty = inv["quantity"] - inv["allocated"]
+        if line["qty"] > available_qty:
+            return f"出庫可能在庫不足 ({available_qty} 利用可能)"
+        inv["quantity"] -= line["qty"]
+        return None
+
+    def apply(cur, accepted):
+        cur.executemany("""
+            UPDATE inventory
+            SET quantity = quantity - ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE inventory_id = ?
+        """, [(qty, inventory_id) for inventory_id, qty in sum_by_inventory(accepted).items()])
+        cur.executemany("""
+            INSERT INTO stockout (item_id, quantity, date, usage)
+            VALUES (?, ?, datetime('now'), ?)
+        """, [(inv["item_id"], line["qty"], line.get("usage") or "消費") for line, inv in accepted])
+        for item_id, qty in sum_by_item(accepted).items():
+            consume_lots(cur, item_id, qty)
+
+    return run_batch(lines, mode, validate, apply)
+
+
+@bp.route("/reservation/create/batch", methods=["POST"])
+@role_required("owner", "manager")
+def create_reservation_batch():
+    try:
+        lines, mode = parse_batch(request.json)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def validate(line, inv):
+        available = inv["quantity"] - inv["allocated"]
+        if line["qty"] > available:
+            return f"可用在庫不足（{available}）"
+        inv["allocated"] += line["qty"]
+        return None
+
+    def apply(cur, accepted):
+        cur.executemany("""
+            INSERT INTO reservations (item_id, quantity, reserved_qty, usage)
+            VALUES (?, ?, ?, ?)
+        """, [(inv["item_id"], line["qty"], line["qty"], line.get("usage", "")) for line, inv in accepted])
+        cur.executemany("""
+            UPDATE inventory
+            SET allocated = COALESCE(allocated,0) + ?,
+                last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE inventory_id = ?
+        """, [(qty, inventory_id) for inventory_id, qty in sum_by_inventory(accepted).items()])
+        for item_id, qty in sum_by_item(accepted).items():
+            allocate_lots(cur, item_id, qty)
+
+    return run_batch(lines, mode, validate, apply)
+
+
+# --- 一括取り込み・エクスポート ---
+# POST /items/import  CSV（ヘッダー行あり）/ NDJSON をストリームで読み、IMPORT_CHUNK 行ごとに
+#                     1 トランザクションで items と初期在庫（quantity=0）を追加する。
+#                     multipart の file 項目、またはリクエスト本文をそのまま送る（?format=csv|ndjson）
+#                     商品名が既存または同じファイル内で重複する行はスキップする（先に出た行を採用）
+# GET  /stock/export  在庫一覧を CSV / NDJSON でストリーム出力（?format=csv|ndjson）
+# どちらもファイル全体をメモリに載せない
+IMPORT_CHUNK = 5000
+IMPORT_MAX_ERRORS = 100
+EXPORT_BATCH = 1000
+
+
+def import_format(upload):
+    fmt = request.args.get("format")
+    if fmt is None:
+        name = (upload.filename if upload else None) or ""
+        mimetype = upload.mimetype if upload else request.mimetype
+        is_ndjson = name.endswith((".ndjson", ".jsonl")) or mimetype in ("application/x-ndjson", "application/jsonl")
+        fmt = "ndjson" if is_ndjson else "csv"
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError("format は csv または ndjson です")
+    return fmt
+
+
+def read_records(stream, fmt):
+    # (行番号, dict) または (行番号, エラーメッセージ) を 1 件ずつ返す
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        if reader.fieldnames is None or "item_name" not in reader.fieldnames:
+            raise ValueError("CSV の 1 行目（ヘッダー）に item_name が必要です")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for n, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield n, "JSON として読み込めません"
+            continue
+        yield n, record if isinstance(record, dict) else "オブジェクト形式で指定してください"
+
+
+def parse_item(record):
+    item_name = record.get("item_name")
+    if not isinstance(item_name, str) or not item_name.strip():
+        raise ValueError("item_name は必須です")
+    try:
+        reorder_point = int(record.get("reorder_point") or 0)
+        standard_price = float(record.get("standard_price") or 0.0)
+    except (TypeError, ValueError):
+        raise ValueError("reorder_point / standard_price が数値ではありません")
+    if reorder_point < 0:
+        raise ValueError("reorder_point は 0 以上で指定してください")
+    return item_name.strip(), record.get("category") or "", record.get("unit") or "", reorder_point, standard_price
+
+
+def import_items_chunk(cur, rows):
+    # rows: [(行番号, item_name, category, unit, reorder_point, standard_price), ...]
+    # 一時テーブルで重複を除き、items / inventory へは INSERT ... SELECT で 1 文ずつ反映する
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS import_items (
+            line INTEGER,
+            item_name TEXT PRIMARY KEY,
+            category TEXT,
+            unit TEXT,
+            reorder_point INTEGER,
+            standard_price REAL
+        )
+    """)
+    cur.execute("DELETE FROM temp.import_items")
+    # 同じチャンク内の重複は先に出た行を残す
+    cur.executemany("INSERT OR IGNORE INTO temp.import_items VALUES (?, ?, ?, ?, ?, ?)", rows)
+    cur.execute("SELECT line FROM temp.import_items")
+    staged = {row[0] for row in cur.fetchall()}
+    duplicates = [(row[0], row[1]) for row in rows if row[0] not in staged]
+
+    # 既存の商品名（前のチャンクで追加したものを含む）
+    cur.execute("""
+        DELETE FROM temp.import_items
+        WHERE item_name IN (SELECT item_name FROM main.items)
+        RETURNING line, item_name
+    """)
+    duplicates += [tuple(row) for row in cur.fetchall()]
 
+    # BEGIN IMMEDIATE 中なので、この値より大きい item_id は今回追加した品目だけ
+    cur.execute("SELECT COALESCE(MAX(item_id), 0) FROM items")
+    last_item_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO items (item_name, category, unit, reorder_point, standard_price)
+        SELECT item_name, category, unit, reorder_point, standard_price
+        FROM temp.import_items
+        ORDER BY line
+    """)
+    inserted = cur.rowcount
+    cur.execute("""
+        INSERT INTO inventory (item_id, quantity, last_update)
+        SELECT item_id, 0, strftime('%Y-%m-%d %H:%M:%f', 'now')
+        FROM items
+        WHERE item_id > ?
+    """, (last_item_id,))
+    cur.execute("DELETE FROM temp.import_items")
+    return {"inserted": inserted, "duplicates": sorted(duplicates)}, 200
 
 
+@bp.route("/items/import", methods=["POST"])
+@role_required("owner", "manager")
+def import_items():
+    upload = request.files.get("file")
+    try:
+        fmt = import_format(upload)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    summary = {"inserted": 0, "duplicates": 0, "invalid": 0}
+    errors = []
+
+    def note(line, message):
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line, "message": message})
+
+    def flush(rows):
+        body, _ = run_write(lambda cur: import_items_chunk(cur, rows))
+        summary["inserted"] += body["inserted"]
+        summary["duplicates"] += len(body["duplicates"])
+        for line, item_name in body["duplicates"]:
+            note(line, f"商品名が重複しています: {item_name}")
+
+    chunk = []
+    try:
+        for line, record in read_records(upload.stream if upload else request.stream, fmt):
+            if isinstance(record, str):
+                summary["invalid"] += 1
+                note(line, record)
+                continue
+            try:
+                chunk.append((line,) + parse_item(record))
+            except ValueError as e:
+                summary["invalid"] += 1
+                note(line, str(e))
+                continue
+            if len(chunk) >= IMPORT_CHUNK:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        # 途中まで取り込んだチャンクはコミット済み
+        return jsonify({"status": "error", "message": f"ファイルを読み込めません: {e}", **summary,
+                        "errors": errors}), 400
+
+    status = "ok" if not summary["duplicates"] and not summary["invalid"] else "partial"
+    return jsonify({"status": status, **summary, "errors": sorted(errors, key=lambda e: e["line"])})
+
+
+@bp.route("/stock/export", methods=["GET"])
+def export_stock():
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"status": "error", "message": "format は csv または ndjson です"}), 400
+    sql, params = stock_sql()
+    sql += " ORDER BY inv.inventory_id"
+    pool = db.get_read_pool()
+
+    def generate():
+        # 接続は出力が終わるまで（または切断まで）借り、1 つの SELECT を EXPORT_BATCH 行ずつ読み進める
+        conn = pool.acquire()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == "csv":
+                buffer.write("\ufeff")  # Excel で文字化けしないよう BOM を付ける
+                writer.writerow([column[0] for column in cur.description])
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            pool.release(conn)
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    resp = Response(stream_with_context(generate()), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename=stock.{fmt}"
+    return resp
+
+
+# DB 初期化（未適用のマイグレーションを適用）
+#   flask --app app init-db [--target N]
+# 起動時には DB に触れず、未初期化なら最初のリクエストで適用する（AUTO_MIGRATE）
+@click.command("init-db")
+@click.option("--target", type=int, default=migrations.LATEST_VERSION, help="適用するスキーマバージョン")
+def init_db_command(target):
+    path = current_app.config["DB_PATH"]
+    applied = migrations.migrate_path(path, target)
+    for version, description in applied:
+        click.echo(f"migration {version}: {description}")
+    click.echo(f"{path}: スキーマバージョン {target}")
+
+
+# --- アプリケーションファクトリ ---
+def create_app(config=None):
+    app = Flask(__name__)
+    app.secret_key = "secret_key_here"  # セッション用
+    if config:
+        app.config.update(config)
+
+    # DB接続（プール経由。リクエスト終了時に自動返却）
+    db.init_app(app)
+
+    # レイテンシ・SQL 計測と /metrics
+    metrics.init_app(app)
+
+    # 在庫変更の SSE 配信（/stock/stream）
+    stream.init_app(app)
+
+    # 任意時点の在庫（/stock/asof）と在庫チェックポイントの作成
+    checkpoints.init_app(app)
+
+    # ロット（FEFO）と期限切れ間近のアラート（/alerts/expiring）
+    lots.init_app(app)
+
+    # 発注点アラート（/alerts/reorder）
+    reorder.init_app(app)
+
+    # 品目検索（/items/search）
+    search.init_app(app)
+
+    # 自動発注（flask stock-replenish・REPLENISH_THREAD）と入庫時の発注残の消し込み
+    replenish.init_app(app)
+
+    # 日次の入出庫集計からのレポート（/reports/movements）
+    reports.init_app(app)
+
+    # 出庫実績からの消費ペース・在庫日数・発注点の提案（/analytics/velocity）
+    analytics.init_app(app)
+
+    # 品目の入出庫・予約履歴（/history）
+    history.init_app(app)
+
+    # 機械クライアント用の API トークン（Authorization: Bearer、/tokens・flask token-create）
+    tokens.init_app(app)
+
+    # /stock のレスポンスキャッシュ（PRAGMA data_version が変わると破棄）
+    app.extensions["stock_cache"] = ResponseCache()
+
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    return app
+
+
+# gunicorn app:app / python app.py 用（DB には接続しないので import は軽い）
+app = create_app()
+
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, redirect, request, session, url_for
+
+from db import get_read_db
+
+
+class TokenCache:
+    # token_hash -> (username, role) の TTL 付き LRU。
+    # auth_version（失効・ロール変更でトリガーが加算）を recheck 秒ごとに確認し、変わっていれば全破棄する
+    def __init__(self, max_entries=1024, ttl=300.0, recheck=1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._checked_at = float("-inf")
+        # clear() のたびに進める。検索中に破棄された場合は古い結果を入れない
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def due(self, now):
+        return now - self._checked_at >= self.recheck
+
+    def check(self, version, now):
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                if self._version is not None:
+                    self._clear()
+                self._version = version
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, principal, generation, now):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (principal, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+class TokensDisabled(RuntimeError):
+    # TOKEN_HASH_KEY（INVENTORY_TOKEN_HASH_KEY）が未設定、またはセッションの secret_key と同じ
+    pass
+
+
+def token_key():
+    # トークンの HMAC 鍵。セッションの鍵とは別に設定を必須とする（鍵を変えると発行済みのトークンはすべて無効になる）
+    key = current_app.config.get("TOKEN_HASH_KEY")
+    if not key or key == current_app.secret_key:
+        raise TokensDisabled("API トークンは無効です（INVENTORY_TOKEN_HASH_KEY をセッションの鍵とは別に設定してください）")
+    return key.encode()
+
+
+def hash_token(token):
+    return hmac.new(token_key(), token.encode(), hashlib.sha256).hexdigest()
+
+
+def resolve_token(token):
+    # (username, role) を返す。未登録・失効済みなら None（鍵が未設定なら TokensDisabled）
+    key = hash_token(token)
+    cache = current_app.extensions["token_cache"]
+    now = time.monotonic()
+    if cache.due(now):
+        row = get_read_db().execute("SELECT version FROM auth_version WHERE id = 1").fetchone()
+        cache.check(row[0], now)
+    principal = cache.get(key, now)
+    if principal is None:
+        generation = cache.generation
+        row = get_read_db().execute("""
+            SELECT u.username, u.role
+            FROM api_tokens AS t
+            JOIN users AS u ON u.id = t.user_id
+            WHERE t.token_hash = ? AND t.revoked_at IS NULL
+        """, (key,)).fetchone()
+        if row is None:
+            return None
+        principal = (row["username"], row["role"])
+        cache.put(key, principal, generation, now)
+    return principal
+
+
+# 権限デコレーター
+# セッション（/login）に加え、Authorization: Bearer <API トークン> を受け付ける
+def role_required(*roles):
+    def wrapper(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            if scheme.lower() == "bearer" and token.strip():
+                try:
+                    principal = resolve_token(token.strip())
+                except TokensDisabled as e:
+                    return jsonify({"status": "error", "message": str(e)}), 503
+                if principal is None:
+                    resp = jsonify({"status": "error", "message": "トークンが無効です"})
+                    resp.headers["WWW-Authenticate"] = "Bearer"
+                    return resp, 401
+                g.user, role = principal
+            elif 'user' not in session:
+                return redirect(url_for('inventory.login'))
+            else:
+                g.user, role = session['user'], session['role']
+            if role not in roles:
+                return "権限がありません", 403
+            return f(*args, **kwargs)
+        return decorated
+    return wrapper
@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Blueprint, current_app, jsonify, request
+
+import migrations
+from db import DATE_FORMAT, connect, get_read_db
+from metrics import log
+
+# 任意時点の在庫（/stock/asof?ts=）
+# 一定間隔（CHECKPOINT_INTERVAL 秒）で品目ごとの在庫数量を stock_checkpoints / stock_checkpoint_items に記録し、
+# 指定時刻の在庫 = 直前のチェックポイント + その後 ts までの入庫 - 出庫 で求める。
+# 読むのはチェックポイント 1 つ分と、その間隔内の入出庫だけなので、履歴が何年分あっても速度は変わらない。
+#
+# 時刻は入出庫の date と同じく UTC の 'YYYY-MM-DD HH:MM:SS'。ts=YYYY-MM-DD はその日の終わり（23:59:59）
+#
+# チェックポイントの作成
+#   - 書き込みロック（BEGIN IMMEDIATE）中に「現在時刻 - 1 秒」で区切る。以降に追加される入出庫の date は
+#     必ずそれより後になるので、作成済みのチェックポイントが後から変わることはない
+#   - gunicorn の各ワーカーは fork 後（gunicorn.conf.py の post_fork）にバックグラウンドのスレッドを起動し、
+#     期限を確認して来ていれば作成する（作成は 1 プロセスだけが行い、ロック取得後に期限を再確認する）。
+#     テスト・CLI など gunicorn 以外のプロセスでは起動しない。INVENTORY_CHECKPOINT_THREAD=0 で無効
+#     （cron から flask stock-checkpoint を呼ぶ場合など）
+#   - チェックポイントが 1 つもなければ（スレッド・flask stock-checkpoint とも）、最初の入出庫から CHECKPOINT_INTERVAL
+#     ごとに 1 つずつコミットして作る（fill_checkpoints）。全履歴の集計を 1 回の書き込みロック中に行わない
+#   - flask stock-checkpoint で即時作成、--rebuild で過去の入出庫から作り直す（過去日付の入出庫を一括投入した後などに使う）
+#
+# チェックポイントがない場合（無効にしている・最初のチェックポイントより前の ts）は、入出庫履歴の先頭から ts までを
+# 全品目分集計する（idx_stockin_date_item / idx_stockout_date_item の範囲読み。履歴の件数に比例して遅くなる）
+
+bp = Blueprint("checkpoints", __name__)
+
+ASOF_PAGE_MAX = 10000
+
+# (since, until] の入出庫を品目ごとに集計（出庫はマイナス）
+MOVEMENT_DELTAS = """
+    SELECT item_id, SUM(quantity) AS quantity FROM stockin
+    WHERE date > :since AND date <= :until {filter}
+    GROUP BY item_id
+    UNION ALL
+    SELECT item_id, -SUM(quantity) AS quantity FROM stockout
+    WHERE date > :since AND date <= :until {filter}
+    GROUP BY item_id
+"""
+
+
+def latest_checkpoint(cur, until):
+    cur.execute("""
+        SELECT checkpoint_id, taken_at FROM stock_checkpoints
+        WHERE taken_at <= ?
+        ORDER BY taken_at DESC
+        LIMIT 1
+    """, (until,))
+    return cur.fetchone()
+
+
+def build_checkpoint(cur, taken_at):
+    # taken_at 時点の在庫を直前のチェックポイント + 差分で記録する。作成した checkpoint_id（既にあれば None）
+    prev = latest_checkpoint(cur, taken_at)
+    if prev is not None and prev[1] == taken_at:
+        return None
+    cur.execute("INSERT INTO stock_checkpoints (taken_at) VALUES (?)", (taken_at,))
+    checkpoint_id = cur.lastrowid
+    cur.execute(f"""
+        INSERT INTO stock_checkpoint_items (checkpoint_id, item_id, quantity)
+        SELECT :checkpoint_id, item_id, SUM(quantity)
+        FROM (
+            SELECT item_id, quantity FROM stock_checkpoint_items WHERE checkpoint_id = :prev_id
+            UNION ALL
+            {MOVEMENT_DELTAS.format(filter="")}
+        )
+        GROUP BY item_id
+        HAVING SUM(quantity) <> 0
+    """, {
+        "checkpoint_id": checkpoint_id,
+        "prev_id": prev[0] if prev else None,
+        "since": prev[1] if prev else "",
+        "until": taken_at,
+    })
+    return checkpoint_id
+
+
+def checkpoint_due(conn, interval):
+    row = conn.execute("""
+        SELECT COALESCE(MAX(taken_at), '') <= datetime('now', ?) FROM stock_checkpoints
+    """, (f"-{int(interval)} seconds",)).fetchone()
+    return bool(row[0])
+
+
+def take_checkpoint(conn, interval=None):
+    # interval を指定すると期限が来ている場合のみ作成する。(checkpoint_id, taken_at) または None
+    if interval is not None and not checkpoint_due(conn, interval):
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if interval is not None and not checkpoint_due(conn, interval):
+            conn.execute("ROLLBACK")
+            return None
+        taken_at = conn.execute("SELECT datetime('now', '-1 seconds')").fetchone()[0]
+        checkpoint_id = build_checkpoint(conn.cursor(), taken_at)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return (checkpoint_id, taken_at) if checkpoint_id else None
+
+
+def has_checkpoint(conn):
+    return conn.execute("SELECT 1 FROM stock_checkpoints LIMIT 1").fetchone() is not None
+
+
+def fill_checkpoints(conn, interval, progress=None):
+    # 最後のチェックポイント（なければ最初の入出庫）から現在まで interval 秒ごと（UTC で区切り）に作る。
+    # 1 つ作るごとにコミットするので、書き込みを長時間止めない。同時に複数のプロセスが作っても、
+    # 作成済みの区切りは build_checkpoint が飛ばす
+    start, now = conn.execute("""
+        SELECT COALESCE(
+            (SELECT MAX(taken_at) FROM stock_checkpoints),
+            (SELECT MIN(first) FROM (
+                SELECT MIN(date) AS first FROM stockin
+                UNION ALL
+                SELECT MIN(date) FROM stockout
+            ))
+        ), datetime('now', '-1 seconds')
+    """).fetchone()
+    if start is None:
+        return 0
+
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    start = datetime.strptime(start[:19], DATE_FORMAT).replace(tzinfo=timezone.utc)
+    boundary = epoch + timedelta(seconds=((start - epoch).total_seconds() // interval + 1) * interval)
+    end = datetime.strptime(now, DATE_FORMAT).replace(tzinfo=timezone.utc)
+    count = 0
+    while boundary <= end:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            build_checkpoint(conn.cursor(), boundary.strftime(DATE_FORMAT))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        count += 1
+        if progress:
+            progress(count, boundary)
+        boundary += timedelta(seconds=interval)
+    return count
+
+
+def rebuild_checkpoints(conn, interval, progress=None):
+    # 既存のチェックポイントを削除し、最初の入出庫から現在まで interval 秒ごとに作り直す
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM stock_checkpoint_items")
+        conn.execute("DELETE FROM stock_checkpoints")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return fill_checkpoints(conn, interval, progress)
+
+
+def parse_ts(value):
+    if not value:
+        raise ValueError("ts を指定してください（例: 2026-09-30 または 2026-09-30T18:00:00）")
+    try:
+        parsed = datetime.fromisoformat(value.replace(" ", "T").rstrip("Z"))
+    except ValueError:
+        raise ValueError("ts の形式が不正です（YYYY-MM-DD または YYYY-MM-DDTHH:MM:SS）")
+    if len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime(DATE_FORMAT)
+
+
+def query_asof(conn, ts, cursor=0, limit=1000, item_id=None):
+    cur = conn.cursor()
+    # チェックポイントと入出庫を同じ読み取りトランザクションで読む
+    in_txn = not conn.in_transaction
+    if in_txn:
+        cur.execute("BEGIN")
+    try:
+        checkpoint = latest_checkpoint(cur, ts)
+        item_filter = "AND item_id > :cursor" + (" AND item_id = :item_id" if item_id is not None else "")
+        cur.execute(f"""
+            SELECT d.item_id, it.item_name, it.category, it.unit, SUM(d.quantity) AS quantity
+            FROM (
+                SELECT item_id, quantity FROM stock_checkpoint_items
+                WHERE checkpoint_id = :checkpoint_id {item_filter}
+                UNION ALL
+                {MOVEMENT_DELTAS.format(filter=item_filter)}
+            ) AS d
+            JOIN items AS it ON it.item_id = d.item_id
+            GROUP BY d.item_id
+            HAVING SUM(d.quantity) <> 0
+            ORDER BY d.item_id
+            LIMIT :limit
+        """, {
+            "checkpoint_id": checkpoint[0] if checkpoint else None,
+            "since": checkpoint[1] if checkpoint else "",
+            "until": ts,
+            "cursor": cursor,
+            "item_id": item_id,
+            "limit": limit + 1,
+        })
+        rows = [dict(row) for row in cur.fetchall()]
+    finally:
+        if in_txn:
+            conn.rollback()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["item_id"]
+    return {
+        "ts": ts,
+        "checkpoint": {"checkpoint_id": checkpoint[0], "taken_at": checkpoint[1]} if checkpoint else None,
+        "items": rows,
+        "next_cursor": next_cursor,
+    }
+
+
+# --- 任意時点の在庫 ---
+# GET /stock/asof?ts=2026-09-30[&limit=1000&cursor=<item_id>][&item_id=N]
+# 品目ごとの在庫数量（数量 0 の品目は含まない）を item_id 順に返す
+@bp.route("/stock/asof", methods=["GET"])
+def stock_asof():
+    try:
+        ts = parse_ts(request.args.get("ts"))
+        limit = request.args.get("limit", 1000, type=int)
+        if not 1 <= limit <= ASOF_PAGE_MAX:
+            raise ValueError(f"limit は 1〜{ASOF_PAGE_MAX} で指定してください")
+        cursor = request.args.get("cursor", 0, type=int)
+        item_id = request.args.get("item_id", type=int)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(query_asof(get_read_db(), ts, cursor, limit, item_id))
+
+
+# --- バックグラウンド作成 ---
+_thread_lock = threading.Lock()
+
+
+def run_checkpointer(path, interval, poll):
+    conn = connect(path)
+    while True:
+        try:
+            if not has_checkpoint(conn):
+                count = fill_checkpoints(conn, interval)
+                if count:
+                    log.info("stock checkpoints: %s 件（履歴の先頭から）", count)
+            created = take_checkpoint(conn, interval)
+            if created:
+                log.info("stock checkpoint %s: %s", *created)
+        except Exception:
+            log.exception("stock checkpoint の作成に失敗しました")
+        time.sleep(poll)
+
+
+def start_checkpointer(app):
+    # gunicorn の post_fork から（fork 後のワーカーごとに）スレッドを起動する
+    if not app.config["CHECKPOINT_THREAD"] or app.extensions.get("checkpointer_pid") == os.getpid():
+        return
+    with _thread_lock:
+        if app.extensions.get("checkpointer_pid") == os.getpid():
+            return
+        interval = app.config["CHECKPOINT_INTERVAL"]
+        thread = threading.Thread(
+            target=run_checkpointer,
+            args=(app.config["DB_PATH"], interval, min(interval, app.config["CHECKPOINT_POLL"])),
+            name="stock-checkpointer",
+            daemon=True,
+        )
+        thread.start()
+        app.extensions["checkpointer_pid"] = os.getpid()
+
+
+# flask --app app stock-checkpoint [--rebuild] [--interval 秒]
+@click.command("stock-checkpoint")
+@click.option("--rebuild", is_flag=True, help="既存のチェックポイントを削除し、過去の入出庫から作り直す")
+@click.option("--interval", type=int, default=None,
+              help="--rebuild（とチェックポイントがないとき）の間隔（秒）。既定は CHECKPOINT_INTERVAL")
+def checkpoint_command(rebuild, interval):
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = connect(path)
+    try:
+        if rebuild:
+            interval = interval or current_app.config["CHECKPOINT_INTERVAL"]
+            count = rebuild_checkpoints(conn, interval)
+            click.echo(f"{count} 件のチェックポイントを作成しました（{interval} 秒間隔）")
+        elif not has_checkpoint(conn):
+            interval = interval or current_app.config["CHECKPOINT_INTERVAL"]
+            count = fill_checkpoints(conn, interval)
+            click.echo(f"{count} 件のチェックポイントを作成しました（履歴の先頭から {interval} 秒間隔）")
+        else:
+            created = take_checkpoint(conn)
+            click.echo(f"checkpoint {created[0]}: {created[1]}" if created else "作成済みです")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault("CHECKPOINT_INTERVAL", int(os.environ.get("INVENTORY_CHECKPOINT_INTERVAL", 86400)))
+    app.config.setdefault("CHECKPOINT_POLL", float(os.environ.get("INVENTORY_CHECKPOINT_POLL", 60)))
+    app.config.setdefault("CHECKPOINT_THREAD", os.environ.get("INVENTORY_CHECKPOINT_THREAD", "1") == "1")
+    app.register_blueprint(bp)
+    app.cli.add_command(checkpoint_command)
@@ -0,0 +1,619 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+from flask import current_app, g
+
+import metrics
+import migrations
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "inventory.db")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # 入出庫の date など（UTC）
+
+# 接続ごとに設定する PRAGMA（journal_mode=WAL は DB ファイルに永続化される）
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),        # 約16MB（負数は KiB 指定）
+    ("mmap_size", 128 * 1024 * 1024),
+    ("busy_timeout", 5000),        # ms
+    ("temp_store", "MEMORY"),
+)
+
+
+def connect(path):
+    # プール外の接続（CLI・バックグラウンドのスレッド用）。autocommit なので書き込みは呼び出し側が BEGIN IMMEDIATE する
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class WriteConflict(RuntimeError):
+    # 再試行しても書き込みロックを取得できなかった
+    pass
+
+
+class ConnectionPool:
+    # プロセス単位の上限付きコネクションプール（readonly=True で参照専用）
+    def __init__(self, path, size=8, timeout=10.0, readonly=False):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.readonly = readonly
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        # fork 後（gunicorn --preload 等）は親の接続を使わず作り直す
+        self._pid = os.getpid()
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _connect(self):
+        if self.readonly:
+            # mode=ro で開き、query_only で書き込みを確実に拒否する
+            uri = f"file:{quote(os.path.abspath(self.path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=5, check_same_thread=False,
+                                   factory=metrics.InstrumentedConnection)
+        else:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                   factory=metrics.InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS:
+            if self.readonly and name == "journal_mode":
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            self._checkouts += 1
+            if not self._idle and self._created >= self.size:
+                # 空きが出るまで待機
+                self._waits += 1
+                start = time.perf_counter()
+                deadline = start + self.timeout
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout("DB 接続プールが枯渇しました")
+                    self._cond.wait(remaining)
+                waited = time.perf_counter() - start
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+            self._in_use += 1
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        # 新規接続はロックの外で作成する
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        healthy = True
+        try:
+            # コミットされずに残ったトランザクションは破棄して返却
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append(conn)
+            else:
+                self._created -= 1
+                self._discarded += 1
+            self._cond.notify()
+        if not healthy:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "readonly": self.readonly,
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time, 6),
+                "wait_time_max": round(self._max_wait, 6),
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+
+class VersionWatcher:
+    # data_version は「他の接続」のコミットで変わる。監視専用接続は書き込まないので
+    # 他プロセスを含む全コミットを検知できる
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = os.getpid()
+
+    def current(self):
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._conn = self.pool._connect()
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+class Snapshot:
+    # backup API で作るインメモリ複製。重い参照・集計クエリを書き込みと競合させずに実行する
+    def __init__(self, pool, watcher, max_age=30.0):
+        self.pool = pool
+        self.watcher = watcher
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+        self._taken_at = 0.0
+        self._verified_at = 0.0
+        self._refreshes = 0
+        self._pid = os.getpid()
+
+    def _refresh(self, version):
+        mem = sqlite3.connect(":memory:", check_same_thread=False, factory=metrics.InstrumentedConnection)
+        mem.row_factory = sqlite3.Row
+        src = self.pool.acquire()
+        try:
+            src.backup(mem)
+        finally:
+            self.pool.release(src)
+        mem.execute("PRAGMA query_only = ON")
+        # 旧スナップショットは参照中のリクエストが終われば GC で閉じられる
+        self._conn = mem
+        self._version = version
+        self._taken_at = self._verified_at = time.monotonic()
+        self._refreshes += 1
+
+    def acquire(self):
+        # (接続, 鮮度秒) を返す。更新がなければ鮮度は 0 に近い
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 後は親プロセスの接続を捨てて取り直す
+                self._pid = os.getpid()
+                self._conn = self._version = None
+            version = self.watcher.current()
+            now = time.monotonic()
+            if self._conn is None:
+                self._refresh(version)
+            elif version == self._version:
+                self._verified_at = now
+            elif now - self._taken_at >= self.max_age:
+                self._refresh(version)
+            return self._conn, time.monotonic() - self._verified_at
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "enabled": True,
+                "max_age": self.max_age,
+                "refreshes": self._refreshes,
+                "age": round(now - self._verified_at, 3) if self._conn is not None else None,
+            }
+
+
+class PendingWrite:
+    # グループコミット待ちの 1 操作。呼び出し側はコミット後に result / error を受け取る
+    def __init__(self, fn):
+        self.fn = fn
+        self.result = None
+        self.error = None
+        self.state = "queued"       # queued -> running -> done / cancelled
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self.state != "queued":
+                return False
+            self.state = "running"
+            return True
+
+    def cancel(self):
+        # まだ実行されていなければ取り消す（実行中・実行済みなら False）
+        with self._lock:
+            if self.state != "queued":
+                return False
+            self.state = "cancelled"
+            return True
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.state = "done"
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class GroupCommitWriter:
+    # 入出庫・予約の書き込みをプロセスに 1 本のライタースレッドへ集め、
+    # 待っている操作を max_batch 件または max_wait 秒ごとに 1 トランザクションでまとめてコミットする。
+    # 各操作は SAVEPOINT で区切り、status >= 400 や例外の操作だけを取り消す（他の操作には影響しない）。
+    # 受け付け順に 1 スレッドで実行するので、同じ在庫への操作の順序はプロセス内で保たれる
+    def __init__(self, pool, max_batch=64, max_wait=0.002, retries=5, backoff=0.01):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._batches = 0
+        self._ops = 0
+        self._max_batch_seen = 0
+        self._cancelled = 0
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 後は親プロセスのスレッド・キューを引き継がない
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name="group-commit-writer", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def submit(self, fn, timeout=30.0):
+        # fn(cur) -> (body, status) をライタースレッドで実行し、コミット後に結果を返す
+        op = PendingWrite(fn)
+        self._ensure_thread().put(op)
+        if not op.wait(timeout):
+            if op.cancel():
+                with self._lock:
+                    self._cancelled += 1
+                raise WriteConflict("書き込みキューが混雑しています。時間をおいて再実行してください")
+            # 実行が始まっていればコミットまで待つ（結果を取りこぼさない）
+            op.wait()
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def _collect(self, q):
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return [op for op in batch if op.start()]
+
+    def _run(self, q):
+        conn = self.pool._connect()
+        while True:
+            batch = self._collect(q)
+            if not batch:
+                continue
+            try:
+                self._commit(conn, batch)
+            except Exception as e:
+                # 想定外のエラーでもスレッドは止めず、待っている呼び出し側へ返す
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except sqlite3.Error:
+                    conn = self.pool._connect()
+                for op in batch:
+                    if op.state != "done":
+                        op.finish(error=e)
+
+    def _begin(self, conn):
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return None
+            except sqlite3.OperationalError as e:
+                if not is_busy(e):
+                    return e
+                if attempt == self.retries:
+                    return WriteConflict("DB が混雑しています。時間をおいて再実行してください")
+            finally:
+                metrics.record_lock_wait(time.perf_counter() - start)
+            backoff = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            time.sleep(backoff)
+            metrics.record_lock_wait(backoff)
+
+    def _commit(self, conn, batch):
+        error = self._begin(conn)
+        if error is not None:
+            for op in batch:
+                op.finish(error=error)
+            return
+
+        cur = conn.cursor()
+        outcomes = []
+        for op in batch:
+            cur.execute("SAVEPOINT op")
+            try:
+                body, status = op.fn(cur)
+            except Exception as e:
+                cur.execute("ROLLBACK TO op")
+                cur.execute("RELEASE op")
+                outcomes.append((op, None, e))
+                continue
+            if status >= 400:
+                cur.execute("ROLLBACK TO op")
+            cur.execute("RELEASE op")
+            outcomes.append((op, (body, status), None))
+
+        try:
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for op in batch:
+                op.finish(error=e)
+            return
+
+        with self._lock:
+            self._batches += 1
+            self._ops += len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        for op, result, error in outcomes:
+            op.finish(result, error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "max_batch": self.max_batch,
+                "max_wait": self.max_wait,
+                "batches": self._batches,
+                "ops": self._ops,
+                "avg_batch": round(self._ops / self._batches, 2) if self._batches else None,
+                "max_batch_seen": self._max_batch_seen,
+                "cancelled": self._cancelled,
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+            }
+
+
+# --- Flask 連携 ---
+_setup_lock = threading.Lock()
+
+
+def _pool(name, readonly):
+    pool = current_app.extensions.get(name)
+    if pool is None:
+        with _setup_lock:
+            pool = current_app.extensions.get(name)
+            if pool is None:
+                pool = ConnectionPool(
+                    current_app.config["DB_PATH"],
+                    size=current_app.config["DB_READ_POOL_SIZE" if readonly else "DB_POOL_SIZE"],
+                    timeout=current_app.config["DB_POOL_TIMEOUT"],
+                    readonly=readonly,
+                )
+                current_app.extensions[name] = pool
+    return pool
+
+
+def get_pool():
+    return _pool("db_pool", readonly=False)
+
+
+def get_read_pool():
+    return _pool("db_read_pool", readonly=True)
+
+
+def get_watcher():
+    watcher = current_app.extensions.get("db_version")
+    if watcher is None:
+        read_pool = get_read_pool()
+        with _setup_lock:
+            watcher = current_app.extensions.get("db_version")
+            if watcher is None:
+                watcher = VersionWatcher(read_pool)
+                current_app.extensions["db_version"] = watcher
+    return watcher
+
+
+def data_version():
+    # 書き込みがあるたびに変わる値（プロセス内でのみ比較可能）
+    return get_watcher().current()
+
+
+def get_snapshot():
+    if not current_app.config["SNAPSHOT_ENABLED"]:
+        return None
+    snap = current_app.extensions.get("db_snapshot")
+    if snap is None:
+        read_pool, watcher = get_read_pool(), get_watcher()
+        with _setup_lock:
+            snap = current_app.extensions.get("db_snapshot")
+            if snap is None:
+                snap = Snapshot(read_pool, watcher, max_age=current_app.config["SNAPSHOT_MAX_AGE"])
+                current_app.extensions["db_snapshot"] = snap
+    return snap
+
+
+def get_group_writer():
+    if not current_app.config["GROUP_COMMIT"]:
+        return None
+    writer = current_app.extensions.get("group_writer")
+    if writer is None:
+        pool = get_pool()
+        with _setup_lock:
+            writer = current_app.extensions.get("group_writer")
+            if writer is None:
+                config = current_app.config
+                writer = GroupCommitWriter(
+                    pool,
+                    max_batch=config["GROUP_COMMIT_MAX_BATCH"],
+                    max_wait=config["GROUP_COMMIT_MAX_WAIT_MS"] / 1000,
+                    retries=config["WRITE_RETRIES"],
+                    backoff=config["WRITE_BACKOFF"],
+                )
+                current_app.extensions["group_writer"] = writer
+    return writer
+
+
+def get_db():
+    # リクエスト中は同じ接続を使い回し、teardown で必ずプールへ返却する
+    if "db" not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def get_read_db():
+    # 参照専用ルート用。書き込み接続とはロック待ち行列を共有しない
+    if "read_db" not in g:
+        g.read_db = get_read_pool().acquire()
+    return g.read_db
+
+
+def get_snapshot_db():
+    # スナップショット接続を返す（無効時は参照専用接続）。g.snapshot_age に鮮度を記録する
+    snap = get_snapshot()
+    if snap is None:
+        return get_read_db()
+    conn, g.snapshot_age = snap.acquire()
+    return conn
+
+
+def is_busy(exc):
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "locked" in str(exc) or "busy" in str(exc)
+    )
+
+
+def run_write(fn):
+    # BEGIN IMMEDIATE で書き込みロックを先に取り、fn(cur) -> (body, status) を実行する。
+    # status が 400 未満ならコミット、それ以外はロールバック。
+    # SQLITE_BUSY は指数バックオフ（ジッター付き）で WRITE_RETRIES 回まで再試行する
+    conn = get_db()
+    retries = current_app.config["WRITE_RETRIES"]
+    delay = current_app.config["WRITE_BACKOFF"]
+    for attempt in range(retries + 1):
+        try:
+            # 書き込みロック取得までの待ち時間（busy_timeout 分を含む）を計測
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            finally:
+                metrics.record_lock_wait(time.perf_counter() - start)
+            body, status = fn(conn.cursor())
+            if status < 400:
+                conn.commit()
+            else:
+                conn.rollback()
+            return body, status
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy(e):
+                raise
+            if attempt == retries:
+                raise WriteConflict("DB が混雑しています。時間をおいて再実行してください") from e
+            backoff = delay * (2 ** attempt) * (0.5 + random.random())
+            time.sleep(backoff)
+            metrics.record_lock_wait(backoff)
+
+
+def run_grouped(fn):
+    # GROUP_COMMIT 有効時はライタースレッドでまとめてコミット、無効時は run_write と同じ。
+    # fn はリクエストコンテキストの外（ライタースレッド）で実行されることがあるため、cur 以外に依存しないこと
+    writer = get_group_writer()
+    if writer is None:
+        return run_write(fn)
+    return writer.submit(fn, timeout=current_app.config["GROUP_COMMIT_TIMEOUT"])
+
+
+def close_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        get_pool().release(conn)
+    conn = g.pop("read_db", None)
+    if conn is not None:
+        get_read_pool().release(conn)
+
+
+def add_snapshot_age(response):
+    age = g.get("snapshot_age")
+    if age is not None:
+        response.headers["X-Snapshot-Age"] = f"{age:.3f}"
+    return response
+
+
+def ensure_schema():
+    # 最初のリクエストで未適用のマイグレーションを適用する（以降はフラグ確認のみ）
+    app = current_app._get_current_object()
+    if app.extensions.get("db_ready"):
+        return
+    with _setup_lock:
+        if not app.extensions.get("db_ready"):
+            migrations.migrate_path(app.config["DB_PATH"])
+            app.extensions["db_ready"] = True
+
+
+def init_app(app):
+    app.config.setdefault("DB_PATH", os.environ.get("INVENTORY_DB_PATH", DB_PATH))
+    app.config.setdefault("DB_POOL_SIZE", int(os.environ.get("INVENTORY_DB_POOL_SIZE", 8)))
+    app.config.setdefault("DB_READ_POOL_SIZE", int(os.environ.get("INVENTORY_DB_READ_POOL_SIZE", 16)))
+    app.config.setdefault("DB_POOL_TIMEOUT", float(os.environ.get("INVENTORY_DB_POOL_TIMEOUT", 10)))
+    app.config.setdefault("SNAPSHOT_ENABLED", os.environ.get("INVENTORY_SNAPSHOT", "0") == "1")
+    app.config.setdefault("SNAPSHOT_MAX_AGE", float(os.environ.get("INVENTORY_SNAPSHOT_MAX_AGE", 30)))
+    app.config.setdefault("WRITE_RETRIES", int(os.environ.get("INVENTORY_WRITE_RETRIES", 5)))
+    app.config.setdefault("WRITE_BACKOFF", float(os.environ.get("INVENTORY_WRITE_BACKOFF", 0.01)))
+    app.config.setdefault("GROUP_COMMIT", os.environ.get("INVENTORY_GROUP_COMMIT", "0") == "1")
+    app.config.setdefault("GROUP_COMMIT_MAX_BATCH", int(os.environ.get("INVENTORY_GROUP_COMMIT_MAX_BATCH", 64)))
+    app.config.setdefault("GROUP_COMMIT_MAX_WAIT_MS", float(os.environ.get("INVENTORY_GROUP_COMMIT_MAX_WAIT_MS", 2)))
+    app.config.setdefault("GROUP_COMMIT_TIMEOUT", float(os.environ.get("INVENTORY_GROUP_COMMIT_TIMEOUT", 30)))
+    app.config.setdefault("AUTO_MIGRATE", os.environ.get("INVENTORY_AUTO_MIGRATE", "1") == "1")
+    if app.config["AUTO_MIGRATE"]:
+        app.before_request(ensure_schema)
+    app.after_request(add_snapshot_age)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import DB_PATH  # noqa: E402
+from migrations import migrate_path  # noqa: E402
+
+# gunicorn -c gunicorn.conf.py app:app
+# マスターでアプリを 1 回だけ読み込み（--preload 相当）、ワーカーは fork で即起動する。
+# DB 接続はリクエスト時に各ワーカーで作られるため fork 前の接続は共有されない
+#
+# スレッドの割り当て（gthread。1 リクエスト = 1 スレッド）
+#   ワーカーあたり threads 本（既定 16）のうち、/stock/stream（SSE）に使えるのは INVENTORY_STREAM_MAX_CLIENTS 本まで
+#   （既定は threads - stream.API_THREADS = 12 本）。残り（4 本）は通常の API 用に常に空いている。
+#   ストリームのスレッドはほとんどポーリングの待ちなので、開く画面の数に合わせて threads を増やせばよい。
+#   同時に配信できる画面は workers × STREAM_MAX_CLIENTS（既定 24）で、超えた画面は 503 を受けて少し後に再接続する
+#   （その間も画面は更新操作のたびに一覧を読み直す）。1 本のストリームは差分を送るか
+#   INVENTORY_STREAM_MAX_SECONDS（既定 25 秒）でスレッドを返すので、画面が多くても枠を順に使い回す
+bind = os.environ.get("INVENTORY_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("INVENTORY_WORKERS", 2))
+threads = int(os.environ.get("INVENTORY_THREADS", 16))
+preload_app = True
+
+
+def on_starting(server):
+    # マイグレーションはワーカー起動前にマスターで 1 回だけ適用する
+    applied = migrate_path(os.environ.get("INVENTORY_DB_PATH", DB_PATH))
+    for version, description in applied:
+        server.log.info("migration %s: %s", version, description)
+
+
+def post_fork(server, worker):
+    # 在庫チェックポイントのバックグラウンド作成はワーカーごとに起動する（テスト・CLI のプロセスでは起動しない）
+    from checkpoints import start_checkpointer
+
+    start_checkpointer(worker.app.wsgi())
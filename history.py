@@ -0,0 +1,163 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+import db
+from db import DATE_FORMAT, get_read_db
+
+# 品目の入出庫・予約履歴（/history）
+# 入庫・出庫・予約の 3 つの履歴を日時順にマージして返す。
+# 各履歴は品目ごとの索引（item_id, 日時, ID）を (日時, ID) 順に読むだけなので（入庫・出庫は応答の列も索引に含む。
+# 予約は割当で書き換わる quantity・status を索引に持たず、1 行ずつ表を引く）、
+# UNION ALL の ORDER BY は並べ替えずにマージになり、LIMIT の件数を読んだところで止まる。
+# ページングは OFFSET を使わず (日時, ID, 種別) のカーソルから索引をシークするので、後ろのページも先頭と同じ速さで読める
+#
+#   format=json   : limit 件ずつ（next_cursor で次のページ）
+#   format=ndjson : カーソル以降をすべて 1 行 1 件でストリーミング（監査用の全件出力）
+
+bp = Blueprint("history", __name__)
+
+HISTORY_PAGE_MAX = 5000
+HISTORY_BATCH = 1000
+
+# 種別 → (表, ID の列, 日時の列, 応答の列)。種別の文字列順が同じ日時・ID の中での並び順になる
+LEDGERS = {
+    "in": ("stockin", "stockin_id", "date",
+           "quantity, supplier_id, expiration_date, NULL AS usage, NULL AS status, NULL AS expected_use_date"),
+    "out": ("stockout", "stockout_id", "date",
+            "quantity, NULL, NULL, usage, NULL, NULL"),
+    "reserve": ("reservations", "reservation_id", "reserved_date",
+                "quantity, NULL, NULL, usage, status, expected_use_date"),
+}
+
+
+def parse_bound(value, name, end=False):
+    # YYYY-MM-DD（to は日の終わりまで）または日時
+    try:
+        parsed = datetime.fromisoformat(value.replace(" ", "T").rstrip("Z"))
+    except ValueError:
+        raise ValueError(f"{name} は YYYY-MM-DD または YYYY-MM-DDTHH:MM:SS で指定してください")
+    if end and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime(DATE_FORMAT)
+
+
+def parse_cursor(value):
+    # <日時>,<ID>,<種別>
+    parts = value.rsplit(",", 2)
+    if len(parts) != 3 or parts[2] not in LEDGERS:
+        raise ValueError("cursor の形式が不正です")
+    ts, entry_id, kind = parts
+    return ts, int(entry_id), kind
+
+
+def history_sql(types, cursor_kind=None, limit=True):
+    # 種別ごとの SELECT を UNION ALL でつなぐ。カーソルの日時は範囲の下限として索引のシークに使い、
+    # 同じ日時の行はカーソルの (ID, 種別) より後ろのものだけを残す
+    parts = []
+    for kind in types:
+        table, id_column, date_column, columns = LEDGERS[kind]
+        after = "1"
+        if cursor_kind is not None:
+            op = ">" if kind <= cursor_kind else ">="
+            after = f"({date_column}, {id_column}) {op} (:cursor_ts, :cursor_id)"
+        parts.append(f"""
+            SELECT {date_column} AS ts, {id_column} AS id, '{kind}' AS type, {columns}
+            FROM {table}
+            WHERE item_id = :item_id AND {date_column} >= :lower AND {date_column} <= :upper AND {after}
+        """)
+    return " UNION ALL ".join(parts) + " ORDER BY ts, id, type" + (" LIMIT :limit" if limit else "")
+
+
+def history_params(item_id, date_from, date_to, cursor):
+    cursor_ts, cursor_id, _ = cursor or ("", 0, None)
+    return {
+        "item_id": item_id,
+        "lower": max(date_from or "", cursor_ts),
+        "upper": date_to or "9999-12-31 23:59:59",
+        "cursor_ts": cursor_ts,
+        "cursor_id": cursor_id,
+    }
+
+
+def query_history(conn, item_id, types, date_from=None, date_to=None, cursor=None, limit=500):
+    params = history_params(item_id, date_from, date_to, cursor)
+    params["limit"] = limit + 1
+    rows = [dict(row) for row in conn.execute(history_sql(types, cursor and cursor[2]), params)]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f'{last["ts"]},{last["id"]},{last["type"]}'
+    return {
+        "item_id": item_id,
+        "from": date_from,
+        "to": date_to,
+        "types": list(types),
+        "items": rows,
+        "next_cursor": next_cursor,
+    }
+
+
+# GET /history?item_id=N[&from=2026-09-01&to=2026-09-30][&types=in,out,reserve]
+#              [&limit=500&cursor=<日時>,<ID>,<種別>][&format=json|ndjson]
+@bp.route("/history", methods=["GET"])
+def item_history():
+    try:
+        item_id = request.args.get("item_id", type=int)
+        if item_id is None:
+            raise ValueError("item_id を指定してください")
+        date_from = request.args.get("from")
+        date_from = parse_bound(date_from, "from") if date_from else None
+        date_to = request.args.get("to")
+        date_to = parse_bound(date_to, "to", end=True) if date_to else None
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("from は to 以前の日時で指定してください")
+        types = [kind for kind in request.args.get("types", ",".join(LEDGERS)).split(",") if kind]
+        if not types or any(kind not in LEDGERS for kind in types):
+            raise ValueError(f"types は {', '.join(LEDGERS)} から選んでください")
+        types = [kind for kind in LEDGERS if kind in types]
+        limit = request.args.get("limit", 500, type=int)
+        if not 1 <= limit <= HISTORY_PAGE_MAX:
+            raise ValueError(f"limit は 1〜{HISTORY_PAGE_MAX} で指定してください")
+        cursor = request.args.get("cursor")
+        cursor = parse_cursor(cursor) if cursor else None
+        fmt = request.args.get("format", "json")
+        if fmt not in ("json", "ndjson"):
+            raise ValueError("format は json または ndjson です")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if get_read_db().execute("SELECT 1 FROM items WHERE item_id = ?", (item_id,)).fetchone() is None:
+        return jsonify({"status": "error", "message": "商品が見つかりません"}), 404
+
+    if fmt == "json":
+        return jsonify(query_history(get_read_db(), item_id, types, date_from, date_to, cursor, limit))
+
+    sql = history_sql(types, cursor and cursor[2], limit=False)
+    params = history_params(item_id, date_from, date_to, cursor)
+    pool = db.get_read_pool()
+
+    def generate():
+        # /stock/export と同じく、接続は出力が終わるまで借りて 1 つの SELECT を読み進める（同じスナップショットの全件）
+        conn = pool.acquire()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(HISTORY_BATCH)
+                if not rows:
+                    break
+                yield "".join(json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows)
+        finally:
+            pool.release(conn)
+
+    resp = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    resp.headers["Content-Disposition"] = f"attachment; filename=history-{item_id}.ndjson"
+    return resp
+
+
+def init_app(app):
+    app.register_blueprint(bp)
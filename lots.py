@@ -0,0 +1,156 @@
+from datetime import date
+
+from flask import Blueprint, jsonify, request
+
+from db import get_read_db
+
+# ロット単位の在庫（賞味期限の早い順に出庫・引当: FEFO）
+# 入庫ごとにロットを作り、出庫は空き（remaining - allocated）のあるロットを期限の早い順に減らし、
+# 予約の引当は同じ順でロットの allocated を増やす。期限のないロットは最後。
+# lots.remaining の合計は inventory.quantity、lots.allocated の合計は inventory.allocated と一致する。
+# 以下の関数は入出庫・予約と同じトランザクション（cur）で呼ぶ
+
+bp = Blueprint("lots", __name__)
+
+FEFO_ORDER = "COALESCE(expiration_date, '9999-12-31'), lot_id"
+EXPIRING_PAGE_MAX = 5000
+
+
+def parse_expiration(value):
+    # 'YYYY-MM-DD' に正規化する（未指定は None）
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError("expiration_date は YYYY-MM-DD で指定してください")
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError("expiration_date は YYYY-MM-DD で指定してください")
+
+
+def add_lot(cur, item_id, stockin_id, supplier_id, expiration_date, qty):
+    cur.execute("""
+        INSERT INTO lots (item_id, stockin_id, supplier_id, expiration_date, received_qty, remaining, received_at)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+    """, (item_id, stockin_id, supplier_id, expiration_date, qty, qty))
+    lot_id = cur.lastrowid
+    refresh_expiration(cur, item_id)
+    return lot_id
+
+
+def add_lots_from_stockin(cur, after_stockin_id, item_ids):
+    # stockin_id > after_stockin_id の入庫（一括入庫。品目は item_ids）をまとめてロットにする
+    cur.execute("""
+        INSERT INTO lots (item_id, stockin_id, supplier_id, expiration_date, received_qty, remaining, received_at)
+        SELECT item_id, stockin_id, supplier_id, expiration_date, quantity, quantity, date
+        FROM stockin
+        WHERE stockin_id > ? AND quantity > 0
+    """, (after_stockin_id,))
+    for item_id in item_ids:
+        refresh_expiration(cur, item_id)
+
+
+def pick_lots(cur, item_id, qty):
+    # 空きのあるロットを FEFO 順に読み、qty を満たすまでの [(lot_id, expiration_date, 数量)] を返す
+    # （部分インデックス idx_lots_fefo の先頭から必要な行だけ読む）
+    cur.execute(f"""
+        SELECT lot_id, expiration_date, remaining - allocated AS free
+        FROM lots
+        WHERE item_id = ? AND remaining > allocated
+        ORDER BY {FEFO_ORDER}
+    """, (item_id,))
+    picks = []
+    for lot_id, expiration_date, free in cur:
+        take = min(free, qty)
+        picks.append((lot_id, expiration_date, take))
+        qty -= take
+        if qty <= 0:
+            break
+    return picks
+
+
+def consume_lots(cur, item_id, qty):
+    # 出庫: 空きのある部分を FEFO 順に減らす。消費したロットのリストを返す
+    picks = pick_lots(cur, item_id, qty)
+    cur.executemany("UPDATE lots SET remaining = remaining - ? WHERE lot_id = ?",
+                    [(take, lot_id) for lot_id, _, take in picks])
+    refresh_expiration(cur, item_id)
+    return [{"lot_id": lot_id, "expiration_date": exp, "quantity": take} for lot_id, exp, take in picks]
+
+
+def allocate_lots(cur, item_id, qty):
+    # 予約の引当: 空きのある部分を FEFO 順に引当済みにする
+    picks = pick_lots(cur, item_id, qty)
+    cur.executemany("UPDATE lots SET allocated = allocated + ? WHERE lot_id = ?",
+                    [(take, lot_id) for lot_id, _, take in picks])
+    refresh_expiration(cur, item_id)
+
+
+def refresh_expiration(cur, item_id):
+    # inventory.expiration_date = 次に出庫されるロットの期限（変わったときだけ更新）
+    cur.execute(f"""
+        SELECT expiration_date FROM lots
+        WHERE item_id = ? AND remaining > allocated
+        ORDER BY {FEFO_ORDER}
+        LIMIT 1
+    """, (item_id,))
+    head = cur.fetchone()
+    cur.execute("""
+        UPDATE inventory SET expiration_date = ?
+        WHERE item_id = ? AND expiration_date IS NOT ?
+    """, (head[0] if head else None, item_id, head[0] if head else None))
+
+
+# --- 期限切れ間近のロット ---
+# GET /alerts/expiring?days=7[&limit=500&cursor=<expiration_date>,<lot_id>]
+# 在庫が残っていて期限が今日 + days 日以内（期限切れを含む）のロットを期限の早い順に返す
+@bp.route("/alerts/expiring", methods=["GET"])
+def expiring_lots():
+    try:
+        days = request.args.get("days", 7, type=int)
+        if not 0 <= days <= 3650:
+            raise ValueError("days は 0〜3650 で指定してください")
+        limit = request.args.get("limit", 500, type=int)
+        if not 1 <= limit <= EXPIRING_PAGE_MAX:
+            raise ValueError(f"limit は 1〜{EXPIRING_PAGE_MAX} で指定してください")
+        cursor = request.args.get("cursor", "")
+        cursor_date, cursor_id = "", 0
+        if cursor:
+            cursor_date, _, cursor_id = cursor.partition(",")
+            cursor_id = int(cursor_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    cur = get_read_db().cursor()
+    cur.execute("""
+        SELECT
+            l.lot_id,
+            l.item_id,
+            it.item_name,
+            it.category,
+            it.unit,
+            l.expiration_date,
+            CAST(julianday(l.expiration_date) - julianday('now', 'start of day') AS INTEGER) AS days_left,
+            l.remaining,
+            l.allocated,
+            l.supplier_id,
+            l.received_at
+        FROM lots AS l
+        JOIN items AS it ON it.item_id = l.item_id
+        WHERE l.remaining > 0 AND l.expiration_date IS NOT NULL
+          AND l.expiration_date <= date('now', ?)
+          AND (l.expiration_date, l.lot_id) > (?, ?)
+        ORDER BY l.expiration_date, l.lot_id
+        LIMIT ?
+    """, (f"+{days} days", cursor_date, cursor_id, limit + 1))
+    rows = [dict(row) for row in cur.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f'{rows[-1]["expiration_date"]},{rows[-1]["lot_id"]}'
+    return jsonify({"days": days, "items": rows, "next_cursor": next_cursor})
+
+
+def init_app(app):
+    app.register_blueprint(bp)
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, g, has_request_context, request
+
+# リクエスト・SQL 計測と Prometheus テキスト形式の /metrics
+# 値はプロセス単位（gunicorn の各ワーカーが個別に公開する）
+
+log = logging.getLogger("inventory")
+slow_log = logging.getLogger("inventory.slow")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+bp = Blueprint("metrics", __name__)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels=""):
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}          # (method, route, status) -> 件数
+        self.latency = {}           # (method, route) -> Histogram
+        self.sql_per_request = Histogram((1, 2, 5, 10, 20, 50, 100, 500))
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.lock_wait = Histogram()
+        self.slow_requests = 0
+        self.slow_queries = 0
+
+    def observe_request(self, method, route, status, elapsed, sql_count):
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.latency.get((method, route))
+            if hist is None:
+                hist = self.latency[(method, route)] = Histogram()
+            hist.observe(elapsed)
+            self.sql_per_request.observe(sql_count)
+
+    def observe_sql(self, elapsed, statement=True):
+        with self._lock:
+            if statement:
+                self.sql_statements += 1
+            self.sql_seconds += elapsed
+
+    def observe_lock_wait(self, elapsed):
+        with self._lock:
+            self.lock_wait.observe(elapsed)
+
+    def count_slow(self, kind):
+        with self._lock:
+            if kind == "request":
+                self.slow_requests += 1
+            else:
+                self.slow_queries += 1
+
+
+registry = Registry()
+
+
+def _thresholds():
+    if has_request_context():
+        return current_app.config["SLOW_REQUEST_MS"] / 1000, current_app.config["SLOW_QUERY_MS"] / 1000
+    return None, None
+
+
+# --- SQL 計測用の接続・カーソル ---
+def record_sql(elapsed, statement=True):
+    # statement=False は実行中の文の続き（結果の読み出しの時間）
+    registry.observe_sql(elapsed, statement)
+    if not has_request_context():
+        return
+    if statement:
+        g.sql_count = g.get("sql_count", 0) + 1
+    g.sql_time = g.get("sql_time", 0.0) + elapsed
+
+
+def record_slow_query(sql, elapsed):
+    registry.count_slow("query")
+    slow_log.warning(json.dumps({
+        "event": "slow_query",
+        "path": request.path,
+        "ms": round(elapsed * 1000, 2),
+        "sql": " ".join(sql.split())[:500],
+    }, ensure_ascii=False))
+
+
+def record_lock_wait(elapsed):
+    registry.observe_lock_wait(elapsed)
+    if has_request_context():
+        g.lock_wait = g.get("lock_wait", 0.0) + elapsed
+
+
+# 反復（for row in cur）は ITER_BATCH 行ずつ fetchmany で読み、その時間を記録する（行ごとの計測はしない）
+ITER_BATCH = 1000
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # pysqlite の execute は先頭行まで進めるだけで、残りの走査は fetch* / 反復の中で行われる。
+    # 文の時間は execute とその結果の読み出しの合計とし、合計が SLOW_QUERY_MS を超えた時点で 1 回だけ低速クエリとして記録する
+    _sql = None
+    _elapsed = 0.0
+    _slow = False
+
+    def _add(self, elapsed, statement=False):
+        record_sql(elapsed, statement)
+        self._elapsed += elapsed
+        if self._slow or not has_request_context():
+            return
+        _, slow_query = _thresholds()
+        if self._elapsed >= slow_query:
+            self._slow = True
+            record_slow_query(self._sql, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._elapsed, self._slow = sql, 0.0, False
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._elapsed, self._slow = sql, 0.0, False
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(time.perf_counter() - start, True)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(ITER_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# --- リクエスト計測 ---
+def start_request():
+    g.request_start = time.perf_counter()
+
+
+def finish_request(response):
+    start = g.get("request_start")
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    sql_count = g.get("sql_count", 0)
+    registry.observe_request(request.method, route, response.status_code, elapsed, sql_count)
+
+    slow_request, _ = _thresholds()
+    if elapsed >= slow_request:
+        registry.count_slow("request")
+        slow_log.warning(json.dumps({
+            "event": "slow_request",
+            "method": request.method,
+            "route": route,
+            "status": response.status_code,
+            "ms": round(elapsed * 1000, 2),
+            "sql_count": sql_count,
+            "sql_ms": round(g.get("sql_time", 0.0) * 1000, 2),
+            "lock_wait_ms": round(g.get("lock_wait", 0.0) * 1000, 2),
+        }, ensure_ascii=False))
+    return response
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+@bp.route("/metrics")
+def metrics():
+    r = registry
+    lines = []
+    with r._lock:
+        lines.append("# TYPE inventory_requests_total counter")
+        for (method, route, status), n in sorted(r.requests.items()):
+            lines.append(f'inventory_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {n}')
+        lines.append("# TYPE inventory_request_seconds histogram")
+        for (method, route), hist in sorted(r.latency.items()):
+            lines.extend(hist.lines("inventory_request_seconds", f'method="{method}",route="{_escape(route)}"'))
+        lines.append("# TYPE inventory_sql_statements_per_request histogram")
+        lines.extend(r.sql_per_request.lines("inventory_sql_statements_per_request"))
+        lines.append("# TYPE inventory_sql_statements_total counter")
+        lines.append(f"inventory_sql_statements_total {r.sql_statements}")
+        lines.append("# TYPE inventory_sql_seconds_total counter")
+        lines.append(f"inventory_sql_seconds_total {r.sql_seconds:.6f}")
+        lines.append("# TYPE inventory_lock_wait_seconds histogram")
+        lines.extend(r.lock_wait.lines("inventory_lock_wait_seconds"))
+        lines.append("# TYPE inventory_slow_requests_total counter")
+        lines.append(f"inventory_slow_requests_total {r.slow_requests}")
+        lines.append("# TYPE inventory_slow_queries_total counter")
+        lines.append(f"inventory_slow_queries_total {r.slow_queries}")
+
+    for name, key in (("write", "db_pool"), ("read", "db_read_pool")):
+        pool = current_app.extensions.get(key)
+        if pool is None:
+            continue
+        stats = pool.stats()
+        for stat in ("in_use", "idle", "created"):
+            lines.append(f'inventory_pool_{stat}{{pool="{name}"}} {stats[stat]}')
+        for stat in ("checkouts", "waits", "timeouts"):
+            lines.append(f'inventory_pool_{stat}_total{{pool="{name}"}} {stats[stat]}')
+        lines.append(f'inventory_pool_wait_seconds_total{{pool="{name}"}} {stats["wait_time_total"]}')
+
+    writer = current_app.extensions.get("group_writer")
+    if writer is not None:
+        stats = writer.stats()
+        lines.append(f"inventory_group_commit_batches_total {stats['batches']}")
+        lines.append(f"inventory_group_commit_ops_total {stats['ops']}")
+        lines.append(f"inventory_group_commit_cancelled_total {stats['cancelled']}")
+        lines.append(f"inventory_group_commit_queued {stats['queued']}")
+
+    cache = current_app.extensions["stock_cache"].stats()
+    for key in ("hits", "misses", "invalidations"):
+        lines.append(f'inventory_stock_cache_{key}_total {cache[key]}')
+
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    # INVENTORY_LOG_LEVEL=DEBUG などで詳細ログを有効化（既定では debug ログは出力されずコストもない）
+    level = os.environ.get("INVENTORY_LOG_LEVEL")
+    if level:
+        logging.basicConfig(level=level.upper())
+    app.config.setdefault("SLOW_REQUEST_MS", float(os.environ.get("INVENTORY_SLOW_REQUEST_MS", 500)))
+    app.config.setdefault("SLOW_QUERY_MS", float(os.environ.get("INVENTORY_SLOW_QUERY_MS", 100)))
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.register_blueprint(bp)
@@ -0,0 +1,796 @@
+import sqlite3
+
+from werkzeug.security import generate_password_hash
+
+# スキーマのバージョン管理（PRAGMA user_version に適用済みバージョンを記録）
+# マイグレーションは追加のみ。適用済みのものは書き換えない
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+# ---------------------------
+# 1. 基本テーブル
+# ---------------------------
+def create_tables(cur):
+    # 1. 品目マスタ
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS items (
+        item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_name TEXT NOT NULL,
+        category TEXT,
+        unit TEXT,
+        reorder_point INTEGER,
+        standard_price REAL
+    )
+    """)
+
+    # 2. 仕入先マスタ
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS suppliers (
+        supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        supplier_name TEXT NOT NULL,
+        contact TEXT,
+        email TEXT,
+        address TEXT
+    )
+    """)
+
+    # 3. 在庫テーブル
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS inventory (
+        inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        ordered INTEGER DEFAULT 0,
+        allocated INTEGER DEFAULT 0,
+        last_update DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expiration_date DATE,
+        FOREIGN KEY (item_id) REFERENCES items(item_id)
+    )
+    """)
+
+    # 4. 入庫履歴
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stockin (
+        stockin_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expiration_date DATE,
+        FOREIGN KEY (item_id) REFERENCES items(item_id),
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id)
+    )
+    """)
+
+    # 5. 出庫履歴
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stockout (
+        stockout_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        usage TEXT,
+        FOREIGN KEY (item_id) REFERENCES items(item_id)
+    )
+    """)
+
+    # 6. 発注履歴
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        supplier_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        order_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        status TEXT,
+        FOREIGN KEY (item_id) REFERENCES items(item_id),
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id)
+    )
+    """)
+
+    # 7. ユーザー管理
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL
+    )
+    """)
+
+    # 8. 出庫予約テーブル
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reservations (
+        reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        reserved_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        expected_use_date DATE,
+        usage TEXT,
+        status TEXT DEFAULT 'reserved',
+        FOREIGN KEY (item_id) REFERENCES items(item_id)
+    )
+    """)
+
+    # 初期ユーザー作成（パスワードハッシュは未登録の場合のみ計算する）
+    for username, password, role in (("owner", "ownerpass", "owner"), ("staff", "staffpass", "staff")):
+        cur.execute("SELECT 1 FROM users WHERE username = ?", (username,))
+        if cur.fetchone() is None:
+            cur.execute("""
+            INSERT INTO users (username, password, role)
+            VALUES (?, ?, ?)
+            """, (username, generate_password_hash(password), role))
+
+
+# ---------------------------
+# 2. ホットクエリ用インデックス
+# ---------------------------
+def add_hot_query_indexes(cur):
+    # 商品名の重複は UNIQUE インデックスで防ぐ（既存データに重複があれば先に解消が必要）
+    cur.execute("""
+        SELECT item_name FROM items GROUP BY item_name HAVING COUNT(*) > 1 LIMIT 5
+    """)
+    duplicates = [row[0] for row in cur.fetchall()]
+    if duplicates:
+        raise MigrationError(f"商品名が重複しているため UNIQUE 制約を追加できません: {duplicates}")
+
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_items_name ON items(item_name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_item ON inventory(item_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_inventory_last_update ON inventory(last_update)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stockin_item_date ON stockin(item_id, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stockout_item_date ON stockout(item_id, date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reservations_item_status_date ON reservations(item_id, status, reserved_date)")
+
+
+# ---------------------------
+# 3. 在庫変更イベント（/stock/stream 用）
+# ---------------------------
+STOCK_EVENTS_RETENTION = 100000
+
+
+def add_stock_events(cur):
+    # inventory の変更をトリガーで記録する。event_id は AUTOINCREMENT なので削除後も再利用されず、
+    # クライアントは最後に受け取った event_id から再開できる
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stock_events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        inventory_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        quantity INTEGER,
+        allocated INTEGER,
+        ordered INTEGER,
+        created_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_insert_event
+    AFTER INSERT ON inventory
+    BEGIN
+        INSERT INTO stock_events (inventory_id, kind, quantity, allocated, ordered)
+        VALUES (NEW.inventory_id, 'insert', NEW.quantity, COALESCE(NEW.allocated,0), COALESCE(NEW.ordered,0));
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_update_event
+    AFTER UPDATE OF quantity, allocated, ordered ON inventory
+    WHEN NEW.quantity IS NOT OLD.quantity
+      OR COALESCE(NEW.allocated,0) IS NOT COALESCE(OLD.allocated,0)
+      OR COALESCE(NEW.ordered,0) IS NOT COALESCE(OLD.ordered,0)
+    BEGIN
+        INSERT INTO stock_events (inventory_id, kind, quantity, allocated, ordered)
+        VALUES (NEW.inventory_id, 'update', NEW.quantity, COALESCE(NEW.allocated,0), COALESCE(NEW.ordered,0));
+    END
+    """)
+    # 古いイベントは 1000 件ごとにまとめて削除（直近 STOCK_EVENTS_RETENTION 件を保持）
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stock_events_prune
+    AFTER INSERT ON stock_events
+    WHEN NEW.event_id % 1000 = 0
+    BEGIN
+        DELETE FROM stock_events WHERE event_id <= NEW.event_id - {STOCK_EVENTS_RETENTION};
+    END
+    """)
+
+
+# ---------------------------
+# 4. 在庫チェックポイント（/stock/asof 用）
+# ---------------------------
+def add_stock_checkpoints(cur):
+    # 一定間隔で品目ごとの在庫数量を記録し、任意時点の在庫は直前のチェックポイント + それ以降の入出庫で求める
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stock_checkpoints (
+        checkpoint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        taken_at DATETIME NOT NULL UNIQUE
+    )
+    """)
+    # 数量 0 の品目は記録しない（無い行は 0 として扱う）
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stock_checkpoint_items (
+        checkpoint_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (checkpoint_id, item_id),
+        FOREIGN KEY (checkpoint_id) REFERENCES stock_checkpoints(checkpoint_id)
+    ) WITHOUT ROWID
+    """)
+    # 期間内の入出庫を全品目まとめて集計するためのカバリングインデックス
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stockin_date_item ON stockin(date, item_id, quantity)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stockout_date_item ON stockout(date, item_id, quantity)")
+
+
+# ---------------------------
+# 5. ロット（賞味期限の早い順に出庫・引当: FEFO）
+# ---------------------------
+def add_lots(cur):
+    # 入庫 1 件 = 1 ロット。remaining の合計は inventory.quantity、allocated の合計は inventory.allocated と一致させる
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS lots (
+        lot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        stockin_id INTEGER,
+        supplier_id INTEGER,
+        expiration_date DATE,
+        received_qty INTEGER NOT NULL,
+        remaining INTEGER NOT NULL,
+        allocated INTEGER NOT NULL DEFAULT 0,
+        received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (item_id) REFERENCES items(item_id),
+        FOREIGN KEY (stockin_id) REFERENCES stockin(stockin_id)
+    )
+    """)
+    # 出庫・引当の順序（期限なしは最後）。空きのあるロットだけを持つ部分インデックスなので、
+    # 使い切ったロットがいくら増えても先頭の読み出しは品目ごとに数行で済む
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lots_fefo
+        ON lots(item_id, COALESCE(expiration_date, '9999-12-31'), lot_id)
+        WHERE remaining > allocated
+    """)
+    # 期限切れ間近の一覧（/alerts/expiring）
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lots_expiring
+        ON lots(expiration_date)
+        WHERE remaining > 0 AND expiration_date IS NOT NULL
+    """)
+    rebuild_lots(cur)
+
+
+def rebuild_lots(cur):
+    # 既存の在庫からロットを復元する。FEFO で出庫されていれば残っているのは期限の遅い入庫なので、
+    # 期限の遅い順に在庫数量まで入庫を割り当て、足りない分は期限なしのロットにする
+    cur.execute("DELETE FROM lots")
+    cur.execute("""
+        INSERT INTO lots (item_id, stockin_id, supplier_id, expiration_date, received_qty, remaining, received_at)
+        SELECT item_id, stockin_id, supplier_id, expiration_date, quantity,
+               MIN(quantity, onhand - (running - quantity)), date
+        FROM (
+            SELECT s.item_id, s.stockin_id, s.supplier_id, s.expiration_date, s.quantity, s.date, inv.onhand,
+                   SUM(s.quantity) OVER (
+                       PARTITION BY s.item_id
+                       ORDER BY COALESCE(s.expiration_date, '9999-12-31') DESC, s.stockin_id DESC
+                       ROWS UNBOUNDED PRECEDING
+                   ) AS running
+            FROM stockin AS s
+            JOIN (
+                SELECT item_id, SUM(quantity) AS onhand FROM inventory
+                GROUP BY item_id HAVING SUM(quantity) > 0
+            ) AS inv ON inv.item_id = s.item_id
+            WHERE s.quantity > 0
+        )
+        WHERE running - quantity < onhand
+    """)
+    cur.execute("""
+        INSERT INTO lots (item_id, received_qty, remaining)
+        SELECT inv.item_id, inv.onhand - COALESCE(l.total, 0), inv.onhand - COALESCE(l.total, 0)
+        FROM (
+            SELECT item_id, SUM(quantity) AS onhand FROM inventory GROUP BY item_id
+        ) AS inv
+        LEFT JOIN (
+            SELECT item_id, SUM(remaining) AS total FROM lots GROUP BY item_id
+        ) AS l ON l.item_id = inv.item_id
+        WHERE inv.onhand > COALESCE(l.total, 0)
+    """)
+    # 引当済み数量を FEFO 順に割り当てる
+    cur.execute("""
+        SELECT MIN(l.remaining, inv.allocated - (l.running - l.remaining)) AS allocated, l.lot_id
+        FROM (
+            SELECT lot_id, item_id, remaining,
+                   SUM(remaining) OVER (
+                       PARTITION BY item_id
+                       ORDER BY COALESCE(expiration_date, '9999-12-31'), lot_id
+                       ROWS UNBOUNDED PRECEDING
+                   ) AS running
+            FROM lots
+        ) AS l
+        JOIN inventory AS inv ON inv.item_id = l.item_id
+        WHERE inv.allocated > l.running - l.remaining
+    """)
+    cur.executemany("UPDATE lots SET allocated = ? WHERE lot_id = ?", cur.fetchall())
+    # inventory.expiration_date は次に出庫されるロットの期限
+    cur.execute("""
+        UPDATE inventory SET expiration_date = (
+            SELECT expiration_date FROM lots
+            WHERE lots.item_id = inventory.item_id AND remaining > allocated
+            ORDER BY COALESCE(expiration_date, '9999-12-31'), lot_id
+            LIMIT 1
+        )
+    """)
+
+
+# ---------------------------
+# 6. 発注点アラート（/alerts/reorder 用）
+# ---------------------------
+def add_reorder_alerts(cur):
+    # quantity <= reorder_point の在庫行の集合をトリガーで維持する。
+    # 判定が変わりうる変更（quantity・reorder_point）のときだけ、その行の出入りを反映する
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reorder_alerts (
+        inventory_id INTEGER PRIMARY KEY,
+        flagged_at DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_reorder_insert
+    AFTER INSERT ON inventory
+    BEGIN
+        INSERT OR IGNORE INTO reorder_alerts (inventory_id)
+        SELECT NEW.inventory_id FROM items
+        WHERE item_id = NEW.item_id AND NEW.quantity <= reorder_point;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_reorder_update
+    AFTER UPDATE OF quantity ON inventory
+    WHEN NEW.quantity IS NOT OLD.quantity
+    BEGIN
+        DELETE FROM reorder_alerts
+        WHERE inventory_id = NEW.inventory_id
+          AND (NEW.quantity <= (SELECT reorder_point FROM items WHERE item_id = NEW.item_id)) IS NOT 1;
+        INSERT OR IGNORE INTO reorder_alerts (inventory_id)
+        SELECT NEW.inventory_id FROM items
+        WHERE item_id = NEW.item_id AND NEW.quantity <= reorder_point;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_reorder_delete
+    AFTER DELETE ON inventory
+    BEGIN
+        DELETE FROM reorder_alerts WHERE inventory_id = OLD.inventory_id;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_reorder_point
+    AFTER UPDATE OF reorder_point ON items
+    WHEN NEW.reorder_point IS NOT OLD.reorder_point
+    BEGIN
+        DELETE FROM reorder_alerts
+        WHERE inventory_id IN (
+            SELECT inventory_id FROM inventory
+            WHERE item_id = NEW.item_id AND (quantity <= NEW.reorder_point) IS NOT 1
+        );
+        INSERT OR IGNORE INTO reorder_alerts (inventory_id)
+        SELECT inventory_id FROM inventory
+        WHERE item_id = NEW.item_id AND quantity <= NEW.reorder_point;
+    END
+    """)
+    rebuild_reorder_alerts(cur)
+
+
+def rebuild_reorder_alerts(cur):
+    # 在庫と発注点から reorder_alerts を作り直す（トリガーを止めて一括投入した後など）
+    cur.execute("DELETE FROM reorder_alerts")
+    cur.execute("""
+        INSERT OR IGNORE INTO reorder_alerts (inventory_id)
+        SELECT inv.inventory_id
+        FROM inventory AS inv
+        JOIN items AS it ON it.item_id = inv.item_id
+        WHERE inv.quantity <= it.reorder_point
+    """)
+
+
+# ---------------------------
+# 7. 品目の全文検索（/items/search 用）
+# ---------------------------
+def add_items_fts(cur):
+    # 商品名・カテゴリーの trigram 索引（日本語も 3 文字以上の部分一致で引ける）。
+    # 本文は items を参照する外部コンテンツ表なので、索引だけを持ち、トリガーで同期する
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        item_name, category,
+        content='items', content_rowid='item_id',
+        tokenize='trigram'
+    )
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_insert
+    AFTER INSERT ON items
+    BEGIN
+        INSERT INTO items_fts (rowid, item_name, category) VALUES (NEW.item_id, NEW.item_name, NEW.category);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_delete
+    AFTER DELETE ON items
+    BEGIN
+        INSERT INTO items_fts (items_fts, rowid, item_name, category)
+        VALUES ('delete', OLD.item_id, OLD.item_name, OLD.category);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_items_fts_update
+    AFTER UPDATE OF item_name, category ON items
+    BEGIN
+        INSERT INTO items_fts (items_fts, rowid, item_name, category)
+        VALUES ('delete', OLD.item_id, OLD.item_name, OLD.category);
+        INSERT INTO items_fts (rowid, item_name, category) VALUES (NEW.item_id, NEW.item_name, NEW.category);
+    END
+    """)
+    # 索引中の trigram の一覧（3 文字未満の語を trigram の OR に展開するのに使う）
+    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS items_fts_vocab USING fts5vocab(items_fts, row)")
+    # 並び順（rank）は商品名の一致を重く見る
+    cur.execute("INSERT INTO items_fts (items_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    cur.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+
+
+# ---------------------------
+# 8. 自動発注（発注点を下回った品目をまとめて発注し、入庫で発注残を消し込む）
+# ---------------------------
+OPEN_ORDER_STATUSES = "('発注済', '入荷待ち')"
+
+
+def add_replenishment(cur):
+    # 自動発注の実行記録（1 回の実行で作った発注は orders.run_id で引ける）
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS replenish_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_at DATETIME NOT NULL,
+        orders INTEGER NOT NULL,
+        quantity INTEGER NOT NULL
+    )
+    """)
+    cur.execute("ALTER TABLE orders ADD COLUMN run_id INTEGER REFERENCES replenish_runs(run_id)")
+    # 入荷済みの数量。quantity に達したら status = '入荷済'
+    cur.execute("ALTER TABLE orders ADD COLUMN received_qty INTEGER NOT NULL DEFAULT 0")
+    # 入庫時に品目の発注残を古い順に消し込むための部分インデックス
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_orders_open
+        ON orders(item_id, order_date, order_id)
+        WHERE status IN {OPEN_ORDER_STATUSES}
+    """)
+    # inventory.ordered を発注残（未入荷分）の合計に揃える（これまで ordered は書き込まれていなかった）
+    cur.execute(f"""
+        UPDATE inventory
+        SET ordered = (
+            SELECT COALESCE(SUM(o.quantity - o.received_qty), 0) FROM orders AS o
+            WHERE o.item_id = inventory.item_id AND o.status IN {OPEN_ORDER_STATUSES}
+        )
+        WHERE COALESCE(ordered, 0) <> (
+            SELECT COALESCE(SUM(o.quantity - o.received_qty), 0) FROM orders AS o
+            WHERE o.item_id = inventory.item_id AND o.status IN {OPEN_ORDER_STATUSES}
+        )
+    """)
+
+
+# ---------------------------
+# 9. 日次の入出庫集計（/reports/movements 用）
+# ---------------------------
+# (元の表, 日時の列, 集計先の列)
+MOVEMENT_SOURCES = [
+    ("stockin", "date", "in_qty"),
+    ("stockout", "date", "out_qty"),
+    ("reservations", "reserved_date", "reserved_qty"),
+]
+
+
+def add_movement_daily(cur):
+    # 品目 × 日（UTC）ごとの入庫・出庫・予約数量。入出庫・予約の追加時にトリガーで加算する
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS movement_daily (
+        day DATE NOT NULL,
+        item_id INTEGER NOT NULL,
+        in_qty INTEGER NOT NULL DEFAULT 0,
+        out_qty INTEGER NOT NULL DEFAULT 0,
+        reserved_qty INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, item_id)
+    ) WITHOUT ROWID
+    """)
+    for table, column, target in MOVEMENT_SOURCES:
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_daily_insert
+        AFTER INSERT ON {table}
+        WHEN NEW.{column} IS NOT NULL
+        BEGIN
+            INSERT INTO movement_daily (day, item_id, {target}) VALUES (date(NEW.{column}), NEW.item_id, NEW.quantity)
+            ON CONFLICT (day, item_id) DO UPDATE SET {target} = {target} + excluded.{target};
+        END
+        """)
+    # 入出庫履歴の訂正（削除・更新）も反映する。予約の quantity は引当で減っていくので追加時の数量のみ集計する
+    for table, column, target in MOVEMENT_SOURCES[:2]:
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_daily_delete
+        AFTER DELETE ON {table}
+        WHEN OLD.{column} IS NOT NULL
+        BEGIN
+            UPDATE movement_daily SET {target} = {target} - OLD.quantity
+            WHERE day = date(OLD.{column}) AND item_id = OLD.item_id;
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_daily_update
+        AFTER UPDATE OF item_id, quantity, {column} ON {table}
+        BEGIN
+            UPDATE movement_daily SET {target} = {target} - OLD.quantity
+            WHERE day = date(OLD.{column}) AND item_id = OLD.item_id;
+            INSERT INTO movement_daily (day, item_id, {target})
+            SELECT date(NEW.{column}), NEW.item_id, NEW.quantity WHERE NEW.{column} IS NOT NULL
+            ON CONFLICT (day, item_id) DO UPDATE SET {target} = {target} + excluded.{target};
+        END
+        """)
+    rebuild_movement_daily(cur, reservations=True)
+
+
+def rebuild_movement_daily(cur, reservations=False, reserved_column="quantity"):
+    # 入出庫履歴から movement_daily を作り直す（過去分の一括投入後など）。
+    # 予約は引当で quantity が減り追加時の数量が残らないため、reservations=True のとき以外は既存の reserved_qty を残す。
+    # reserved_column は予約数量を読む列（15 以降は追加時の数量を持つ reserved_qty）
+    if reservations:
+        reserved = f"""
+            SELECT date(reserved_date), item_id, 0, 0, {reserved_column} FROM reservations WHERE reserved_date IS NOT NULL
+        """
+    else:
+        cur.execute("DROP TABLE IF EXISTS temp.movement_reserved")
+        cur.execute("""
+            CREATE TEMP TABLE movement_reserved AS
+            SELECT day, item_id, reserved_qty FROM movement_daily WHERE reserved_qty <> 0
+        """)
+        reserved = "SELECT day, item_id, 0, 0, reserved_qty FROM temp.movement_reserved"
+    # 全件入れ直すので索引は後から作る
+    cur.execute("DROP INDEX IF EXISTS idx_movement_daily_item")
+    cur.execute("DELETE FROM movement_daily")
+    cur.execute(f"""
+        INSERT INTO movement_daily (day, item_id, in_qty, out_qty, reserved_qty)
+        SELECT day, item_id, SUM(in_qty), SUM(out_qty), SUM(reserved_qty)
+        FROM (
+            SELECT date(date) AS day, item_id, quantity AS in_qty, 0 AS out_qty, 0 AS reserved_qty
+            FROM stockin WHERE date IS NOT NULL
+            UNION ALL
+            SELECT date(date), item_id, 0, quantity, 0 FROM stockout WHERE date IS NOT NULL
+            UNION ALL
+            {reserved}
+        )
+        GROUP BY day, item_id
+        HAVING SUM(in_qty) <> 0 OR SUM(out_qty) <> 0 OR SUM(reserved_qty) <> 0
+    """)
+    # 品目を指定した期間集計用
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_movement_daily_item
+        ON movement_daily(item_id, day, in_qty, out_qty, reserved_qty)
+    """)
+    cur.execute("DROP TABLE IF EXISTS temp.movement_reserved")
+
+# ---------------------------
+# 10. 品目の入出庫・予約履歴（/history 用）
+# ---------------------------
+def add_history_indexes(cur):
+    # 品目ごとに (日時, ID) 順で読める索引に応答の列を含め、表を引かずに 3 つの履歴を日時順にマージできるようにする。
+    # 入庫・出庫は (item_id, date) の索引を置き換える（先頭の列が同じなので既存の検索もこの索引で引ける）
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stockin_history
+        ON stockin(item_id, date, stockin_id, quantity, supplier_id, expiration_date)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stockout_history
+        ON stockout(item_id, date, stockout_id, quantity, usage)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reservations_history
+        ON reservations(item_id, reserved_date, reservation_id, quantity, status, expected_use_date, usage)
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_stockin_item_date")
+    cur.execute("DROP INDEX IF EXISTS idx_stockout_item_date")
+
+
+# ---------------------------
+# 11. API トークン（機械クライアント用）
+# ---------------------------
+def add_api_tokens(cur):
+    # トークンそのものは保存せず、HMAC-SHA256(TOKEN_HASH_KEY, token) だけを持つ。失効は revoked_at を入れる
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS api_tokens (
+        token_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        token_hash TEXT NOT NULL UNIQUE,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        revoked_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_api_tokens_user ON api_tokens(user_id)")
+
+    # トークン → ロールのプロセス内キャッシュを破棄すべき変更（失効・ロール変更・削除）の回数。
+    # 各プロセスはこの 1 行を一定間隔で読み、変わっていればキャッシュを捨てる
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS auth_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO auth_version (id, version) VALUES (1, 0)")
+    for name, event in (
+        ("trg_users_auth_update", "UPDATE OF username, role ON users"),
+        ("trg_users_auth_delete", "DELETE ON users"),
+        ("trg_api_tokens_revoke", "UPDATE OF revoked_at, user_id, token_hash ON api_tokens"),
+        ("trg_api_tokens_delete", "DELETE ON api_tokens"),
+    ):
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {name}
+        AFTER {event}
+        BEGIN
+            UPDATE auth_version SET version = version + 1 WHERE id = 1;
+        END
+        """)
+
+
+# ---------------------------
+# 12. 全文索引の語彙の版（/items/search の語彙キャッシュ用）
+# ---------------------------
+def add_items_fts_version(cur):
+    # items_fts の索引を変える変更（品目の追加・削除・改名）の回数。search.vocab_terms はこの 1 行が
+    # 変わったときだけ items_fts_vocab を読み直す。プロセス内キャッシュが別の DB の語彙を使わないよう、
+    # 初期値は DB ごとの乱数にする（まとめて 'rebuild' した場合は version を加算すること）
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS items_fts_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO items_fts_version (id, version) VALUES (1, abs(random() % 1000000000000))")
+    for name, event in (
+        ("trg_items_fts_version_insert", "INSERT ON items"),
+        ("trg_items_fts_version_delete", "DELETE ON items"),
+        ("trg_items_fts_version_update", "UPDATE OF item_name, category ON items"),
+    ):
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {name}
+        AFTER {event}
+        BEGIN
+            UPDATE items_fts_version SET version = version + 1 WHERE id = 1;
+        END
+        """)
+
+
+# ---------------------------
+# 13. 予約履歴の索引から書き換わる列を外す
+# ---------------------------
+def narrow_reservations_history_index(cur):
+    # 10 の idx_reservations_history は応答の列（quantity・status など）も含んでいたが、予約は入庫のたびに
+    # allocate_reservations が quantity・status を書き換えるため、割当の UPDATE ごとにこの索引も書き換わっていた。
+    # 索引は (item_id, reserved_date, reservation_id) までにして、/history は書き換わる列を表から読む
+    # （入庫・出庫はアプリからは追記のみなので応答の列を含めたまま）
+    cur.execute("DROP INDEX IF EXISTS idx_reservations_history")
+    cur.execute("""
+        CREATE INDEX idx_reservations_history
+        ON reservations(item_id, reserved_date, reservation_id)
+    """)
+
+
+# ---------------------------
+# 14. 予約数量の後から作った範囲（/reports/movements で reserved_qty が下限になる期間）
+# ---------------------------
+def add_movement_daily_backfill(cur):
+    # 9 の作り直しは予約の現在の quantity（引当で減った後）を数えていたため、それまでの日の reserved_qty は
+    # 追加時の数量の合計より小さいことがある。その範囲（reserved_until 以前）をレポートで示す。
+    # 9 を以前に適用済みの DB では作り直した時点が分からないので、現在ある予約の最後の日までを範囲とする
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS movement_daily_backfill (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        reserved_until DATE
+    )
+    """)
+    cur.execute("""
+        INSERT INTO movement_daily_backfill (id, reserved_until)
+        SELECT 1, date(MAX(reserved_date)) FROM reservations WHERE true
+        ON CONFLICT (id) DO UPDATE SET reserved_until = excluded.reserved_until
+    """)
+
+
+# ---------------------------
+# 15. 予約の追加時の数量（movement_daily の予約数量の元）
+# ---------------------------
+def add_reservations_reserved_qty(cur):
+    # quantity は引当で減っていく（消化済みは 0）ため、追加時の数量を変わらない列として持ち、
+    # movement_daily の予約数量はトリガー・作り直しともこの列から数える（14 の下限の範囲は不要になる）。
+    # 既存の予約は現在の quantity で埋める（15 より前に引当で減った予約は追加時の数量が分からない）。
+    # movement_daily はトリガーで加算済みの値をそのまま残す
+    cur.execute("ALTER TABLE reservations ADD COLUMN reserved_qty INTEGER")
+    cur.execute("UPDATE reservations SET reserved_qty = quantity")
+    # 列を指定せずに追加した予約は quantity で埋める
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_reserved_qty
+    AFTER INSERT ON reservations
+    WHEN NEW.reserved_qty IS NULL
+    BEGIN
+        UPDATE reservations SET reserved_qty = NEW.quantity WHERE reservation_id = NEW.reservation_id;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_reserved_qty_immutable
+    BEFORE UPDATE OF reserved_qty ON reservations
+    WHEN OLD.reserved_qty IS NOT NULL AND NEW.reserved_qty IS NOT OLD.reserved_qty
+    BEGIN
+        SELECT RAISE(ABORT, 'reservations.reserved_qty は変更できません');
+    END
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS trg_reservations_daily_insert")
+    cur.execute("""
+    CREATE TRIGGER trg_reservations_daily_insert
+    AFTER INSERT ON reservations
+    WHEN NEW.reserved_date IS NOT NULL
+    BEGIN
+        INSERT INTO movement_daily (day, item_id, reserved_qty)
+        VALUES (date(NEW.reserved_date), NEW.item_id, COALESCE(NEW.reserved_qty, NEW.quantity))
+        ON CONFLICT (day, item_id) DO UPDATE SET reserved_qty = reserved_qty + excluded.reserved_qty;
+    END
+    """)
+    cur.execute("DROP TABLE IF EXISTS movement_daily_backfill")
+
+
+MIGRATIONS = [
+    (1, "基本テーブル・初期ユーザー", create_tables),
+    (2, "ホットクエリ用インデックス・商品名 UNIQUE", add_hot_query_indexes),
+    (3, "在庫変更イベント（stock_events・トリガー）", add_stock_events),
+    (4, "在庫チェックポイント・入出庫の日付インデックス", add_stock_checkpoints),
+    (5, "ロット（FEFO）・期限切れ間近インデックス", add_lots),
+    (6, "発注点アラート（reorder_alerts・トリガー）", add_reorder_alerts),
+    (7, "品目の全文検索（items_fts・trigram）", add_items_fts),
+    (8, "自動発注（replenish_runs・発注の入荷数量）", add_replenishment),
+    (9, "日次の入出庫集計（movement_daily・トリガー）", add_movement_daily),
+    (10, "入出庫・予約履歴のカバリングインデックス", add_history_indexes),
+    (11, "API トークン（api_tokens・auth_version）", add_api_tokens),
+    (12, "全文索引の語彙の版（items_fts_version・トリガー）", add_items_fts_version),
+    (13, "予約履歴の索引を (item_id, reserved_date, reservation_id) に", narrow_reservations_history_index),
+    (14, "予約数量の後から作った範囲（movement_daily_backfill）", add_movement_daily_backfill),
+    (15, "予約の追加時の数量（reservations.reserved_qty）", add_reservations_reserved_qty),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    # 未適用のマイグレーションを順に 1 つずつトランザクションで適用する。適用したバージョンのリストを返す
+    applied = []
+    if current_version(conn) >= target:
+        return applied
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 他プロセスが先に適用した場合はスキップ
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def migrate_path(path, target=LATEST_VERSION):
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        return migrate(conn, target)
+    finally:
+        conn.close()
@@ -0,0 +1,67 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+
+import db
+from cache import ResponseCache
+from db import get_read_db
+
+# 発注が必要な在庫（/alerts/reorder）
+# quantity <= reorder_point の在庫行は reorder_alerts にトリガーで維持されている（入出庫・品目追加・発注点変更の
+# 対象行だけを出し入れする）ので、一覧は全在庫ではなくフラグの立っている k 行だけを読む。
+# 応答はデータバージョン単位でプロセス内にキャッシュする（/stock と同じ ResponseCache）
+#
+#   include_ordered=1 : 入荷待ち（ordered）を足しても発注点以下の行のみ（発注済みで足りる行を除く）
+#   category          : カテゴリー一致
+
+bp = Blueprint("reorder", __name__)
+
+# CROSS JOIN で reorder_alerts を外側に固定する（統計が少ないと inventory の全走査を選ぶことがある）
+REORDER_SQL = """
+    SELECT
+        inv.inventory_id,
+        inv.item_id,
+        it.item_name,
+        it.category,
+        it.unit,
+        inv.quantity,
+        COALESCE(inv.allocated,0) AS allocated,
+        COALESCE(inv.ordered,0) AS ordered,
+        it.reorder_point,
+        it.reorder_point - inv.quantity - CASE WHEN :include_ordered THEN COALESCE(inv.ordered,0) ELSE 0 END AS shortfall,
+        ra.flagged_at
+    FROM reorder_alerts AS ra
+    CROSS JOIN inventory AS inv ON inv.inventory_id = ra.inventory_id
+    JOIN items AS it ON it.item_id = inv.item_id
+    WHERE (NOT :include_ordered OR inv.quantity + COALESCE(inv.ordered,0) <= it.reorder_point)
+      AND (:category IS NULL OR it.category = :category)
+    ORDER BY shortfall DESC, inv.inventory_id
+"""
+
+
+def query_reorder(conn, include_ordered=False, category=None):
+    rows = conn.execute(REORDER_SQL, {"include_ordered": include_ordered, "category": category}).fetchall()
+    return [dict(row) for row in rows]
+
+
+@bp.route("/alerts/reorder", methods=["GET"])
+def reorder_alerts():
+    include_ordered = request.args.get("include_ordered") == "1"
+    category = request.args.get("category")
+
+    version = db.data_version()
+    key = request.query_string
+    reorder_cache = current_app.extensions["reorder_cache"]
+    entry = reorder_cache.get(key, version)
+    if entry is None:
+        items = query_reorder(get_read_db(), include_ordered, category)
+        body = jsonify({"include_ordered": include_ordered, "count": len(items), "items": items}).get_data()
+        entry = reorder_cache.put(key, version, body)
+
+    body, etag = entry
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
+def init_app(app):
+    app.extensions["reorder_cache"] = ResponseCache()
+    app.register_blueprint(bp)
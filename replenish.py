@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+
+import click
+from flask import current_app
+
+import migrations
+from db import connect
+from metrics import log
+
+# 自動発注
+# 発注点を下回った在庫（quantity + ordered <= reorder_point）を reorder_alerts からまとめて選び、
+# 1 トランザクションで orders に発注を追加して inventory.ordered を増やす。
+# 発注数量は「発注点 × REPLENISH_FACTOR（切り上げ）」まで quantity + ordered を戻す分。
+# 仕入先は品目の直近の入庫の仕入先（入庫履歴がなければ 1。receive() の既定と同じ）。
+# 発注を作った後は quantity + ordered が発注点を上回るので、同じ品目を続けて発注し直すことはない
+#
+#   - flask stock-replenish で即時実行
+#   - REPLENISH_THREAD=1 で各プロセスがバックグラウンドで REPLENISH_INTERVAL 秒ごとに実行する
+#     （実行記録 replenish_runs を書き込みロック中に確認するので、複数プロセスでも間隔内に 1 回だけ）
+#
+# 入庫（receive_orders）は同じ品目の発注残を古い順（入庫の仕入先の発注を優先）に消し込み、
+# orders.received_qty と inventory.ordered に反映する
+
+ORDERED_STATUS = "発注済"
+RECEIVED_STATUS = "入荷済"
+DEFAULT_SUPPLIER = 1
+
+# target は発注点 × factor の切り上げ（正の数では -CAST(-x AS INTEGER) = ceil(x)）
+CANDIDATES_SQL = """
+    SELECT inventory_id, item_id, supplier_id, target - position AS quantity
+    FROM (
+        SELECT
+            inv.inventory_id,
+            inv.item_id,
+            inv.quantity + COALESCE(inv.ordered,0) AS position,
+            -CAST(-(it.reorder_point * :factor) AS INTEGER) AS target,
+            COALESCE((
+                SELECT si.supplier_id FROM stockin AS si
+                WHERE si.item_id = inv.item_id
+                ORDER BY si.date DESC, si.stockin_id DESC
+                LIMIT 1
+            ), :default_supplier) AS supplier_id
+        FROM reorder_alerts AS ra
+        CROSS JOIN inventory AS inv ON inv.inventory_id = ra.inventory_id
+        JOIN items AS it ON it.item_id = inv.item_id
+        WHERE inv.quantity + COALESCE(inv.ordered,0) <= it.reorder_point
+    )
+    WHERE target > position
+    ORDER BY supplier_id, item_id
+"""
+
+
+def replenish_due(conn, interval):
+    row = conn.execute("""
+        SELECT COALESCE(MAX(run_at), '') <= datetime('now', ?) FROM replenish_runs
+    """, (f"-{int(interval)} seconds",)).fetchone()
+    return bool(row[0])
+
+
+def replenish(conn, factor=2.0, interval=None):
+    # 発注を作成して実行結果を返す。interval を指定すると前回から interval 秒経っている場合のみ実行する（それ以外は None）
+    if interval is not None and not replenish_due(conn, interval):
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if interval is not None and not replenish_due(conn, interval):
+            conn.execute("ROLLBACK")
+            return None
+        cur = conn.cursor()
+        cur.execute(CANDIDATES_SQL, {"factor": factor, "default_supplier": DEFAULT_SUPPLIER})
+        lines = cur.fetchall()
+        cur.execute("""
+            INSERT INTO replenish_runs (run_at, orders, quantity) VALUES (datetime('now'), ?, ?)
+            RETURNING run_id, run_at
+        """, (len(lines), sum(line[3] for line in lines)))
+        run_id, run_at = cur.fetchone()
+        cur.executemany("""
+            INSERT INTO orders (item_id, supplier_id, quantity, order_date, status, run_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(item_id, supplier_id, qty, run_at, ORDERED_STATUS, run_id)
+              for _, item_id, supplier_id, qty in lines])
+        cur.executemany("""
+            UPDATE inventory
+            SET ordered = COALESCE(ordered,0) + ?, last_update = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE inventory_id = ?
+        """, [(qty, inventory_id) for inventory_id, _, _, qty in lines])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    suppliers = {}
+    for _, _, supplier_id, qty in lines:
+        summary = suppliers.setdefault(supplier_id, {"supplier_id": supplier_id, "orders": 0, "quantity": 0})
+        summary["orders"] += 1
+        summary["quantity"] += qty
+    return {
+        "run_id": run_id,
+        "run_at": run_at,
+        "orders": len(lines),
+        "quantity": sum(summary["quantity"] for summary in suppliers.values()),
+        "suppliers": list(suppliers.values()),
+    }
+
+
+def receive_orders(cur, inventory_id, item_id, qty, supplier_id=None):
+    # 入庫 qty で品目の発注残を消し込み、消し込んだ数量を返す（入庫と同じトランザクションで呼ぶ）
+    if qty <= 0:
+        return 0
+    cur.execute(f"""
+        SELECT order_id, quantity - received_qty AS open_qty
+        FROM orders
+        WHERE item_id = ? AND status IN {migrations.OPEN_ORDER_STATUSES}
+        ORDER BY supplier_id IS NOT ?, order_date, order_id
+    """, (item_id, supplier_id))
+    updates = []
+    left = qty
+    for order_id, open_qty in cur.fetchall():
+        take = min(open_qty, left)
+        updates.append((take, take, order_id))
+        left -= take
+        if left <= 0:
+            break
+    if not updates:
+        return 0
+    cur.executemany(f"""
+        UPDATE orders
+        SET received_qty = received_qty + ?,
+            status = CASE WHEN received_qty + ? >= quantity THEN '{RECEIVED_STATUS}' ELSE status END
+        WHERE order_id = ?
+    """, updates)
+    received = qty - max(left, 0)
+    cur.execute("""
+        UPDATE inventory SET ordered = MAX(COALESCE(ordered,0) - ?, 0) WHERE inventory_id = ?
+    """, (received, inventory_id))
+    return received
+
+
+# --- バックグラウンド実行 ---
+_thread_lock = threading.Lock()
+
+
+def run_replenisher(path, interval, poll, factor):
+    conn = connect(path)
+    while True:
+        try:
+            result = replenish(conn, factor, interval)
+            if result:
+                log.info("replenish run %s: %s orders, %s units", result["run_id"], result["orders"], result["quantity"])
+        except Exception:
+            log.exception("自動発注に失敗しました")
+        time.sleep(poll)
+
+
+def ensure_replenisher():
+    # 最初のリクエストで（fork 後のワーカーごとに）スレッドを起動する
+    app = current_app._get_current_object()
+    if app.extensions.get("replenisher_pid") == os.getpid():
+        return
+    with _thread_lock:
+        if app.extensions.get("replenisher_pid") == os.getpid():
+            return
+        interval = app.config["REPLENISH_INTERVAL"]
+        thread = threading.Thread(
+            target=run_replenisher,
+            args=(app.config["DB_PATH"], interval, min(interval, app.config["REPLENISH_POLL"]),
+                  app.config["REPLENISH_FACTOR"]),
+            name="stock-replenisher",
+            daemon=True,
+        )
+        thread.start()
+        app.extensions["replenisher_pid"] = os.getpid()
+
+
+# flask --app app stock-replenish [--factor 2.0]
+@click.command("stock-replenish")
+@click.option("--factor", type=float, default=None, help="発注点の何倍まで補充するか。既定は REPLENISH_FACTOR")
+def replenish_command(factor):
+    factor = factor or current_app.config["REPLENISH_FACTOR"]
+    if factor < 1:
+        raise click.BadParameter("factor は 1 以上で指定してください")
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = connect(path)
+    try:
+        started = time.perf_counter()
+        result = replenish(conn, factor)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    for summary in result["suppliers"]:
+        click.echo(f"supplier {summary['supplier_id']}: {summary['orders']} 件 {summary['quantity']}")
+    click.echo(f"run {result['run_id']}: {result['orders']} 件の発注を作成しました（{elapsed:.2f} 秒）")
+
+
+def init_app(app):
+    app.config.setdefault("REPLENISH_INTERVAL", int(os.environ.get("INVENTORY_REPLENISH_INTERVAL", 3600)))
+    app.config.setdefault("REPLENISH_POLL", float(os.environ.get("INVENTORY_REPLENISH_POLL", 60)))
+    app.config.setdefault("REPLENISH_FACTOR", float(os.environ.get("INVENTORY_REPLENISH_FACTOR", 2.0)))
+    app.config.setdefault("REPLENISH_THREAD", os.environ.get("INVENTORY_REPLENISH_THREAD", "0") == "1")
+    if app.config["REPLENISH_THREAD"]:
+        app.before_request(ensure_replenisher)
+    app.cli.add_command(replenish_command)
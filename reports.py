@@ -0,0 +1,158 @@
+from datetime import date, datetime, timedelta, timezone
+
+import click
+from flask import Blueprint, Response, current_app, jsonify, request
+
+import db
+import migrations
+from cache import ResponseCache
+from db import connect, get_read_db
+
+# 入出庫の集計レポート（/reports/movements）
+# 品目 × 日の集計表 movement_daily（入出庫・予約の追加時にトリガーで加算）から読むので、
+# 期間の集計で読む行数は「日数 × その日に動いた品目数」で、入出庫の件数によらない。
+# 応答はデータバージョン単位でプロセス内にキャッシュする（/alerts/reorder と同じ）
+#
+#   group=day      : 日ごと
+#   group=month    : 月ごと
+#   group=category : カテゴリーごと
+#   group=item     : 品目ごと（item_id 順、limit / cursor でページング）
+#   item_id / category で対象を絞り込める。日付は UTC
+
+bp = Blueprint("reports", __name__)
+
+REPORT_PAGE_MAX = 5000
+DEFAULT_DAYS = 30
+
+# group= ごとの (GROUP BY のキー, 列)
+GROUPS = {
+    "day": ("md.day", "md.day AS day"),
+    "month": ("substr(md.day, 1, 7)", "substr(md.day, 1, 7) AS month"),
+    # 品目ごとに合計してから結合する（集計表の行ごとに items を引かない）
+    "category": ("it.category", "it.category"),
+    # items を item_id 順に読み、品目ごとに索引（item_id, day）の期間だけを読む（LIMIT で打ち切れる）
+    "item": ("it.item_id", "it.item_id, it.item_name, it.category, it.unit"),
+}
+
+
+def parse_day(value, name):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} は YYYY-MM-DD で指定してください")
+
+
+def query_movements(conn, day_from, day_to, group, item_id=None, category=None, cursor=0, limit=1000):
+    key, columns = GROUPS[group]
+    where = ["md.day BETWEEN :day_from AND :day_to"]
+    if item_id is not None:
+        where.append("md.item_id = :item_id")
+    source = "movement_daily AS md"
+    if group == "category":
+        source = f"""
+            (SELECT md.item_id, SUM(md.in_qty) AS in_qty, SUM(md.out_qty) AS out_qty,
+                    SUM(md.reserved_qty) AS reserved_qty
+             FROM movement_daily AS md
+             WHERE {' AND '.join(where)}
+             GROUP BY md.item_id) AS md
+        """
+        where = []
+    # 品目の列を使わない集計では items を結合しない
+    if group in ("category", "item") or category is not None:
+        source += " JOIN items AS it ON it.item_id = md.item_id"
+    if category is not None:
+        where.append("it.category = :category")
+    if group == "item":
+        where.append("it.item_id > :cursor")
+    rows = conn.execute(f"""
+        SELECT {columns},
+               SUM(md.in_qty) AS in_qty,
+               SUM(md.out_qty) AS out_qty,
+               SUM(md.reserved_qty) AS reserved_qty
+        FROM {source}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY {key}
+        ORDER BY {key}
+        {"LIMIT :limit" if group == "item" else ""}
+    """, {
+        "day_from": day_from,
+        "day_to": day_to,
+        "item_id": item_id,
+        "category": category,
+        "cursor": cursor,
+        "limit": limit + 1,
+    }).fetchall()
+    rows = [dict(row) for row in rows]
+
+    next_cursor = None
+    if group == "item" and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["item_id"]
+    return {"from": day_from, "to": day_to, "group": group, "rows": rows, "next_cursor": next_cursor}
+
+
+# GET /reports/movements?from=2026-09-01&to=2026-09-30&group=day|month|category|item
+#                        [&item_id=N][&category=...][&limit=1000&cursor=<item_id>]
+# from / to は両端を含む（既定は今日までの 30 日間）
+@bp.route("/reports/movements", methods=["GET"])
+def movements_report():
+    try:
+        today = datetime.now(timezone.utc).date()
+        day_to = parse_day(request.args.get("to", today.isoformat()), "to")
+        day_from = parse_day(request.args.get(
+            "from", (date.fromisoformat(day_to) - timedelta(days=DEFAULT_DAYS - 1)).isoformat()), "from")
+        if day_from > day_to:
+            raise ValueError("from は to 以前の日付で指定してください")
+        group = request.args.get("group", "day")
+        if group not in GROUPS:
+            raise ValueError(f"group は {', '.join(GROUPS)} のいずれかで指定してください")
+        limit = request.args.get("limit", 1000, type=int)
+        if not 1 <= limit <= REPORT_PAGE_MAX:
+            raise ValueError(f"limit は 1〜{REPORT_PAGE_MAX} で指定してください")
+        cursor = request.args.get("cursor", 0, type=int)
+        item_id = request.args.get("item_id", type=int)
+        category = request.args.get("category")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    version = db.data_version()
+    key = (request.query_string, day_to)
+    reports_cache = current_app.extensions["reports_cache"]
+    entry = reports_cache.get(key, version)
+    if entry is None:
+        report = query_movements(get_read_db(), day_from, day_to, group, item_id, category, cursor, limit)
+        entry = reports_cache.put(key, version, jsonify(report).get_data())
+
+    body, etag = entry
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+
+# flask --app app movement-rebuild [--reservations]
+@click.command("movement-rebuild")
+@click.option("--reservations", is_flag=True,
+              help="予約数量も予約の追加時の数量（reservations.reserved_qty）から作り直す"
+                   "（マイグレーション 15 より前に引当で減った予約は減った後の数量）")
+def rebuild_command(reservations):
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migrations.rebuild_movement_daily(conn.cursor(), reservations, reserved_column="reserved_qty")
+            count = conn.execute("SELECT COUNT(*) FROM movement_daily").fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    click.echo(f"movement_daily を {count} 行で作り直しました")
+
+
+def init_app(app):
+    app.extensions["reports_cache"] = ResponseCache()
+    app.register_blueprint(bp)
+    app.cli.add_command(rebuild_command)
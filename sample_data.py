@@ -1,20 +1,39 @@
+import argparse
+import bisect
+import itertools
+import os
+import random
 import sqlite3
+import time
 from datetime import datetime, timedelta
-import random
 
-DB_PATH = "inventory.db"
-print("RUNNING sample_data.py")
-print("DB path:", DB_PATH)
+from migrations import STOCK_EVENTS_RETENTION, migrate_path, rebuild_lots, rebuild_movement_daily, rebuild_reorder_alerts
 
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
+# サンプルデータ生成（件数・乱数シード指定可。同じ引数なら同じデータを生成する）
+#
+#   python sample_data.py                                   # 小規模（既定）
+#   python sample_data.py --items 100000 --movements 10000000 --reservations 500000 --seed 1 --db big.db
+#
+# ベンチマークからは generate(path, items=..., movements=...) を直接呼び出す
+#
+# 分布
+#   - 品目の人気度は Zipf 分布（少数のホット SKU に入出庫・予約が集中し、大半はロングテール）
+#   - 入出庫は期間内に時系列順で発生（入庫はロット単位でまとまった数量、出庫は少量）
+#   - 予約残（status='reserved'）は直近の期間に集中
+#
+# 高速化
+#   - 空の DB にのみ投入する（items が空であることを確認）
+#   - 投入中は journal_mode=OFF / synchronous=OFF、完了後に WAL へ戻す
+#   - セカンダリインデックスは投入前に削除し、投入後にまとめて再作成する
+#   - トリガーも投入前に削除し、トリガーで維持する表（movement_daily・items_fts・reorder_alerts・stock_events）は
+#     投入後にまとめて作る（1 行ごとの upsert・索引更新をしない）
+#   - 行はジェネレーターで生成し、CHUNK 行ずつ executemany で投入する
 
-print("=== サンプルデータ挿入開始 ===")
+DB_PATH = os.environ.get("INVENTORY_DB_PATH", os.path.join(os.path.dirname(__file__), "inventory.db"))
 
-# ---------------------------
-# items サンプル
-# ---------------------------
-items = [
+CHUNK = 50000
+
+BASE_ITEMS = [
     ("コーヒー豆", "ブラジル産", "袋", 10, 1200.0),
     ("紅茶", "ダージリン", "箱", 5, 800.0),
     ("ミルク", "低脂肪", "本", 20, 200.0),
@@ -27,15 +46,7 @@ items = [
     ("ミネラルウォーター", "500ml", "本", 30, 120.0),
 ]
 
-cur.executemany("""
-INSERT INTO items (item_name, category, unit, reorder_point, standard_price)
-VALUES (?, ?, ?, ?, ?)
-""", items)
-
-# ---------------------------
-# suppliers サンプル
-# ---------------------------
-suppliers = [
+BASE_SUPPLIERS = [
     ("サプライA", "田中太郎", "tanaka@example.com", "東京都港区1-1-1"),
     ("サプライB", "鈴木次郎", "suzuki@example.com", "東京都渋谷区2-2-2"),
     ("サプライC", "佐藤三郎", "sato@example.com", "東京都新宿区3-3-3"),
@@ -48,77 +59,343 @@ suppliers = [
     ("サプライJ", "加藤十郎", "kato@example.com", "東京都目黒区10-10-10"),
 ]
 
-cur.executemany("""
-INSERT INTO suppliers (supplier_name, contact, email, address)
-VALUES (?, ?, ?, ?)
-""", suppliers)
+CATEGORIES = ["コーヒー", "紅茶", "乳製品", "製菓材料", "消耗品", "食品", "飲料", "器具"]
+UNITS = ["袋", "箱", "本", "個", "kg", "L"]
+USAGES = ["販売", "試食", "廃棄"]
+USAGE_WEIGHTS = [90, 7, 3]
+USAGE_TOTAL = sum(USAGE_WEIGHTS)
+ORDER_STATUSES = ["発注済", "入荷待ち", "キャンセル"]
+OPEN_ORDER_STATUSES = {"発注済", "入荷待ち"}
+LOT_SIZES = [10, 20, 24, 50, 100]
 
-# ---------------------------
-# inventory サンプル
-# ---------------------------
-inventory = []
-for item_id in range(1, 11):
-    quantity = random.randint(5, 50)
-    expiration_date = datetime.now() + timedelta(days=random.randint(30, 180))
-    inventory.append((item_id, quantity, expiration_date.strftime("%Y-%m-%d")))
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-cur.executemany("""
-INSERT INTO inventory (item_id, quantity, expiration_date)
-VALUES (?, ?, ?)
-""", inventory)
 
-# ---------------------------
-# stockin サンプル
-# ---------------------------
-stockin = []
-for i in range(1, 11):
-    item_id = i
-    supplier_id = random.randint(1, 10)
-    quantity = random.randint(5, 30)
-    expiration_date = datetime.now() + timedelta(days=random.randint(30, 180))
-    stockin.append((item_id, supplier_id, quantity, expiration_date.strftime("%Y-%m-%d")))
-
-cur.executemany("""
-INSERT INTO stockin (item_id, supplier_id, quantity, expiration_date)
-VALUES (?, ?, ?, ?)
-""", stockin)
+def chunked(rows, size=CHUNK):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_rows(conn, sql, rows, progress=None):
+    total = 0
+    for chunk in chunked(rows):
+        conn.executemany(sql, chunk)
+        conn.commit()
+        total += len(chunk)
+        if progress:
+            progress(total)
+    return total
+
+
+def zipf_cum_weights(rnd, n, skew):
+    # 人気順位 1 位の品目をランダムに選び、順位 r の重みを 1 / r^skew とする
+    ranks = list(range(1, n + 1))
+    rnd.shuffle(ranks)
+    return list(itertools.accumulate(1.0 / r ** skew for r in ranks))
+
+
+class ItemPicker:
+    # random.choices と同じ累積重み + 二分探索（1 件ずつ引くのでジェネレーターから呼べる）
+    def __init__(self, rnd, cum_weights):
+        self.rnd = rnd
+        self.cum_weights = cum_weights
+        self.total = cum_weights[-1]
+        self.hi = len(cum_weights) - 1
+
+    def __call__(self):
+        return bisect.bisect(self.cum_weights, self.rnd.random() * self.total, 0, self.hi) + 1
 
-# ---------------------------
-# stockout サンプル
-# ---------------------------
-stockout = []
-usage_options = ["販売", "試食", "廃棄"]
-for i in range(1, 11):
-    item_id = i
-    quantity = random.randint(1, 10)
-    usage = random.choice(usage_options)
-    stockout.append((item_id, quantity, usage))
-
-cur.executemany("""
-INSERT INTO stockout (item_id, quantity, usage)
-VALUES (?, ?, ?)
-""", stockout)
 
 # ---------------------------
-# orders サンプル
+# 行ジェネレーター
 # ---------------------------
-orders = []
-status_options = ["発注済", "入荷待ち", "キャンセル"]
-for i in range(1, 11):
-    item_id = i
-    supplier_id = random.randint(1, 10)
-    quantity = random.randint(5, 20)
-    status = random.choice(status_options)
-    orders.append((item_id, supplier_id, quantity, status))
-
-cur.executemany("""
-INSERT INTO orders (item_id, supplier_id, quantity, status)
-VALUES (?, ?, ?, ?)
-""", orders)
+def item_rows(rnd, count):
+    for i in range(count):
+        if i < len(BASE_ITEMS):
+            yield BASE_ITEMS[i]
+            continue
+        category = CATEGORIES[i % len(CATEGORIES)]
+        yield (
+            f"{category}-{i:07d}",
+            category,
+            rnd.choice(UNITS),
+            rnd.randint(5, 50),
+            round(rnd.uniform(50, 5000), -1),
+        )
+
+
+def supplier_rows(count):
+    for i in range(count):
+        if i < len(BASE_SUPPLIERS):
+            yield BASE_SUPPLIERS[i]
+        else:
+            yield (f"サプライ{i + 1:05d}", f"担当{i + 1:05d}", f"supplier{i + 1}@example.com", None)
+
+
+class Clock:
+    # start からの経過秒を日時文字列にする。strftime は分・日が変わったときだけ呼ぶ（時系列順の生成向け）
+    def __init__(self, start):
+        self.start = start
+        self.minute = None
+        self.prefix = None
+        self.days = {}
+
+    def at(self, seconds):
+        minute, second = divmod(int(seconds), 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.prefix = (self.start + timedelta(minutes=minute)).strftime("%Y-%m-%d %H:%M:")
+        return f"{self.prefix}{second:02d}"
+
+    def date(self, seconds, plus_days=0):
+        day = int(seconds // 86400) + plus_days
+        text = self.days.get(day)
+        if text is None:
+            text = self.days[day] = (self.start + timedelta(days=day)).strftime("%Y-%m-%d")
+        return text
+
+
+def movement_rows(rnd, pick, count, clock, span, suppliers, totals_in, totals_out):
+    # 入出庫を時系列順に生成する（品目ごとの入庫・出庫合計も集計する）
+    random = rnd.random
+    step = span / max(count, 1)
+    lots = len(LOT_SIZES)
+    for n in range(count):
+        item_id = pick()
+        seconds = (n + random()) * step
+        date = clock.at(seconds)
+        if random() < 0.25:
+            qty = LOT_SIZES[int(random() * lots)] * (1 + int(random() * 3))
+            totals_in[item_id] += qty
+            expiration = clock.date(seconds, 30 + int(random() * 151))
+            yield "in", (item_id, 1 + int(random() * suppliers), qty, date, expiration)
+        else:
+            qty = min(1 + int(rnd.expovariate(0.35)), 50)
+            totals_out[item_id] += qty
+            r = random() * USAGE_TOTAL
+            usage = USAGES[0] if r < USAGE_WEIGHTS[0] else USAGES[1] if r < USAGE_WEIGHTS[0] + USAGE_WEIGHTS[1] else USAGES[2]
+            yield "out", (item_id, qty, date, usage)
+
+
+def reservation_rows(rnd, pick, count, end, backlog):
+    # 予約残は直近 30 日に集中させる（reserved_date 順に生成）
+    span = 30 * 86400
+    clock = Clock(end - timedelta(seconds=span))
+    step = span / max(count, 1)
+    for n in range(count):
+        item_id = pick()
+        qty = rnd.randint(1, 10)
+        seconds = (n + rnd.random()) * step
+        backlog[item_id] += qty
+        yield (item_id, qty, qty, clock.at(seconds), clock.date(seconds, rnd.randint(1, 14)), "販売予約", "reserved")
+
+
+def order_rows(rnd, pick, count, end, suppliers, ordered):
+    for n in range(count):
+        item_id = pick()
+        qty = rnd.choice(LOT_SIZES) * rnd.randint(1, 5)
+        status = rnd.choice(ORDER_STATUSES)
+        if status in OPEN_ORDER_STATUSES:
+            ordered[item_id] += qty
+        at = end - timedelta(days=rnd.uniform(0, 60))
+        yield (item_id, rnd.randint(1, suppliers), qty, at.strftime(DATE_FORMAT), status)
+
 
 # ---------------------------
-# 保存・終了
+# 投入
 # ---------------------------
-conn.commit()
-conn.close()
-print("サンプルデータ挿入完了")
+def generate(path=DB_PATH, items=10, suppliers=10, movements=20, reservations=10, orders=10,
+             days=365, skew=1.1, seed=0, end=None, verbose=False):
+    def log(message):
+        if verbose:
+            print(message, flush=True)
+
+    def progress(label):
+        started = time.perf_counter()
+
+        def report(total):
+            elapsed = time.perf_counter() - started
+            log(f"  {label}: {total:,} 行 ({total / max(elapsed, 1e-9):,.0f} 行/秒)")
+        return report
+
+    if items < 1 or suppliers < 1:
+        raise ValueError("items / suppliers は 1 以上を指定してください")
+
+    rnd = random.Random(seed)
+    if end is None:
+        end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+
+    migrate_path(path)
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    try:
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM items)").fetchone()[0]:
+            raise ValueError(f"{path} には既に品目があります。空の DB を指定してください")
+
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")    # 約256MB
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+        # セカンダリインデックスは投入後にまとめて作る。トリガーも止め、派生する表は投入後にまとめて作る
+        indexes = conn.execute("""
+            SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL
+        """).fetchall()
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX "{name}"')
+        for name, _ in triggers:
+            conn.execute(f'DROP TRIGGER "{name}"')
+        conn.commit()
+
+        try:
+            log("items / suppliers")
+            insert_rows(conn, """
+                INSERT INTO items (item_name, category, unit, reorder_point, standard_price)
+                VALUES (?, ?, ?, ?, ?)
+            """, item_rows(rnd, items), progress("items"))
+            insert_rows(conn, """
+                INSERT INTO suppliers (supplier_name, contact, email, address)
+                VALUES (?, ?, ?, ?)
+            """, supplier_rows(suppliers), progress("suppliers"))
+
+            pick = ItemPicker(rnd, zipf_cum_weights(rnd, items, skew))
+            totals_in = [0] * (items + 1)
+            totals_out = [0] * (items + 1)
+            backlog = [0] * (items + 1)
+            ordered = [0] * (items + 1)
+
+            # 入出庫（1 つのジェネレーターから stockin / stockout に振り分けて時系列を保つ）
+            log("stockin / stockout")
+            report = progress("movements")
+            done = 0
+            for chunk in chunked(movement_rows(rnd, pick, movements, Clock(start), days * 86400,
+                                               suppliers, totals_in, totals_out)):
+                ins = [row for k, row in chunk if k == "in"]
+                outs = [row for k, row in chunk if k == "out"]
+                conn.executemany("""
+                    INSERT INTO stockin (item_id, supplier_id, quantity, date, expiration_date)
+                    VALUES (?, ?, ?, ?, ?)
+                """, ins)
+                conn.executemany("""
+                    INSERT INTO stockout (item_id, quantity, date, usage)
+                    VALUES (?, ?, ?, ?)
+                """, outs)
+                conn.commit()
+                done += len(chunk)
+                report(done)
+
+            log("reservations / orders")
+            insert_rows(conn, """
+                INSERT INTO reservations (item_id, quantity, reserved_qty, reserved_date, expected_use_date, usage, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, reservation_rows(rnd, pick, reservations, end, backlog), progress("reservations"))
+            insert_rows(conn, """
+                INSERT INTO orders (item_id, supplier_id, quantity, order_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            """, order_rows(rnd, pick, orders, end, suppliers, ordered), progress("orders"))
+
+            # 出庫が入庫を上回る品目は期首在庫（期間開始時点の入庫）で補い、在庫が入出庫履歴と一致するようにする
+            opening_date = start.strftime(DATE_FORMAT)
+            opening_expiration = (start + timedelta(days=180)).strftime("%Y-%m-%d")
+            openings = []
+            for item_id in range(1, items + 1):
+                safety = rnd.randint(0, 30)
+                need = totals_out[item_id] - totals_in[item_id] + safety
+                if need > 0:
+                    totals_in[item_id] += need
+                    openings.append((item_id, 1, need, opening_date, opening_expiration))
+            insert_rows(conn, """
+                INSERT INTO stockin (item_id, supplier_id, quantity, date, expiration_date)
+                VALUES (?, ?, ?, ?, ?)
+            """, openings)
+
+            log("inventory")
+
+            def inventory_rows():
+                last_update = end.strftime(DATE_FORMAT)
+                for item_id in range(1, items + 1):
+                    quantity = totals_in[item_id] - totals_out[item_id]
+                    expiration = (end + timedelta(days=rnd.randint(30, 180))).strftime("%Y-%m-%d")
+                    yield (item_id, quantity, ordered[item_id], min(quantity, backlog[item_id]), last_update, expiration)
+
+            insert_rows(conn, """
+                INSERT INTO inventory (item_id, quantity, ordered, allocated, last_update, expiration_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, inventory_rows(), progress("inventory"))
+
+        finally:
+            # 途中で失敗してもインデックス・トリガーは必ず戻す
+            log("インデックス・トリガー再作成 / ANALYZE")
+            for _, sql in indexes + triggers:
+                conn.execute(sql)
+        # トリガーで維持する表をまとめて作る
+        log("movement_daily / items_fts / reorder_alerts / stock_events")
+        cur = conn.cursor()
+        rebuild_movement_daily(cur, reservations=True, reserved_column="reserved_qty")
+        cur.execute("INSERT INTO items_fts (items_fts) VALUES ('rebuild')")
+        cur.execute("UPDATE items_fts_version SET version = version + 1 WHERE id = 1")
+        rebuild_reorder_alerts(cur)
+        # 在庫行の追加イベント（直近 STOCK_EVENTS_RETENTION 件）
+        cur.execute("""
+            INSERT INTO stock_events (inventory_id, kind, quantity, allocated, ordered)
+            SELECT inventory_id, 'insert', quantity, COALESCE(allocated,0), COALESCE(ordered,0)
+            FROM inventory WHERE inventory_id > (SELECT MAX(inventory_id) FROM inventory) - ?
+            ORDER BY inventory_id
+        """, (STOCK_EVENTS_RETENTION,))
+        # ロットは在庫数量と入庫履歴から復元する（期限の遅い入庫が残っている状態）
+        log("lots")
+        rebuild_lots(cur)
+        conn.execute("ANALYZE")
+        conn.commit()
+        lots = conn.execute("SELECT COUNT(*) FROM lots").fetchone()[0]
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    log(f"完了: {elapsed:.1f} 秒")
+    return {
+        "items": items,
+        "suppliers": suppliers,
+        "movements": movements,
+        "opening_stockin": len(openings),
+        "lots": lots,
+        "reservations": reservations,
+        "orders": orders,
+        "seconds": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="サンプルデータ生成")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--suppliers", type=int, default=10)
+    parser.add_argument("--movements", type=int, default=20, help="入出庫履歴の件数（約 25%% が入庫）")
+    parser.add_argument("--reservations", type=int, default=10, help="予約残の件数")
+    parser.add_argument("--orders", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365, help="入出庫履歴の期間（日）")
+    parser.add_argument("--skew", type=float, default=1.1, help="品目人気度の Zipf 指数（大きいほどホット SKU に集中）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        help="期間の終了日 YYYY-MM-DD（既定は今日。同じ seed / end なら同じデータになる）")
+    args = parser.parse_args()
+
+    print("DB path:", args.db)
+    try:
+        counts = generate(args.db, items=args.items, suppliers=args.suppliers, movements=args.movements,
+                          reservations=args.reservations, orders=args.orders, days=args.days,
+                          skew=args.skew, seed=args.seed, end=args.end, verbose=True)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import threading
+
+from flask import Blueprint, jsonify, request
+
+from db import get_read_db
+
+# 品目検索（/items/search?q=）
+# 商品名・カテゴリーの trigram 全文索引（items_fts）で部分一致を引き、現在の在庫と合わせて返す。
+#
+# 並び順
+#   1. 商品名が q で始まる品目（idx_items_name の範囲検索）
+#   2. 全文索引の一致を rank（bm25、商品名を重視）順
+# bm25 の計算は一致 1 件ごとに docsize を引く（数 µs/件）ため、順位を付けるのは新しい順（rowid の降順）に
+# RANK_CANDIDATES 件までの一致に限り、その rank 順の上位 RANK_WINDOW 件を items・inventory と結合する。
+# 一致がそれ以下なら全件の順位、「コーヒー」のように大量に一致する語は直近に追加した RANK_CANDIDATES 件の中での
+# 順位になる。rank が同じなら新しい品目を先にする。短い語を含む検索は順位を付けず新しい順に返す（trigram の OR
+# への展開は bm25 の計算が展開した語の数に比例し、LIKE の絞り込みは一致ごとに items を読むため）
+#
+# trigram は 3 文字未満の語を直接引けないため、索引中の trigram（items_fts_vocab）のうちその語を含むものの
+# OR に展開する（3 文字以上の文字列が語を含むなら、語を含む trigram を必ず持つ）。展開が多すぎる語（1 文字など）は
+# LIKE の部分一致で絞り込む。3 文字未満の商品名・カテゴリーは trigram を持たないので前方一致でのみ見つかる
+
+bp = Blueprint("search", __name__)
+
+SEARCH_LIMIT_MAX = 50
+RANK_WINDOW = 200  # items・inventory と結合する rank 上位の件数（前方一致と重複しても limit（最大 50）件揃う程度）
+RANK_CANDIDATES = 500  # 順位を付ける一致の上限（bm25 の計算が数 ms に収まる件数）
+PREFIX_CANDIDATES = 1000  # 他の語で絞り込む前方一致の上限
+MIN_TRIGRAM = 3
+EXPAND_MAX = 200
+
+RESULT_COLUMNS = """
+    it.item_id,
+    it.item_name,
+    it.category,
+    it.unit,
+    inv.inventory_id,
+    inv.quantity,
+    COALESCE(inv.allocated,0) AS allocated,
+    COALESCE(inv.ordered,0) AS ordered,
+    inv.quantity - COALESCE(inv.allocated,0) AS available,
+    CASE WHEN inv.quantity <= it.reorder_point THEN 1 ELSE 0 END AS reorder_flag
+"""
+
+
+def phrase(term):
+    # FTS5 の構文として解釈されないよう 1 語ずつ引用する
+    return '"' + term.replace('"', '""') + '"'
+
+
+def like_pattern(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def like_filter(terms, alias="it"):
+    # 短い語はすべて商品名かカテゴリーに含まれること
+    sql = "".join(
+        f" AND ({alias}.item_name LIKE ? ESCAPE '\\' OR {alias}.category LIKE ? ESCAPE '\\')" for _ in terms
+    )
+    params = [p for term in terms for p in (like_pattern(term), like_pattern(term))]
+    return sql, params
+
+
+# 索引中の trigram 一覧（プロセス内キャッシュ）
+# items_fts_vocab は語彙を毎回全件読み直すため、items_fts_version（items の追加・削除・改名でトリガーが加算。
+# 初期値は DB ごとの乱数）が同じ間は前回読んだ一覧を使う
+_vocab_lock = threading.Lock()
+_vocab = {"key": None, "terms": ()}
+
+
+def vocab_terms(cur):
+    cur.execute("SELECT version FROM items_fts_version WHERE id = 1")
+    row = cur.fetchone()
+    key = row[0] if row else None
+    with _vocab_lock:
+        if _vocab["key"] == key and key is not None:
+            return _vocab["terms"]
+    cur.execute("SELECT term FROM items_fts_vocab")
+    terms = tuple(row[0] for row in cur.fetchall())
+    with _vocab_lock:
+        _vocab["key"], _vocab["terms"] = key, terms
+    return terms
+
+
+def expand_short(cur, term):
+    # term を含む trigram のリスト（EXPAND_MAX を超えれば None）
+    term = term.lower()
+    grams = []
+    for gram in vocab_terms(cur):
+        if term in gram:
+            grams.append(gram)
+            if len(grams) > EXPAND_MAX:
+                return None
+    return grams
+
+
+def search_items(conn, q, limit=10):
+    terms = q.split()
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM]
+    cur = conn.cursor()
+
+    # 1. 前方一致（他の語も含むものに限る）。他の語で絞り込むのは名前順に PREFIX_CANDIDATES 件まで
+    # （それより後ろの前方一致も 2. の部分一致には含まれる）
+    rest_sql, rest_params = like_filter(terms[1:])
+    cur.execute(f"""
+        SELECT {RESULT_COLUMNS}
+        FROM (
+            SELECT item_id FROM items
+            WHERE item_name >= ? AND item_name < ?
+            ORDER BY item_name
+            LIMIT ?
+        ) AS p
+        JOIN items AS it ON it.item_id = p.item_id
+        LEFT JOIN inventory AS inv ON inv.item_id = it.item_id
+        WHERE 1 {rest_sql}
+        ORDER BY it.item_name
+        LIMIT ?
+    """, [terms[0], terms[0] + "\U0010ffff", PREFIX_CANDIDATES] + rest_params + [limit])
+    results = [dict(row) for row in cur.fetchall()]
+    seen = {row["item_id"] for row in results}
+    if len(results) >= limit:
+        return results
+
+    # 2. 部分一致
+    match = [phrase(t) for t in long_terms]
+    scan_terms = []
+    for term in short_terms:
+        grams = expand_short(cur, term)
+        if grams is None:
+            scan_terms.append(term)
+        elif not grams:
+            # どの trigram にも含まれない → 前方一致の結果のみ
+            return results
+        else:
+            match.append("(" + " OR ".join(phrase(g) for g in grams) + ")")
+
+    if match:
+        # 短い語を含むときは rank を付けず、新しい方から必要な件数だけ読む
+        scan_sql, scan_params = like_filter(scan_terms, alias="f")
+        rank, candidates = ("0", limit + len(seen)) if short_terms else ("f.rank", RANK_CANDIDATES)
+        cur.execute(f"""
+            SELECT {RESULT_COLUMNS}
+            FROM (
+                SELECT item_id, rank FROM (
+                    SELECT f.rowid AS item_id, {rank} AS rank FROM items_fts AS f
+                    WHERE items_fts MATCH ? {scan_sql}
+                    ORDER BY f.rowid DESC
+                    LIMIT ?
+                )
+                ORDER BY rank, item_id DESC
+                LIMIT ?
+            ) AS m
+            JOIN items AS it ON it.item_id = m.item_id
+            LEFT JOIN inventory AS inv ON inv.item_id = it.item_id
+            ORDER BY m.rank, m.item_id DESC
+            LIMIT ?
+        """, [" AND ".join(match)] + scan_params + [candidates, RANK_WINDOW, limit + len(seen)])
+    else:
+        # 1 文字の語だけ: items を先頭から読み、件数が揃った時点で打ち切る
+        scan_sql, scan_params = like_filter(scan_terms)
+        cur.execute(f"""
+            SELECT {RESULT_COLUMNS}
+            FROM items AS it
+            LEFT JOIN inventory AS inv ON inv.item_id = it.item_id
+            WHERE 1 {scan_sql}
+            ORDER BY it.item_id
+            LIMIT ?
+        """, scan_params + [limit + len(seen)])
+    for row in cur.fetchall():
+        if row["item_id"] not in seen and len(results) < limit:
+            seen.add(row["item_id"])
+            results.append(dict(row))
+    return results
+
+
+# GET /items/search?q=コーヒー 豆&limit=10
+# 空白区切りの語をすべて含む品目を、在庫（inventory_id・可用在庫など）と合わせて返す
+@bp.route("/items/search", methods=["GET"])
+def item_search():
+    q = request.args.get("q", "").strip()
+    limit = request.args.get("limit", 10, type=int)
+    if not 1 <= limit <= SEARCH_LIMIT_MAX:
+        return jsonify({"status": "error", "message": f"limit は 1〜{SEARCH_LIMIT_MAX} で指定してください"}), 400
+    return jsonify({"q": q, "items": search_items(get_read_db(), q, limit)})
+
+
+def init_app(app):
+    app.register_blueprint(bp)
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, request, stream_with_context
+
+import db
+
+# 在庫の変更を Server-Sent Events で配信する /stock/stream
+# stock_events（inventory のトリガーで記録）を event_id 順に読み、在庫行ごとの差分を送る。
+#
+#   event: stock   id: 最後の event_id   data: [{"inventory_id": 1, "quantity": 10, ...}, ...]
+#   event: reset   保持期間より古い event_id から再開しようとした（クライアントは /stock を読み直す）
+#
+# 差分は変更後の値（増減ではない）なので、/stock の読み込みと前後しても順に適用すれば最終的に一致する。
+# 接続はポーリングのたびにプールから借りて返すため、開いている画面の数だけ DB 接続を占有しない
+#
+# gthread ワーカーでは配信中のストリームがワーカースレッドを 1 つ占有するので、
+#   - 同時に配信するストリームはプロセスあたり STREAM_MAX_CLIENTS まで（既定はスレッド数 INVENTORY_THREADS から
+#     API_THREADS を除いた数）。超えた分は 503 + retry: で断り、画面は少し待って Last-Event-ID から再接続する
+#     （残りのスレッドは通常の API に使う。gunicorn.conf.py 参照）
+#   - 1 回の接続は差分を送った時点か STREAM_MAX_SECONDS（ロングポーリング）で終え、スレッドを長く持たない
+
+bp = Blueprint("stream", __name__)
+
+API_THREADS = 4  # ストリームに使わせず通常の API 用に残すワーカースレッド数
+
+EVENT_SQL = """
+    SELECT
+        e.event_id,
+        e.inventory_id,
+        e.kind,
+        e.quantity,
+        e.allocated,
+        e.ordered,
+        e.quantity - e.allocated AS available,
+        CASE WHEN e.quantity <= it.reorder_point THEN 1 ELSE 0 END AS reorder_flag,
+        it.item_name,
+        it.category,
+        it.unit
+    FROM stock_events AS e
+    JOIN inventory AS inv ON inv.inventory_id = e.inventory_id
+    JOIN items AS it ON it.item_id = inv.item_id
+    WHERE e.event_id > ?
+    ORDER BY e.event_id
+    LIMIT ?
+"""
+
+# 新規行のときだけ送る項目
+INSERT_FIELDS = ("item_name", "category", "unit")
+
+
+def event_range(conn):
+    # MIN / MAX を別々のサブクエリにすると、それぞれ主キーの端を 1 行読むだけで済む
+    return conn.execute("""
+        SELECT (SELECT MIN(event_id) FROM stock_events), (SELECT MAX(event_id) FROM stock_events)
+    """).fetchone()
+
+
+def read_events(conn, after, limit):
+    # event_id > after のイベントを読み、在庫行ごとに最新の値へまとめる。(最後の event_id, 差分リスト) を返す
+    rows = conn.execute(EVENT_SQL, (after, limit)).fetchall()
+    if not rows:
+        return after, []
+    deltas = {}
+    for row in rows:
+        delta = dict(row)
+        del delta["event_id"]
+        kind = delta.pop("kind")
+        # 同じバッチ内で追加→更新された行は新規行として送る
+        previous = deltas.pop(delta["inventory_id"], None)
+        if kind != "insert" and (previous is None or "item_name" not in previous):
+            for field in INSERT_FIELDS:
+                del delta[field]
+        deltas[delta["inventory_id"]] = delta
+    return rows[-1]["event_id"], list(deltas.values())
+
+
+def format_event(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def with_read_conn(fn):
+    pool = db.get_read_pool()
+    conn = pool.acquire()
+    try:
+        return fn(conn)
+    finally:
+        pool.release(conn)
+
+
+# 配信中のストリーム数（プロセス単位）
+_clients_lock = threading.Lock()
+_clients = 0
+
+
+def acquire_client(limit):
+    global _clients
+    with _clients_lock:
+        if _clients >= limit:
+            return False
+        _clients += 1
+        return True
+
+
+def release_client():
+    global _clients
+    with _clients_lock:
+        _clients -= 1
+
+
+def parse_last_event_id():
+    value = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+@bp.route("/stock/stream")
+def stock_stream():
+    config = current_app.config
+    poll = config["STREAM_POLL_INTERVAL"]
+    heartbeat = config["STREAM_HEARTBEAT"]
+    max_seconds = config["STREAM_MAX_SECONDS"]
+    batch = config["STREAM_BATCH"]
+    last_id = parse_last_event_id()
+
+    if not acquire_client(config["STREAM_MAX_CLIENTS"]):
+        retry_ms = int(config["STREAM_RETRY_MS"])
+        resp = Response(f"retry: {retry_ms}\n\n", status=503, mimetype="text/event-stream")
+        resp.headers["Retry-After"] = str(max(1, retry_ms // 1000))
+        return resp
+
+    def generate():
+        nonlocal last_id
+        # スレッドを長時間占有しないよう、差分を送ったら（なければ一定時間で）終了し、
+        # ブラウザの自動再接続（Last-Event-ID 付き）に任せる
+        yield f"retry: {int(config['STREAM_RETRY_MS'])}\n\n"
+
+        low, high = with_read_conn(event_range)
+        high = high or 0
+        if last_id is None:
+            last_id = high
+            yield format_event("ready", {"last_event_id": last_id}, last_id)
+        elif last_id > high or (low is not None and last_id < low - 1):
+            # 保持期間外（または DB が入れ替わった）: 一覧を読み直してもらう
+            last_id = high
+            yield format_event("reset", {"last_event_id": last_id}, last_id)
+
+        started = last_sent = time.monotonic()
+        version = None
+        while time.monotonic() - started < max_seconds:
+            current = db.data_version()
+            if current != version:
+                version = current
+                sent = False
+                while True:
+                    last_id, deltas = with_read_conn(lambda conn: read_events(conn, last_id, batch))
+                    if not deltas:
+                        break
+                    yield format_event("stock", deltas, last_id)
+                    sent = True
+                if sent:
+                    return
+            if time.monotonic() - last_sent >= heartbeat:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll)
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # 出力を始める前に切断された場合も含め、応答を閉じたときに枠を返す
+    resp.call_on_close(release_client)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def init_app(app):
+    app.config.setdefault("STREAM_POLL_INTERVAL", float(os.environ.get("INVENTORY_STREAM_POLL_INTERVAL", 0.5)))
+    app.config.setdefault("STREAM_HEARTBEAT", float(os.environ.get("INVENTORY_STREAM_HEARTBEAT", 15)))
+    app.config.setdefault("STREAM_MAX_SECONDS", float(os.environ.get("INVENTORY_STREAM_MAX_SECONDS", 25)))
+    threads = int(os.environ.get("INVENTORY_THREADS", 16))
+    app.config.setdefault("STREAM_MAX_CLIENTS",
+                          int(os.environ.get("INVENTORY_STREAM_MAX_CLIENTS", max(1, threads - API_THREADS))))
+    app.config.setdefault("STREAM_RETRY_MS", int(os.environ.get("INVENTORY_STREAM_RETRY_MS", 2000)))
+    app.config.setdefault("STREAM_BATCH", int(os.environ.get("INVENTORY_STREAM_BATCH", 500)))
+    app.register_blueprint(bp)
@@ -0,0 +1,165 @@
+# グループコミットのスループット比較
+# 入庫・出庫・予約を多数スレッドから同時に送り、リクエストごとのコミット（既定）と
+# GROUP_COMMIT=1（ライタースレッドでまとめてコミット）を比較する。結果は JSON で出力
+#
+#   python test/bench_group_commit.py --threads 32 --requests 200 [--synchronous FULL] [--output gc.json]
+#
+# 終了後に在庫数量が入出庫履歴の合計と一致すること（操作の取りこぼし・二重反映がないこと）を確認する。
+# gunicorn 経由で比較する場合は INVENTORY_GROUP_COMMIT=1 を付けて test/bench_routes.py --mode macro を実行する
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import ItemPicker, generate, zipf_cum_weights  # noqa: E402
+
+
+def percentile(sorted_values, p):
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def check_ledger(path):
+    # inventory.quantity = 入庫合計 - 出庫合計 であること
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("""
+            SELECT COUNT(*) FROM inventory AS inv
+            WHERE inv.quantity <> COALESCE((SELECT SUM(quantity) FROM stockin WHERE item_id = inv.item_id), 0)
+                                - COALESCE((SELECT SUM(quantity) FROM stockout WHERE item_id = inv.item_id), 0)
+        """).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run(template, workdir, group_commit, args):
+    import db
+    from app import create_app
+
+    path = os.path.join(workdir, f"group{int(group_commit)}.db")
+    shutil.copy(template, path)
+    app = create_app({
+        "DB_PATH": path,
+        "DB_POOL_SIZE": args.threads,
+        "GROUP_COMMIT": group_commit,
+        "GROUP_COMMIT_MAX_BATCH": args.max_batch,
+        "GROUP_COMMIT_MAX_WAIT_MS": args.max_wait_ms,
+    })
+    login = app.test_client()
+    login.post("/login", data={"username": "owner", "password": "ownerpass"})
+    cookie = login.get_cookie("session").value
+
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    barrier = threading.Barrier(args.threads + 1)
+
+    def worker(n):
+        rnd = random.Random(args.seed + n)
+        pick = ItemPicker(rnd, zipf_cum_weights(random.Random(args.seed), args.items, 1.1))
+        client = app.test_client()
+        client.set_cookie("session", cookie)
+        local_lat, local_status = [], {}
+        barrier.wait()
+        for _ in range(args.requests):
+            inventory_id = pick()
+            r = rnd.random()
+            t0 = time.perf_counter()
+            if r < 0.4:
+                resp = client.post("/stock/in", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 20)})
+            elif r < 0.8:
+                resp = client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 5)})
+            else:
+                resp = client.post("/reservation/create", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+            local_lat.append(time.perf_counter() - t0)
+            local_status[resp.status_code] = local_status.get(resp.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_lat)
+            for code, count in local_status.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        writer = db.get_group_writer()
+        writer_stats = writer.stats() if writer else None
+
+    latencies.sort()
+    total = len(latencies)
+    mismatched = check_ledger(path)
+    return {
+        "mode": "group_commit" if group_commit else "per_request",
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "lock_error_rate": round(statuses.get(503, 0) / total, 4),
+        "ledger_mismatches": mismatched,
+        "writer": writer_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="スレッドあたりのリクエスト数")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--synchronous", choices=["OFF", "NORMAL", "FULL"], default="NORMAL",
+                        help="PRAGMA synchronous（FULL でコミットごとの fsync の影響を比較）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    import db
+    db.PRAGMAS = tuple((name, args.synchronous if name == "synchronous" else value) for name, value in db.PRAGMAS)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        template = os.path.join(workdir, "template.db")
+        generate(template, items=args.items, movements=args.items * 20, reservations=args.items, seed=args.seed)
+        results = []
+        for group_commit in (False, True):
+            r = run(template, workdir, group_commit, args)
+            results.append(r)
+            print(f'{r["mode"]:13} {r["rps"]:8.1f} req/s  p50={r["p50_ms"]:.2f} p95={r["p95_ms"]:.2f} '
+                  f'p99={r["p99_ms"]:.2f} ms  503={r["lock_error_rate"]:.2%}  '
+                  f'avg_batch={(r["writer"] or {}).get("avg_batch")}', flush=True)
+            assert r["ledger_mismatches"] == 0, "在庫数量と入出庫履歴が一致しません"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "args": vars(args),
+        "results": results,
+        "speedup": round(results[1]["rps"] / results[0]["rps"], 2),
+    }
+    print(f'speedup: x{report["speedup"]}')
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# ルート別ベンチマーク / 負荷試験
+# sample_data.generate() で生成したデータセットに対して主要ルートを呼び出し、
+# p50/p95/p99 レイテンシ・スループット・ロックエラー率（503）を JSON で出力する
+#
+#   python test/bench_routes.py --sizes 1000 10000 --requests 500 --output bench.json
+#   python test/bench_routes.py --mode macro --concurrency 16 --baseline bench.json
+#
+# モード
+#   micro : Flask テストクライアント（1 スレッド、HTTP を経由しないアプリ内部の処理時間）
+#   macro : gunicorn（gunicorn.conf.py）を起動し、同時接続クライアントから HTTP で負荷をかける
+#
+# --baseline を指定すると同じ (mode, size, route) の結果と比較し、
+# p95 の悪化・スループット低下・ロックエラー率の増加が許容範囲を超えたら終了コード 1
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import ItemPicker, generate, zipf_cum_weights  # noqa: E402
+
+ROUTES = ["GET /stock", "GET /stock?page", "POST /stock/in", "POST /stock/out",
+          "POST /reservation/create", "POST /item/add"]
+
+
+class Workload:
+    # ルートごとのリクエスト（メソッド, パス, JSON）を作る。在庫 ID は Zipf 分布でホット SKU に集中させる
+    def __init__(self, size, seed):
+        self.size = size
+        self.rnd = random.Random(seed)
+        self.pick = ItemPicker(self.rnd, zipf_cum_weights(random.Random(seed), size, 1.1))
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next(self, route):
+        with self.lock:
+            inventory_id = self.pick()
+            self.counter += 1
+            n = self.counter
+            cursor = self.rnd.randint(0, max(self.size - 100, 0))
+            qty = self.rnd.randint(1, 3)
+        if route == "GET /stock":
+            return "GET", "/stock", None
+        if route == "GET /stock?page":
+            return "GET", "/stock?" + urlencode({"limit": 100, "cursor": cursor}), None
+        if route == "POST /stock/in":
+            return "POST", "/stock/in", {"inventory_id": inventory_id, "qty": qty * 10}
+        if route == "POST /stock/out":
+            return "POST", "/stock/out", {"inventory_id": inventory_id, "qty": qty}
+        if route == "POST /reservation/create":
+            return "POST", "/reservation/create", {"inventory_id": inventory_id, "qty": qty, "usage": "bench"}
+        if route == "POST /item/add":
+            return "POST", "/item/add", {"item_name": f"bench-{os.getpid()}-{n}", "reorder_point": 5}
+        raise ValueError(route)
+
+
+def percentile(sorted_values, p):
+    # 最近接順位法
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    total = len(statuses)
+    lock_errors = sum(1 for s in statuses if s == 503)
+    result = {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else None,
+        "ok": sum(1 for s in statuses if s < 400),
+        "rejected": sum(1 for s in statuses if 400 <= s < 500),
+        "lock_errors": lock_errors,
+        "server_errors": sum(1 for s in statuses if s >= 500 and s != 503),
+        "lock_error_rate": round(lock_errors / total, 4) if total else 0.0,
+    }
+    for p in (50, 95, 99):
+        value = percentile(latencies, p)
+        result[f"p{p}_ms"] = round(value * 1000, 3) if value is not None else None
+    result["max_ms"] = round(latencies[-1] * 1000, 3) if latencies else None
+    return result
+
+
+# ---------------------------
+# micro: テストクライアント
+# ---------------------------
+def run_micro(db_path, size, args):
+    os.environ["INVENTORY_DB_PATH"] = db_path
+    from app import create_app
+
+    app = create_app({"DB_PATH": db_path})
+    client = app.test_client()
+    client.post("/login", data={"username": "owner", "password": "ownerpass"})
+    workload = Workload(size, args.seed)
+    results = []
+    for route in args.routes:
+        for _ in range(args.warmup):
+            method, path, body = workload.next(route)
+            client.open(path, method=method, json=body)
+        latencies, statuses = [], []
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            method, path, body = workload.next(route)
+            t0 = time.perf_counter()
+            resp = client.open(path, method=method, json=body)
+            latencies.append(time.perf_counter() - t0)
+            statuses.append(resp.status_code)
+        elapsed = time.perf_counter() - started
+        results.append({"mode": "micro", "size": size, "route": route, "concurrency": 1,
+                        **summarize(latencies, statuses, elapsed)})
+    return results
+
+
+# ---------------------------
+# macro: gunicorn + 同時接続クライアント
+# ---------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(db_path, port, args):
+    env = dict(os.environ,
+               INVENTORY_DB_PATH=db_path,
+               INVENTORY_BIND=f"127.0.0.1:{port}",
+               INVENTORY_WORKERS=str(args.workers),
+               INVENTORY_THREADS=str(args.threads))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn が起動できませんでした:\n" + proc.stderr.read().decode(errors="replace"))
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("gunicorn の起動待ちがタイムアウトしました")
+
+
+def login(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/login", body=urlencode({"username": "owner", "password": "ownerpass"}),
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    cookie = resp.getheader("Set-Cookie")
+    if not cookie:
+        raise RuntimeError("ログインに失敗しました")
+    return cookie.split(";", 1)[0]
+
+
+def run_macro(db_path, size, args):
+    port = free_port()
+    proc = start_gunicorn(db_path, port, args)
+    try:
+        cookie = login(port)
+        workload = Workload(size, args.seed)
+        results = []
+        for route in args.routes:
+            lock = threading.Lock()
+            latencies, statuses = [], []
+            per_client = max(args.requests // args.concurrency, 1)
+            barrier = threading.Barrier(args.concurrency + 1)
+
+            def client():
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                local_lat, local_status = [], []
+
+                def call():
+                    method, path, body = workload.next(route)
+                    headers = {"Cookie": cookie}
+                    data = None
+                    if body is not None:
+                        data = json.dumps(body)
+                        headers["Content-Type"] = "application/json"
+                    t0 = time.perf_counter()
+                    conn.request(method, path, body=data, headers=headers)
+                    resp = conn.getresponse()
+                    resp.read()
+                    return time.perf_counter() - t0, resp.status
+
+                for _ in range(args.warmup // args.concurrency):
+                    call()
+                barrier.wait()
+                for _ in range(per_client):
+                    elapsed, status = call()
+                    local_lat.append(elapsed)
+                    local_status.append(status)
+                conn.close()
+                with lock:
+                    latencies.extend(local_lat)
+                    statuses.extend(local_status)
+
+            threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+            for t in threads:
+                t.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+            results.append({"mode": "macro", "size": size, "route": route, "concurrency": args.concurrency,
+                            **summarize(latencies, statuses, elapsed)})
+        return results
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+# ---------------------------
+# ベースライン比較
+# ---------------------------
+def compare(results, baseline, tolerance):
+    # (mode, size, route) ごとに比較し、回帰の説明文のリストを返す
+    base = {(r["mode"], r["size"], r["route"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["mode"], r["size"], r["route"]))
+        if b is None:
+            continue
+        key = f'{r["mode"]} size={r["size"]} {r["route"]}'
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f'{key}: p95 {b["p95_ms"]} -> {r["p95_ms"]} ms')
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+            regressions.append(f'{key}: rps {b["rps"]} -> {r["rps"]}')
+        if r["lock_error_rate"] > b["lock_error_rate"] + 0.01:
+            regressions.append(f'{key}: lock_error_rate {b["lock_error_rate"]} -> {r["lock_error_rate"]}')
+        if r["server_errors"] > b["server_errors"]:
+            regressions.append(f'{key}: server_errors {b["server_errors"]} -> {r["server_errors"]}')
+    return regressions
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="データセットの品目数")
+    parser.add_argument("--movements-per-item", type=int, default=20)
+    parser.add_argument("--reservations-per-item", type=int, default=2)
+    parser.add_argument("--mode", choices=["micro", "macro", "both"], default="both")
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--requests", type=int, default=500, help="ルートあたりの計測リクエスト数")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="macro の同時接続数")
+    parser.add_argument("--workers", type=int, default=2, help="macro の gunicorn ワーカー数")
+    parser.add_argument("--threads", type=int, default=8, help="macro の gunicorn ワーカーあたりスレッド数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline", help="比較対象の JSON（以前の --output）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95 / rps の許容変化率")
+    args = parser.parse_args()
+
+    modes = ["micro", "macro"] if args.mode == "both" else [args.mode]
+    workdir = tempfile.mkdtemp()
+    results = []
+    try:
+        for size in args.sizes:
+            # データセットは 1 回だけ生成し、モードごとにコピーして使う（書き込みの影響を持ち越さない）
+            template = os.path.join(workdir, f"template-{size}.db")
+            generate(template, items=size, movements=size * args.movements_per_item,
+                     reservations=size * args.reservations_per_item, orders=size // 10, seed=args.seed)
+            for mode in modes:
+                path = os.path.join(workdir, f"{mode}-{size}.db")
+                shutil.copy(template, path)
+                runner = run_micro if mode == "micro" else run_macro
+                for r in runner(path, size, args):
+                    results.append(r)
+                    print(f'{r["mode"]:5} size={r["size"]:<7} {r["route"]:26} '
+                          f'p50={r["p50_ms"]:8.2f} p95={r["p95_ms"]:8.2f} p99={r["p99_ms"]:8.2f} ms '
+                          f'{r["rps"]:8.1f} req/s  lock={r["lock_error_rate"]:.2%}', flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "sqlite": sqlite3.sqlite_version,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nNG: ベースラインからの回帰")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\nOK: ベースラインからの回帰なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# 起動時間ベンチマーク（import + 最初のリクエスト）
+# 毎回新しいプロセスで計測し、ワーカー起動コストの回帰を追跡する。結果は JSON で出力
+#
+#   python test/bench_startup.py --repeat 5 [--output startup.json]
+#
+# シナリオ
+#   migrated : init-db 済みの DB（通常のワーカー起動）
+#   fresh    : 空の DB（最初のリクエストでマイグレーションを適用）
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行する計測コード
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+resp = app.app.test_client().get("/stock")
+t2 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({"import": t1 - t0, "first_request": t2 - t1}))
+"""
+
+
+def run_probe(db_path):
+    env = dict(os.environ, INVENTORY_DB_PATH=db_path, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    result = {}
+    for key in ("import", "first_request"):
+        values = [s[key] * 1000 for s in samples]
+        result[key + "_ms"] = {"median": round(statistics.median(values), 2), "max": round(max(values), 2)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from migrations import migrate_path
+
+    workdir = tempfile.mkdtemp()
+    try:
+        migrated = os.path.join(workdir, "migrated.db")
+        migrate_path(migrated)
+        samples = {"migrated": [], "fresh": []}
+        for i in range(args.repeat):
+            samples["migrated"].append(run_probe(migrated))
+            samples["fresh"].append(run_probe(os.path.join(workdir, f"fresh{i}.db")))
+        report = {name: summarize(values) for name, values in samples.items()}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
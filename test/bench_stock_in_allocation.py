@@ -0,0 +1,111 @@
+# 入庫時の予約自動割当ベンチマーク
+# 予約残件数ごとに /stock/in の応答時間を計測し、旧実装（予約ごとに UPDATE するループ）と比較する
+#
+#   python test/bench_stock_in_allocation.py --sizes 10 100 1000 10000 --repeat 5
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def legacy_allocate_reservations(cur, inventory_id, item_id, qty):
+    # 比較用: 変更前のループ実装
+    cur.execute("""
+        SELECT reservation_id, quantity, status
+        FROM reservations
+        WHERE item_id = ? AND status = 'reserved'
+        ORDER BY reserved_date, reservation_id
+    """, (item_id,))
+    remaining = qty
+    for r in cur.fetchall():
+        if remaining <= 0:
+            break
+        allocate_qty = min(remaining, r["quantity"])
+        cur.execute("UPDATE inventory SET allocated = allocated + ? WHERE inventory_id = ?", (allocate_qty, inventory_id))
+        cur.execute("""
+            UPDATE reservations
+            SET quantity = quantity - ?, status = CASE WHEN quantity - ? <= 0 THEN 'consumed' ELSE 'reserved' END
+            WHERE reservation_id = ?
+        """, (allocate_qty, allocate_qty, r["reservation_id"]))
+        remaining -= allocate_qty
+    return qty - remaining
+
+
+def seed(conn, pending):
+    # 品目 1 件に pending 件（各 2 個）の予約を積む
+    cur = conn.cursor()
+    cur.execute("DELETE FROM reservations")
+    cur.execute("DELETE FROM inventory")
+    cur.execute("DELETE FROM items")
+    cur.execute("INSERT INTO items (item_id, item_name, reorder_point) VALUES (1, 'bench', 0)")
+    cur.execute("INSERT INTO inventory (inventory_id, item_id, quantity) VALUES (1, 1, 0)")
+    cur.executemany(
+        "INSERT INTO reservations (item_id, quantity, reserved_date) VALUES (1, 2, datetime('now', ?))",
+        [(f"-{pending - i} seconds",) for i in range(pending)],
+    )
+    conn.commit()
+
+
+def state(conn):
+    inv = conn.execute("SELECT quantity, allocated FROM inventory WHERE inventory_id = 1").fetchone()
+    res = conn.execute("SELECT quantity, status FROM reservations ORDER BY reservation_id").fetchall()
+    return tuple(inv), [tuple(r) for r in res]
+
+
+def measure(client, conn, pending, repeat):
+    # 予約残の約半分（+1 で一部消化の境界を作る）を 1 回の入庫で割り当てる
+    timings = []
+    final = None
+    for _ in range(repeat):
+        seed(conn, pending)
+        start = time.perf_counter()
+        resp = client.post("/stock/in", json={"inventory_id": 1, "qty": pending + 1})
+        timings.append(time.perf_counter() - start)
+        assert resp.status_code == 200, resp.data
+        final = state(conn)
+    return statistics.median(timings), final
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["INVENTORY_DB_PATH"] = os.path.join(workdir, "inventory.db")
+    try:
+        import app as appmod
+        import migrations
+
+        migrations.migrate_path(os.environ["INVENTORY_DB_PATH"])
+
+        client = appmod.app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        import sqlite3
+        conn = sqlite3.connect(os.environ["INVENTORY_DB_PATH"])
+        conn.row_factory = sqlite3.Row
+
+        current = appmod.allocate_reservations
+        print(f"{'pending':>8} {'set-based ms':>13} {'legacy ms':>10} {'speedup':>8}")
+        for pending in args.sizes:
+            appmod.allocate_reservations = current
+            fast, fast_state = measure(client, conn, pending, args.repeat)
+            appmod.allocate_reservations = legacy_allocate_reservations
+            slow, slow_state = measure(client, conn, pending, args.repeat)
+            appmod.allocate_reservations = current
+            assert fast_state == slow_state, "割当結果が旧実装と一致しません"
+            print(f"{pending:>8} {fast * 1000:>13.2f} {slow * 1000:>10.2f} {slow / fast:>7.1f}x")
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
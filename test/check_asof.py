@@ -0,0 +1,137 @@
+# /stock/asof の検証
+# サンプルデータ（既定 2 年分）を作ってチェックポイントを再構築し、ランダムな時刻について
+# 「チェックポイント + 差分」の結果が入出庫履歴の全件集計と一致することと、応答時間を確認する。
+# チェックポイントがない DB では、リクエストではスレッドを起動せず、起動したスレッド（gunicorn の post_fork）が
+# 履歴の先頭から 1 つずつ作ることも確認する
+#
+#   python test/check_asof.py [--items 2000] [--movements 400000] [--days 730] [--samples 50]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+
+FULL_SCAN = """
+    SELECT item_id, SUM(quantity) FROM (
+        SELECT item_id, quantity FROM stockin WHERE date <= :ts
+        UNION ALL
+        SELECT item_id, -quantity FROM stockout WHERE date <= :ts
+    )
+    GROUP BY item_id
+    HAVING SUM(quantity) <> 0
+"""
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--movements", type=int, default=400000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--interval", type=int, default=86400)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import checkpoints
+    import db
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "asof.db")
+        generate(path, items=args.items, movements=args.movements, days=args.days, seed=args.seed)
+
+        conn = db.connect(path)
+        started = time.perf_counter()
+        count = checkpoints.rebuild_checkpoints(conn, args.interval)
+        print(f"rebuild: {count} checkpoints in {time.perf_counter() - started:.2f}s")
+        first, last = conn.execute("SELECT MIN(date), MAX(date) FROM stockin").fetchone()
+        conn.close()
+
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+
+        raw = sqlite3.connect(path)
+        rnd = random.Random(args.seed)
+        start = datetime.fromisoformat(first)
+        span = (datetime.fromisoformat(last) - start).total_seconds()
+        timestamps = [(start + timedelta(seconds=rnd.uniform(-3600, span + 3600))).strftime("%Y-%m-%dT%H:%M:%S")
+                      for _ in range(args.samples)]
+        # 境界ちょうど・日付のみ・現在も確認する
+        timestamps += [first.replace(" ", "T"), last[:10], datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")]
+
+        asof_times, scan_times = [], []
+        for ts in timestamps:
+            t0 = time.perf_counter()
+            items, cursor = {}, 0
+            while True:
+                resp = client.get(f"/stock/asof?ts={ts}&limit=10000&cursor={cursor}")
+                assert resp.status_code == 200, resp.get_data(as_text=True)
+                body = resp.get_json()
+                items.update((row["item_id"], row["quantity"]) for row in body["items"])
+                if body["next_cursor"] is None:
+                    break
+                cursor = body["next_cursor"]
+            asof_times.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            expected = dict(raw.execute(FULL_SCAN, {"ts": body["ts"]}).fetchall())
+            scan_times.append(time.perf_counter() - t0)
+            assert items == expected, f"{ts}: 全件集計と一致しません"
+
+            # 1 品目の指定
+            item_id = rnd.randint(1, args.items)
+            one = client.get(f"/stock/asof?ts={ts}&item_id={item_id}").get_json()["items"]
+            assert [(r["item_id"], r["quantity"]) for r in one] == \
+                ([(item_id, expected[item_id])] if item_id in expected else []), f"{ts}: item_id={item_id}"
+
+        # 現在時刻の結果は inventory.quantity と一致する
+        current = {k: v for k, v in raw.execute("SELECT item_id, quantity FROM inventory").fetchall() if v}
+        assert items == current, "現在時刻の結果が inventory と一致しません"
+        assert client.get("/stock/asof").status_code == 400
+        assert client.get("/stock/asof?ts=yesterday").status_code == 400
+
+        # チェックポイントがなくても、リクエストではスレッドを起動しない
+        with raw:
+            raw.execute("DELETE FROM stock_checkpoint_items")
+            raw.execute("DELETE FROM stock_checkpoints")
+        fresh = create_app({"DB_PATH": path, "CHECKPOINT_INTERVAL": args.interval})
+        fresh.test_client().get("/stock/asof?ts=2000-01-01")
+        time.sleep(0.5)
+        assert "stock-checkpointer" not in [t.name for t in threading.enumerate()], "リクエストでスレッドが起動しました"
+        # 起動したスレッドは履歴の先頭から interval ごとに作る（再構築と同じ区切り）
+        checkpoints.start_checkpointer(fresh)
+        deadline = time.monotonic() + 120
+        while raw.execute("SELECT COUNT(*) FROM stock_checkpoints").fetchone()[0] < count:
+            assert time.monotonic() < deadline, "チェックポイントが作成されません"
+            time.sleep(0.05)
+        body = client.get(f"/stock/asof?ts={last[:10]}&limit=10000").get_json()
+        assert body["checkpoint"] is not None and body["checkpoint"]["taken_at"] > first
+        raw.close()
+
+        asof_times.sort()
+        scan_times.sort()
+        print(f"asof (HTTP):  p50={percentile(asof_times, 50) * 1000:.1f}ms p95={percentile(asof_times, 95) * 1000:.1f}ms")
+        print(f"full scan:    p50={percentile(scan_times, 50) * 1000:.1f}ms p95={percentile(scan_times, 95) * 1000:.1f}ms")
+        print(f"OK: {len(timestamps)} 時点")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
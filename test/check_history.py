@@ -0,0 +1,130 @@
+# 品目の入出庫・予約履歴（/history）の検証
+# サンプルデータ（品目の偏りあり）に入出庫・予約を追加し、履歴の多い品目と少ない品目について
+#   - カーソルで全ページを読んだ結果が (日時, ID, 種別) の順に並び、入庫・出庫・予約の全件と過不足なく一致すること
+#   - types / from / to の絞り込みが履歴を直接数えた件数と一致すること
+#   - format=ndjson の出力がページを順に読んだ結果と同じであること
+# を確認し、先頭ページと後ろのページ（カーソル）の応答時間を表示する（OFFSET で同じ位置を読む場合も参考に表示）
+#
+#   python test/check_history.py [--items 20000] [--requests 1000]
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from history import LEDGERS, history_sql  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+
+def ledger_keys(conn, item_id, types=tuple(LEDGERS), lower="", upper="9999-12-31 23:59:59"):
+    keys = set()
+    for kind in types:
+        table, id_column, date_column, _ = LEDGERS[kind]
+        keys.update((ts, entry_id, kind) for ts, entry_id in conn.execute(
+            f"SELECT {date_column}, {id_column} FROM {table} "
+            f"WHERE item_id = ? AND {date_column} >= ? AND {date_column} <= ?", (item_id, lower, upper)))
+    return keys
+
+
+def read_pages(client, query, limit):
+    rows, cursor, pages = [], None, 0
+    while True:
+        url = f"/history?{query}&limit={limit}" + (f"&cursor={quote(cursor)}" if cursor else "")
+        body = client.get(url).get_json()
+        rows.extend(body["items"])
+        pages += 1
+        if body["next_cursor"] is None:
+            return rows, pages
+        cursor = body["next_cursor"]
+
+
+def timed(client, url, repeat=20):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        assert client.get(url).status_code == 200
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "history.db")
+        generate(path, items=args.items, movements=args.items * 50, reservations=args.items,
+                 orders=args.items // 10, seed=args.seed)
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        raw = sqlite3.connect(path)
+
+        heavy_item, heavy_inventory = raw.execute("""
+            SELECT so.item_id, inv.inventory_id FROM stockout AS so JOIN inventory AS inv ON inv.item_id = so.item_id
+            GROUP BY so.item_id ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+        rnd = random.Random(args.seed)
+        # 同じ日時（秒）に入出庫・予約が重なる行も作る
+        for _ in range(args.requests):
+            inventory_id = heavy_inventory if rnd.random() < 0.5 else rnd.randint(1, args.items)
+            url = rnd.choice(["/stock/in", "/stock/out", "/reservation/create"])
+            client.post(url, json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+
+        light_item = raw.execute("SELECT item_id FROM items ORDER BY item_id DESC LIMIT 1").fetchone()[0]
+        for item_id in (heavy_item, light_item):
+            expected = ledger_keys(raw, item_id)
+            rows, pages = read_pages(client, f"item_id={item_id}", 1000)
+            keys = [(row["ts"], row["id"], row["type"]) for row in rows]
+            assert keys == sorted(keys), "日時順に並んでいません"
+            assert len(keys) == len(set(keys)), "同じ履歴が複数のページに含まれています"
+            assert set(keys) == expected, f"履歴と一致しません（{len(set(keys) ^ expected)} 件）"
+            print(f"item {item_id}: {len(rows)} 件 / {pages} ページ")
+
+            lines = client.get(f"/history?item_id={item_id}&format=ndjson").get_data(as_text=True).splitlines()
+            assert [json.loads(line) for line in lines] == rows, "ndjson とページの結果が一致しません"
+
+        lower, upper = "2026-01-01 00:00:00", "2026-06-30 23:59:59"
+        for types in (("in",), ("out", "reserve"), ("in", "out", "reserve")):
+            rows, _ = read_pages(client, f"item_id={heavy_item}&types={','.join(types)}"
+                                         f"&from=2026-01-01&to=2026-06-30", 777)
+            assert {(row["ts"], row["id"], row["type"]) for row in rows} == \
+                ledger_keys(raw, heavy_item, types, lower, upper), types
+
+        # 先頭と後ろのページ（最後のカーソル）の応答時間
+        rows, _ = read_pages(client, f"item_id={heavy_item}", 5000)
+        deep = rows[-101]
+        deep_cursor = quote(f'{deep["ts"]},{deep["id"]},{deep["type"]}')
+        first = timed(client, f"/history?item_id={heavy_item}&limit=100")
+        last = timed(client, f"/history?item_id={heavy_item}&limit=100&cursor={deep_cursor}")
+        print(f"先頭ページ {first * 1000:.2f}ms  {len(rows) - 100} 件目からのページ {last * 1000:.2f}ms")
+
+        sql = history_sql(tuple(LEDGERS), limit=False)
+        params = {"item_id": heavy_item, "lower": "", "upper": "9999-12-31 23:59:59",
+                  "cursor_ts": "", "cursor_id": 0}
+        t0 = time.perf_counter()
+        raw.execute(f"SELECT * FROM ({sql}) LIMIT 100 OFFSET {len(rows) - 100}", params).fetchall()
+        print(f"参考: OFFSET で同じ位置 {(time.perf_counter() - t0) * 1000:.2f}ms")
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# 品目の一括取り込み（/items/import）とエクスポート（/stock/export）の検証
+# サンプルデータに CSV（BOM 付き、multipart）と NDJSON（本文そのまま）を IMPORT_CHUNK 行を超えて取り込み、
+#   - 取り込んだ品目が /stock/export（CSV・NDJSON）に初期在庫 0 で出ること、両形式の出力が在庫一覧と一致すること
+#   - duplicates（同じチャンク内・前のチャンク・既存の品目）と invalid（必須項目・数値・JSON・配列）の件数と
+#     errors の行番号が、ファイル上の行番号と一致すること（先に出た行を採用）
+#   - 途中で UTF-8 として読めないバイトがあれば 400 を返し、それまでにコミットしたチャンクだけが残ること
+# を確認し、取り込みとエクスポートの時間を表示する
+#
+#   python test/check_import_export.py [--items 2000] [--rows 12000]
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import IMPORT_CHUNK  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+HEADER = ["item_name", "category", "unit", "reorder_point", "standard_price"]
+
+
+def csv_body(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+
+def import_csv(client, body):
+    return client.post("/items/import", data={"file": (io.BytesIO(body), "items.csv")},
+                       content_type="multipart/form-data")
+
+
+def export(client, fmt):
+    resp = client.get(f"/stock/export?format={fmt}")
+    assert resp.status_code == 200
+    text = resp.get_data().decode("utf-8")
+    if fmt == "csv":
+        assert text.startswith("\ufeff"), "CSV に BOM がありません"
+        return list(csv.DictReader(io.StringIO(text[1:])))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def check_errors(body, duplicates, invalid):
+    # duplicates / invalid: {行番号: メッセージ}
+    assert body["duplicates"] == len(duplicates), (body["duplicates"], len(duplicates))
+    assert body["invalid"] == len(invalid), (body["invalid"], len(invalid))
+    expected = sorted({**duplicates, **invalid}.items())
+    assert [(e["line"], e["message"]) for e in body["errors"]] == expected, body["errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=12000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    assert args.rows > IMPORT_CHUNK + 100, "--rows は IMPORT_CHUNK より多くしてください"
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "import.db")
+        generate(path, items=args.items, movements=args.items * 5, seed=args.seed)
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        raw = sqlite3.connect(path)
+        existing = raw.execute("SELECT item_name FROM items WHERE item_id = 1").fetchone()[0]
+
+        # CSV: データ行 i（0 始まり）はファイルの i + 2 行目（1 行目はヘッダー）
+        rows = [[f"取込-CSV-{i:06d}", "取込", "個", i % 7, 100 + i % 13] for i in range(args.rows)]
+        duplicates, invalid = {}, {}
+
+        def duplicate(i, j):
+            # i 行目を j 行目（先に出た行）と同じ商品名にする
+            rows[i][0] = rows[j][0]
+            duplicates[i + 2] = f"商品名が重複しています: {rows[j][0]}"
+
+        duplicate(10, 3)                        # 同じチャンク内
+        duplicate(IMPORT_CHUNK + 5, 7)          # 前のチャンク（コミット済み）
+        duplicate(args.rows - 1, IMPORT_CHUNK)  # 最後のチャンク → 先頭のチャンク
+        rows[20][0] = existing                  # 既存の品目
+        duplicates[22] = f"商品名が重複しています: {existing}"
+        rows[30][0] = " "
+        invalid[32] = "item_name は必須です"
+        rows[IMPORT_CHUNK - 1][3] = "abc"
+        invalid[IMPORT_CHUNK + 1] = "reorder_point / standard_price が数値ではありません"
+        rows[IMPORT_CHUNK + 50][3] = -1
+        invalid[IMPORT_CHUNK + 52] = "reorder_point は 0 以上で指定してください"
+
+        t0 = time.perf_counter()
+        body = import_csv(client, csv_body(rows)).get_json()
+        elapsed = time.perf_counter() - t0
+        assert body["status"] == "partial", body["status"]
+        check_errors(body, duplicates, invalid)
+        imported = {row[0]: row for i, row in enumerate(rows) if i + 2 not in duplicates and i + 2 not in invalid}
+        assert body["inserted"] == len(imported), (body["inserted"], len(imported))
+        print(f"CSV {args.rows} 行: {body['inserted']} 件追加 {elapsed:.2f} 秒")
+
+        # NDJSON: n 行目がそのまま行番号（空行は数えるが読み飛ばす）
+        lines = [json.dumps({"item_name": f"取込-NDJSON-{i:06d}", "category": "取込", "unit": "箱"}, ensure_ascii=False)
+                 for i in range(IMPORT_CHUNK + 20)]
+        lines[4] = ""
+        lines[5] = "{item_name: 引用符なし}"
+        lines[6] = json.dumps(["配列"], ensure_ascii=False)
+        lines[7] = json.dumps({"item_name": "取込-NDJSON-000001"}, ensure_ascii=False)
+        lines[IMPORT_CHUNK + 10] = json.dumps({"item_name": rows[0][0]}, ensure_ascii=False)
+        body = client.post("/items/import", data="\n".join(lines).encode("utf-8"),
+                           content_type="application/x-ndjson").get_json()
+        check_errors(body, {8: "商品名が重複しています: 取込-NDJSON-000001",
+                            IMPORT_CHUNK + 11: f"商品名が重複しています: {rows[0][0]}"},
+                     {6: "JSON として読み込めません", 7: "オブジェクト形式で指定してください"})
+        assert body["inserted"] == len(lines) - 5, body["inserted"]
+        for n, line in enumerate(lines):
+            if n not in (4, 5, 6, 7, IMPORT_CHUNK + 10):
+                record = json.loads(line)
+                imported[record["item_name"]] = [record["item_name"], "取込", "箱", 0, 0]
+
+        # エクスポート: 取り込んだ品目は初期在庫 0、CSV と NDJSON は同じ内容で在庫一覧の全行
+        t0 = time.perf_counter()
+        exported = export(client, "csv")
+        elapsed = time.perf_counter() - t0
+        by_name = {row["item_name"]: row for row in exported}
+        for name, (_, category, unit, _, _) in imported.items():
+            row = by_name[name]
+            assert (row["category"], row["unit"], row["quantity"]) == (category, unit, "0"), row
+        assert by_name[existing]["category"] != "取込", "既存の品目が上書きされました"
+        count = raw.execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+        assert len(exported) == count, (len(exported), count)
+        ndjson = export(client, "ndjson")
+        assert [{k: str(v) if v is not None else "" for k, v in row.items()} for row in ndjson] == exported, \
+            "CSV と NDJSON の出力が一致しません"
+        assert client.get("/stock/export?format=xml").status_code == 400
+        print(f"export: {len(exported)} 行 {elapsed:.2f} 秒")
+
+        # 途中で読めないバイト: それまでにコミットしたチャンク（IMPORT_CHUNK 行）だけが残る
+        broken = [[f"取込-途中-{i:06d}", "取込", "個", 0, 0] for i in range(IMPORT_CHUNK + 2000)]
+        body = import_csv(client, csv_body(broken) + b"\xff\xfe\xfd,x,y,0,0\r\n")
+        assert body.status_code == 400, body.status_code
+        body = body.get_json()
+        assert body["inserted"] == IMPORT_CHUNK and body["duplicates"] == 0 and body["invalid"] == 0, body
+        assert "ファイルを読み込めません" in body["message"], body["message"]
+        stored = raw.execute("SELECT COUNT(*), MAX(item_name) FROM items WHERE item_name LIKE '取込-途中-%'").fetchone()
+        assert stored == (IMPORT_CHUNK, f"取込-途中-{IMPORT_CHUNK - 1:06d}"), stored
+        assert raw.execute("SELECT COUNT(*) FROM inventory AS inv JOIN items AS it ON it.item_id = inv.item_id "
+                           "WHERE it.item_name LIKE '取込-途中-%'").fetchone()[0] == IMPORT_CHUNK
+
+        # ヘッダーに item_name がない CSV は何も取り込まない
+        resp = import_csv(client, "\ufeffname\nfoo\n".encode("utf-8"))
+        assert resp.status_code == 400 and resp.get_json()["inserted"] == 0
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
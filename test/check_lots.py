@@ -0,0 +1,183 @@
+# ロット（FEFO）の検証
+# サンプルデータに対して入庫（期限付き）・出庫・予約と一括処理を多数スレッドから送り、
+#   - 品目ごとに lots.remaining の合計 = inventory.quantity、lots.allocated の合計 = inventory.allocated
+#   - 出庫したロットは、出庫後に空きが残っているどのロットよりも期限が早い（または同じ）
+#   - inventory.expiration_date は空きのある先頭ロットの期限
+# を確認し、/stock/out と /alerts/expiring の応答時間を表示する
+#
+#   python test/check_lots.py [--items 5000] [--movements 200000] [--threads 8] [--requests 300]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+
+NO_EXPIRY = "9999-12-31"
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def check_consistency(path):
+    conn = sqlite3.connect(path)
+    try:
+        mismatched = conn.execute("""
+            SELECT COUNT(*) FROM inventory AS inv
+            LEFT JOIN (
+                SELECT item_id, SUM(remaining) AS remaining, SUM(allocated) AS allocated FROM lots GROUP BY item_id
+            ) AS l ON l.item_id = inv.item_id
+            WHERE inv.quantity <> COALESCE(l.remaining, 0) OR COALESCE(inv.allocated, 0) <> COALESCE(l.allocated, 0)
+        """).fetchone()[0]
+        negative = conn.execute("SELECT COUNT(*) FROM lots WHERE remaining < allocated OR allocated < 0").fetchone()[0]
+        stale = conn.execute("""
+            SELECT COUNT(*) FROM inventory AS inv
+            WHERE inv.expiration_date IS NOT (
+                SELECT expiration_date FROM lots
+                WHERE item_id = inv.item_id AND remaining > allocated
+                ORDER BY COALESCE(expiration_date, '9999-12-31'), lot_id
+                LIMIT 1
+            )
+        """).fetchone()[0]
+        return mismatched, negative, stale
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--movements", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=300, help="スレッドあたりのリクエスト数")
+    parser.add_argument("--group-commit", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "lots.db")
+        summary = generate(path, items=args.items, movements=args.movements, reservations=args.items, seed=args.seed)
+        print(f'open lots: {summary["lots"]}')
+        assert check_consistency(path) == (0, 0, 0), "サンプルデータのロットが在庫と一致しません"
+
+        app = create_app({"DB_PATH": path, "DB_POOL_SIZE": args.threads, "GROUP_COMMIT": args.group_commit})
+        login = app.test_client()
+        login.post("/login", data={"username": "owner", "password": "ownerpass"})
+        cookie = login.get_cookie("session").value
+
+        lock = threading.Lock()
+        ship_times, violations, statuses = [], [], {}
+        today = date.today()
+
+        def worker(n):
+            rnd = random.Random(args.seed + n)
+            client = app.test_client()
+            client.set_cookie("session", cookie)
+            local_times, local_status = [], {}
+            for _ in range(args.requests):
+                inventory_id = rnd.randint(1, min(args.items, 200))
+                r = rnd.random()
+                if r < 0.3:
+                    expiration = rnd.choice([None, (today + timedelta(days=rnd.randint(-5, 90))).isoformat()])
+                    resp = client.post("/stock/in", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 30),
+                                                          "supplier_id": rnd.randint(1, 10),
+                                                          "expiration_date": expiration})
+                elif r < 0.7:
+                    t0 = time.perf_counter()
+                    resp = client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 10)})
+                    local_times.append(time.perf_counter() - t0)
+                    if resp.status_code == 200:
+                        local_status["picked"] = local_status.get("picked", 0) + len(resp.get_json()["lots"])
+                elif r < 0.85:
+                    resp = client.post("/reservation/create", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+                elif r < 0.93:
+                    lines = [{"inventory_id": rnd.randint(1, 200), "qty": rnd.randint(1, 5),
+                              "expiration_date": (today + timedelta(days=rnd.randint(1, 60))).isoformat()}
+                             for _ in range(5)]
+                    resp = client.post("/stock/in/batch", json={"lines": lines})
+                else:
+                    lines = [{"inventory_id": rnd.randint(1, 200), "qty": rnd.randint(1, 3)} for _ in range(5)]
+                    path_ = "/stock/out/batch" if rnd.random() < 0.5 else "/reservation/create/batch"
+                    resp = client.post(path_, json={"lines": lines})
+                local_status[resp.status_code] = local_status.get(resp.status_code, 0) + 1
+            with lock:
+                ship_times.extend(local_times)
+                for k, v in local_status.items():
+                    statuses[k] = statuses.get(k, 0) + v
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"statuses: {statuses}")
+        assert 500 not in statuses and 503 not in statuses, statuses
+
+        mismatched, negative, stale = check_consistency(path)
+        print(f"inventory と不一致: {mismatched}  remaining < allocated: {negative}  expiration_date 不一致: {stale}")
+        assert (mismatched, negative, stale) == (0, 0, 0)
+
+        # FEFO: 単発の出庫で消費したロットの期限 <= 出庫後に空きが残っているロットの期限
+        client = app.test_client()
+        client.set_cookie("session", cookie)
+        conn = sqlite3.connect(path)
+        rnd = random.Random(args.seed)
+        for _ in range(200):
+            inventory_id = rnd.randint(1, args.items)
+            resp = client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 20)})
+            if resp.status_code != 200:
+                continue
+            picked = resp.get_json()["lots"]
+            keys = [lot["expiration_date"] or NO_EXPIRY for lot in picked]
+            assert keys == sorted(keys), picked
+            item_id = conn.execute("SELECT item_id FROM inventory WHERE inventory_id = ?", (inventory_id,)).fetchone()[0]
+            earliest = conn.execute("""
+                SELECT MIN(COALESCE(expiration_date, '9999-12-31')) FROM lots
+                WHERE item_id = ? AND remaining > allocated AND lot_id NOT IN (SELECT value FROM json_each(?))
+            """, (item_id, str([lot["lot_id"] for lot in picked]))).fetchone()[0]
+            if earliest is not None and keys[-1] > earliest:
+                violations.append((inventory_id, picked, earliest))
+        conn.close()
+        assert not violations, violations[:3]
+
+        # 期限切れ間近のロット
+        alert_times = []
+        for days in (0, 7, 30, 90):
+            t0 = time.perf_counter()
+            body = client.get(f"/alerts/expiring?days={days}&limit=500").get_json()
+            alert_times.append(time.perf_counter() - t0)
+            limit_date = (date.today() + timedelta(days=days)).isoformat()
+            assert all(row["expiration_date"] <= limit_date and row["remaining"] > 0 for row in body["items"])
+            exp = [(row["expiration_date"], row["lot_id"]) for row in body["items"]]
+            assert exp == sorted(exp)
+            if body["next_cursor"]:
+                more = client.get(f'/alerts/expiring?days={days}&limit=500&cursor={body["next_cursor"]}').get_json()
+                assert not more["items"] or (more["items"][0]["expiration_date"], more["items"][0]["lot_id"]) > exp[-1]
+        assert client.get("/alerts/expiring?days=-1").status_code == 400
+        assert client.post("/stock/in", json={"inventory_id": 1, "qty": 1, "expiration_date": "31/12/2026"}).status_code == 400
+        assert client.post("/stock/in", json={"inventory_id": 1, "qty": 1, "supplier_id": 99999}).status_code == 404
+
+        ship_times.sort()
+        alert_times.sort()
+        print(f"/stock/out:        p50={percentile(ship_times, 50) * 1000:.2f}ms p99={percentile(ship_times, 99) * 1000:.2f}ms")
+        print(f"/alerts/expiring:  max={alert_times[-1] * 1000:.2f}ms")
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# SQL 計測（metrics.InstrumentedCursor）の検証
+# 全件の /stock（応答のほとんどが全走査の読み出し）を呼び、
+#   - 低速クエリのログ（slow_query）に全走査の SELECT が出ること
+#   - 低速リクエストのログ（slow_request）の sql_ms がリクエスト時間の大半を占めること
+#     （execute だけを計ると先頭行までしか含まれず、sql_ms はほぼ 0 になる）
+#   - for row in cur / fetchmany / fetchone で読んだ時間も inventory_sql_seconds_total に加算されること
+# を確認する
+#
+#   python test/check_metrics.py [--items 100000]
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import metrics  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def emit(self, record):
+        self.events.append(json.loads(record.getMessage()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "metrics.db")
+        generate(path, items=args.items, movements=args.items, seed=args.seed)
+        app = create_app({"DB_PATH": path, "SLOW_QUERY_MS": 20, "SLOW_REQUEST_MS": 50})
+        client = app.test_client()
+        capture = Capture()
+        metrics.slow_log.addHandler(capture)
+
+        t0 = time.perf_counter()
+        assert client.get("/stock").status_code == 200
+        elapsed = time.perf_counter() - t0
+        slow_queries = [e for e in capture.events if e["event"] == "slow_query"]
+        slow_requests = [e for e in capture.events if e["event"] == "slow_request" and e["route"] == "/stock"]
+        assert slow_queries, f"全走査（{elapsed * 1000:.0f}ms）が低速クエリとして記録されていません"
+        assert any("FROM inventory" in e["sql"] for e in slow_queries), slow_queries
+        assert slow_requests, "低速リクエストとして記録されていません"
+        request_ms, sql_ms = slow_requests[0]["ms"], slow_requests[0]["sql_ms"]
+        print(f"/stock {request_ms:.0f}ms  sql_ms {sql_ms:.0f}ms  slow_query {slow_queries[0]['ms']:.0f}ms")
+        assert sql_ms >= request_ms * 0.3, "sql_ms が結果の読み出しを含んでいません"
+
+        with app.app_context():
+            conn = db.get_read_pool().acquire()
+            try:
+                total = conn.execute("SELECT COUNT(*) FROM stockout").fetchone()[0]
+                for read in (
+                    lambda cur: sum(1 for _ in cur),
+                    lambda cur: len(cur.fetchmany(10 ** 9)),
+                    lambda cur: sum(1 for _ in iter(cur.fetchone, None)),
+                ):
+                    before = metrics.registry.sql_seconds
+                    cur = conn.cursor()
+                    t0 = time.perf_counter()
+                    cur.execute("SELECT * FROM stockout ORDER BY quantity * 7 % 13, date")
+                    count = read(cur)
+                    elapsed = time.perf_counter() - t0
+                    counted = metrics.registry.sql_seconds - before
+                    assert count == total, count
+                    assert counted >= elapsed * 0.5, (counted, elapsed)
+            finally:
+                db.get_read_pool().release(conn)
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# 日次の入出庫集計（movement_daily）と /reports/movements の検証
+# サンプルデータに入出庫・予約（単発・一括）と履歴の訂正（出庫の削除・入庫の数量変更）を行い、
+#   - トリガーで加算した movement_daily の入庫・出庫が、入出庫履歴を日ごとに集計した結果と一致すること
+#   - 作り直し（rebuild_movement_daily）の結果が加算してきた結果と同じであること
+#   - 予約が入庫の引当で消化されても、予約数量の作り直し（reservations=True）は追加時の数量（reserved_qty）から
+#     加算してきた結果と同じになること（reserved_qty は変更できない）
+#   - /reports/movements（day / month / category / item）の合計が履歴の集計と一致すること
+# を確認し、集計表から読む場合と履歴を直接集計する場合の時間を表示する
+#
+#   python test/check_movements.py [--items 50000] [--requests 2000]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+LEDGER_DAILY = """
+    SELECT day, item_id, SUM(in_qty), SUM(out_qty)
+    FROM (
+        SELECT date(date) AS day, item_id, quantity AS in_qty, 0 AS out_qty FROM stockin
+        UNION ALL
+        SELECT date(date), item_id, 0, quantity FROM stockout
+    )
+    WHERE day BETWEEN ? AND ?
+    GROUP BY day, item_id
+    HAVING SUM(in_qty) <> 0 OR SUM(out_qty) <> 0
+"""
+
+
+def rollup(conn):
+    return {(day, item_id): (i, o, r) for day, item_id, i, o, r in conn.execute(
+        "SELECT day, item_id, in_qty, out_qty, reserved_qty FROM movement_daily")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "movements.db")
+        generate(path, items=args.items, movements=args.items * 20, reservations=args.items // 5,
+                 orders=args.items // 10, seed=args.seed)
+
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        raw = sqlite3.connect(path)
+
+        rnd = random.Random(args.seed)
+        for n in range(args.requests):
+            inventory_id = rnd.randint(1, args.items)
+            r = rnd.random()
+            if r < 0.3:
+                client.post("/stock/in", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 40)})
+            elif r < 0.6:
+                client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 20)})
+            elif r < 0.75:
+                client.post("/reservation/create", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+            elif r < 0.9:
+                lines = [{"inventory_id": rnd.randint(1, args.items), "qty": rnd.randint(1, 10)} for _ in range(10)]
+                url = rnd.choice(["/stock/in/batch", "/stock/out/batch", "/reservation/create/batch"])
+                client.post(url, json={"lines": lines})
+            else:
+                # 履歴の訂正もトリガーで反映される
+                with raw:
+                    if r < 0.95:
+                        raw.execute("DELETE FROM stockout WHERE stockout_id = (SELECT stockout_id FROM stockout "
+                                    "ORDER BY random() LIMIT 1)")
+                    else:
+                        raw.execute("UPDATE stockin SET quantity = quantity + 1, date = datetime(date, '-1 day') "
+                                    "WHERE stockin_id = (SELECT stockin_id FROM stockin ORDER BY random() LIMIT 1)")
+
+        expected = {(day, item_id): (i, o) for day, item_id, i, o in raw.execute(LEDGER_DAILY, ("", "9999"))}
+        incremental = rollup(raw)
+        got = {key: (i, o) for key, (i, o, _) in incremental.items() if i or o}
+        assert got == expected, f"入出庫履歴の集計と一致しません（{len(set(got.items()) ^ set(expected.items()))} 行）"
+
+        with raw:
+            migrations.rebuild_movement_daily(raw.cursor())
+        assert rollup(raw) == {key: value for key, value in incremental.items() if any(value)}, \
+            "作り直した結果が加算した結果と一致しません"
+
+        # 入庫の引当で消化された予約（quantity=0）があっても、作り直しは追加時の数量（reserved_qty）から数える
+        assert raw.execute("SELECT COUNT(*) FROM reservations WHERE quantity < reserved_qty").fetchone()[0]
+        with raw:
+            # 列を指定しない追加は quantity で埋まる
+            raw.execute("INSERT INTO reservations (item_id, quantity, reserved_date) VALUES (1, 7, datetime('now'))")
+            incremental = rollup(raw)
+            migrations.rebuild_movement_daily(raw.cursor(), reservations=True, reserved_column="reserved_qty")
+        assert raw.execute("SELECT reserved_qty FROM reservations ORDER BY reservation_id DESC LIMIT 1").fetchone()[0] == 7
+        assert rollup(raw) == {key: value for key, value in incremental.items() if any(value)}, \
+            "予約数量の作り直しが加算した結果と一致しません"
+        try:
+            with raw:
+                raw.execute("UPDATE reservations SET reserved_qty = reserved_qty + 1 WHERE reservation_id = 1")
+            raise AssertionError("reserved_qty を変更できました")
+        except sqlite3.DatabaseError:
+            pass
+
+        today = datetime.now(timezone.utc).date()
+        day_from = (today - timedelta(days=364)).isoformat()
+        day_to = today.isoformat()
+        ledger_out = raw.execute("SELECT SUM(quantity) FROM stockout WHERE date >= ? AND date < date(?, '+1 day')",
+                                 (day_from, day_to)).fetchone()[0]
+        for group in ("day", "month", "category"):
+            t0 = time.perf_counter()
+            body = client.get(f"/reports/movements?from={day_from}&to={day_to}&group={group}").get_json()
+            elapsed = time.perf_counter() - t0
+            assert sum(row["out_qty"] for row in body["rows"]) == ledger_out, group
+            print(f"group={group}: {len(body['rows'])} 行 {elapsed * 1000:.0f}ms")
+
+        total, cursor, pages = 0, 0, 0
+        while True:
+            body = client.get(f"/reports/movements?from={day_from}&to={day_to}&group=item&limit=5000"
+                              f"&cursor={cursor}").get_json()
+            total += sum(row["out_qty"] for row in body["rows"])
+            pages += 1
+            if body["next_cursor"] is None:
+                break
+            cursor = body["next_cursor"]
+        assert total == ledger_out, "group=item"
+        print(f"group=item: {pages} ページ")
+
+        t0 = time.perf_counter()
+        raw.execute("""
+            SELECT substr(date, 1, 7), SUM(quantity) FROM stockout
+            WHERE date >= ? AND date < date(?, '+1 day') GROUP BY 1
+        """, (day_from, day_to)).fetchall()
+        print(f"参考: 出庫履歴から直接 月ごと: {(time.perf_counter() - t0) * 1000:.0f}ms")
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
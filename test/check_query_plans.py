@@ -0,0 +1,173 @@
+# EXPLAIN QUERY PLAN 回帰チェック
+# 各ルートを実際に呼び出して発行された SQL を記録し、インデックスを使わないテーブル全走査がないことを確認する。
+# 全走査が見つかった場合は終了コード 1
+#
+#   python test/check_query_plans.py [-v]
+import io
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 意図的に全件を返すルートで許容する全走査（ルート -> テーブル別名）
+ALLOWED_SCANS = {
+    "GET /stock": {"inv"},
+    "GET /stock/export": {"inv"},
+    # d はチェックポイントと差分をまとめた副問い合わせ（元の表は索引で範囲を絞っている）
+    "GET /stock/asof": {"d"},
+    "GET /stock/asof item": {"d"},
+    # reorder_alerts は発注点以下の行だけの集合なので、全件読んでも O(フラグ件数)
+    "GET /alerts/reorder": {"ra"},
+    # m は全文索引の新しい方から RANK_CANDIDATES 件の一致を rank 順に RANK_WINDOW 件までにした副問い合わせ。語彙（items_fts_vocab）は索引が変わったときだけ読む。
+    # 展開しきれない 1 文字の語は items を先頭から LIKE で絞り込む（件数が揃えば打ち切り）。
+    # p は前方一致を名前順に PREFIX_CANDIDATES 件までにした副問い合わせ
+    "GET /items/search": {"m", "p"},
+    "GET /items/search 2文字": {"m", "p", "items_fts_vocab"},
+    "GET /items/search 1文字": {"m", "p", "items_fts_vocab", "it"},
+    # 全品目の指標をまとめて計算するため items と inventory は全件読む（stockout は 1 日ずつ範囲で読む）
+    "GET /analytics/velocity": {"items", "inventory"},
+    # md は期間内を品目ごとに合計した副問い合わせ（集計表は主キー（day, item_id）の範囲で読む）
+    "GET /reports/movements category": {"md"},
+}
+
+# 仮想表の "INDEX n:M..." は全文索引の MATCH による検索
+SCAN_RE = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)\b(?! USING| VIRTUAL TABLE INDEX \d+:M)")
+SKIP_RE = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|PRAGMA|SAVEPOINT|RELEASE|INSERT INTO \w+ \()", re.I)
+# 接続ごとの一時テーブル（取り込み用の作業テーブル）を使う文は別接続で EXPLAIN できないため対象外
+TEMP_RE = re.compile(r"\btemp\.", re.I)
+# FTS5 が内部で発行する文（索引の shadow table の読み書き。入れ子の文は "-- " 付きで届く）も対象外
+FTS_RE = re.compile(r"^--|'main'\.'\w+_(data|idx|config|docsize|content)'")
+
+
+def seed(path):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO items (item_name, category, reorder_point) VALUES (?, ?, ?)",
+        [(f"item{i:04d}", f"cat{i % 10}", 5) for i in range(500)],
+    )
+    conn.execute("INSERT INTO inventory (item_id, quantity) SELECT item_id, 50 FROM items")
+    conn.executemany("INSERT INTO suppliers (supplier_name) VALUES (?)", [(f"bench{i}",) for i in range(200)])
+    conn.executemany(
+        "INSERT INTO reservations (item_id, quantity) VALUES (?, 1)", [(i % 500 + 1,) for i in range(2000)]
+    )
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def calls():
+    # (ラベル, メソッド, URL, JSON / フォーム)
+    return [
+        ("POST /login", "post", "/login", {"data": {"username": "owner", "password": "ownerpass"}}),
+        ("GET /stock", "get", "/stock", {}),
+        ("GET /stock?page", "get", "/stock?limit=50&cursor=100", {}),
+        ("GET /stock?since", "get", "/stock?since=0&limit=50", {}),
+        ("GET /stock?name_prefix", "get", "/stock?name_prefix=item01&limit=50", {}),
+        ("POST /item/add", "post", "/item/add", {"json": {"item_name": "plan-check", "reorder_point": 1}}),
+        ("POST /reservation/create", "post", "/reservation/create", {"json": {"inventory_id": 3, "qty": 1}}),
+        ("POST /stock/in", "post", "/stock/in", {"json": {"inventory_id": 3, "qty": 10}}),
+        ("POST /stock/out", "post", "/stock/out", {"json": {"inventory_id": 3, "qty": 1}}),
+        ("POST /stock/out (shortage)", "post", "/stock/out", {"json": {"inventory_id": 3, "qty": 100000}}),
+        ("POST /stock/in/batch", "post", "/stock/in/batch",
+         {"json": {"lines": [{"inventory_id": 4, "qty": 2}, {"inventory_id": 5, "qty": 2, "supplier_id": 1}]}}),
+        ("POST /stock/out/batch", "post", "/stock/out/batch",
+         {"json": {"lines": [{"inventory_id": 4, "qty": 1}, {"inventory_id": 5, "qty": 1}]}}),
+        ("POST /reservation/create/batch", "post", "/reservation/create/batch",
+         {"json": {"lines": [{"inventory_id": 6, "qty": 1}]}}),
+        ("GET /stock/stream", "get", "/stock/stream?last_event_id=0", {}),
+        ("POST /items/import", "post", "/items/import",
+         {"data": {"file": (io.BytesIO("item_name,category\nplan-import,cat1\n".encode()), "items.csv")}}),
+        ("GET /stock/export", "get", "/stock/export", {}),
+        ("GET /stock/asof", "get", "/stock/asof?ts=2030-01-01", {}),
+        ("GET /stock/asof item", "get", "/stock/asof?ts=2030-01-01T00:00:00&item_id=1", {}),
+        ("GET /alerts/expiring", "get", "/alerts/expiring?days=30", {}),
+        ("GET /alerts/reorder", "get", "/alerts/reorder?include_ordered=1", {}),
+        ("GET /stock reorder_only", "get", "/stock?reorder_only=1&limit=50", {}),
+        ("GET /alerts/expiring cursor", "get", "/alerts/expiring?days=30&cursor=2026-01-01,5", {}),
+        ("GET /items/search", "get", "/items/search?q=コーヒー", {}),
+        ("GET /items/search 2文字", "get", "/items/search?q=コー 豆&limit=20", {}),
+        ("GET /items/search 1文字", "get", "/items/search?q=-", {}),
+        ("GET /analytics/velocity", "get", "/analytics/velocity?days=3&window=2&limit=5", {}),
+        ("GET /reports/movements day", "get", "/reports/movements?group=day", {}),
+        ("GET /reports/movements month", "get", "/reports/movements?from=2026-01-01&to=2026-12-31&group=month", {}),
+        ("GET /reports/movements category", "get", "/reports/movements?group=category", {}),
+        ("GET /reports/movements item", "get", "/reports/movements?group=item&limit=10&cursor=5", {}),
+        ("GET /reports/movements item_id", "get", "/reports/movements?group=day&item_id=3", {}),
+        ("GET /reports/movements category filter", "get", "/reports/movements?group=item&category=cat1", {}),
+        ("GET /history", "get", "/history?item_id=3&limit=5", {}),
+        ("GET /history cursor", "get",
+         "/history?item_id=3&from=2026-01-01&to=2026-12-31&types=in,out&cursor=2026-03-01 00:00:00,10,out", {}),
+        ("GET /history ndjson", "get", "/history?item_id=3&format=ndjson", {}),
+    ]
+
+
+def main():
+    verbose = "-v" in sys.argv
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "inventory.db")
+    os.environ["INVENTORY_DB_PATH"] = path
+    try:
+        import app as appmod
+        import migrations
+        import db
+
+        migrations.migrate_path(os.environ["INVENTORY_DB_PATH"])
+
+        seed(path)
+
+        captured = []
+        label = {"current": None}
+        connect = db.ConnectionPool._connect
+
+        def traced_connect(self):
+            conn = connect(self)
+            conn.set_trace_callback(lambda sql: captured.append((label["current"], sql)))
+            return conn
+
+        db.ConnectionPool._connect = traced_connect
+
+        # /stock/stream は短時間で打ち切る
+        appmod.app.config["STREAM_MAX_SECONDS"] = 0.2
+        client = appmod.app.test_client()
+        for name, method, url, kwargs in calls():
+            label["current"] = name
+            resp = getattr(client, method)(url, **kwargs)
+            resp.get_data()  # ストリーミング応答も最後まで実行する
+            assert resp.status_code < 500, (name, resp.status_code, resp.data)
+        label["current"] = None
+
+        explain = sqlite3.connect(path)
+        failures = []
+        seen = set()
+        for name, sql in captured:
+            if name is None or SKIP_RE.match(sql) or TEMP_RE.search(sql) or FTS_RE.search(sql) or (name, sql) in seen:
+                continue
+            seen.add((name, sql))
+            plan = [row[3] for row in explain.execute("EXPLAIN QUERY PLAN " + sql)]
+            scans = {m.group(1) for m in map(SCAN_RE.match, plan) if m}
+            scans = {t for t in scans if t != "json_each"} - ALLOWED_SCANS.get(name, set())
+            if verbose or scans:
+                print(f"[{name}] {' '.join(sql.split())[:160]}")
+                for line in plan:
+                    print(f"    {line}")
+            if scans:
+                failures.append((name, sorted(scans)))
+        explain.close()
+
+        if failures:
+            print("\nNG: インデックスを使わない全走査があります")
+            for name, tables in failures:
+                print(f"  {name}: {', '.join(tables)}")
+            sys.exit(1)
+        print(f"OK: {len(seen)} 文すべてインデックスを使用")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# 発注点アラート（reorder_alerts）の検証
+# サンプルデータに入出庫・予約・品目追加・一括処理と発注点の変更を行い、トリガーで維持している集合が
+# 「quantity <= reorder_point」の全件判定と一致することを確認する。/alerts/reorder と
+# 全件取得（/stock）から絞り込む場合の応答時間も表示する
+#
+#   python test/check_reorder.py [--items 50000] [--requests 2000]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+
+
+def expected_set(conn, include_ordered=False):
+    ordered = "+ COALESCE(inv.ordered,0)" if include_ordered else ""
+    return {row[0] for row in conn.execute(f"""
+        SELECT inv.inventory_id FROM inventory AS inv JOIN items AS it ON it.item_id = inv.item_id
+        WHERE inv.quantity {ordered} <= it.reorder_point
+    """)}
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "reorder.db")
+        generate(path, items=args.items, movements=args.items * 10, reservations=args.items // 10,
+                 orders=args.items // 5, seed=args.seed)
+        raw = sqlite3.connect(path)
+        assert {r[0] for r in raw.execute("SELECT inventory_id FROM reorder_alerts")} == expected_set(raw)
+
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+
+        rnd = random.Random(args.seed)
+        for n in range(args.requests):
+            inventory_id = rnd.randint(1, args.items)
+            r = rnd.random()
+            if r < 0.35:
+                client.post("/stock/in", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 40)})
+            elif r < 0.7:
+                client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 20)})
+            elif r < 0.8:
+                client.post("/reservation/create", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+            elif r < 0.85:
+                client.post("/item/add", json={"item_name": f"reorder-check-{n}", "reorder_point": rnd.randint(0, 5)})
+            elif r < 0.93:
+                lines = [{"inventory_id": rnd.randint(1, args.items), "qty": rnd.randint(1, 10)} for _ in range(10)]
+                client.post(rnd.choice(["/stock/in/batch", "/stock/out/batch"]), json={"lines": lines})
+            else:
+                # 発注点の変更（品目マスタの直接更新もトリガーで反映される）
+                with raw:
+                    raw.execute("UPDATE items SET reorder_point = ? WHERE item_id = ?",
+                                (rnd.randint(0, 60), rnd.randint(1, args.items)))
+
+        for include_ordered in (False, True):
+            body = client.get(f"/alerts/reorder?include_ordered={int(include_ordered)}").get_json()
+            got = {row["inventory_id"] for row in body["items"]}
+            assert got == expected_set(raw, include_ordered), f"include_ordered={include_ordered}: 全件判定と一致しません"
+            shortfalls = [row["shortfall"] for row in body["items"]]
+            assert shortfalls == sorted(shortfalls, reverse=True)
+            print(f"include_ordered={int(include_ordered)}: {body['count']} 件")
+
+        # /stock?reorder_only=1 のページングも同じ集合を返す
+        seen, cursor = set(), 0
+        while True:
+            page = client.get(f"/stock?reorder_only=1&limit=1000&cursor={cursor}").get_json()
+            seen |= {row["inventory_id"] for row in page["items"]}
+            assert all(row["reorder_flag"] == 1 for row in page["items"])
+            if page["next_cursor"] is None:
+                break
+            cursor = page["next_cursor"]
+        assert seen == expected_set(raw)
+        raw.close()
+
+        # キャッシュを外した応答時間（書き込みでデータバージョンを変えてから取得）
+        def bump():
+            client.post("/stock/in", json={"inventory_id": 1, "qty": 1})
+
+        def alerts():
+            bump()
+            client.get("/alerts/reorder?include_ordered=1")
+
+        def full():
+            bump()
+            rows = client.get("/stock").get_json()
+            [row for row in rows if row["reorder_flag"]]
+
+        base = timed(bump)
+        print(f"/alerts/reorder: {(timed(alerts) - base) * 1000:.1f}ms  /stock 全件から絞り込み: {(timed(full) - base) * 1000:.1f}ms")
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# 自動発注（flask stock-replenish / replenish.replenish）の検証
+# サンプルデータで全品目の自動発注を 1 回実行し（所要時間を表示）、その後の入庫（単発・一括・仕入先指定あり）で
+#   - inventory.ordered = 品目の発注残（quantity - received_qty、未入荷の発注）の合計
+#   - received_qty <= quantity、status = '入荷済' は received_qty = quantity の発注だけ
+#   - 自動発注の直後は quantity + ordered <= reorder_point の在庫が（発注点 0 を除き）残らない
+# を確認する。2 回目の実行では新たに発注点を下回った在庫だけを発注する。
+# 存在しない仕入先の入庫は単発（404）・一括（その行だけエラー）のどちらでも書き込まないことも確認する
+#
+#   python test/check_replenish.py [--items 100000] [--requests 2000]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import connect  # noqa: E402
+from replenish import replenish  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+
+def check_orders(conn):
+    mismatched = conn.execute("""
+        SELECT COUNT(*) FROM inventory AS inv
+        WHERE COALESCE(inv.ordered,0) <> (
+            SELECT COALESCE(SUM(o.quantity - o.received_qty), 0) FROM orders AS o
+            WHERE o.item_id = inv.item_id AND o.status IN ('発注済', '入荷待ち')
+        )
+    """).fetchone()[0]
+    assert mismatched == 0, f"ordered が発注残と一致しない在庫が {mismatched} 件あります"
+    bad = conn.execute("""
+        SELECT COUNT(*) FROM orders
+        WHERE received_qty > quantity OR (status = '入荷済') <> (received_qty = quantity AND received_qty > 0)
+    """).fetchone()[0]
+    assert bad == 0, f"入荷数量と status が合わない発注が {bad} 件あります"
+
+
+def below_reorder(conn):
+    return conn.execute("""
+        SELECT COUNT(*) FROM inventory AS inv JOIN items AS it ON it.item_id = inv.item_id
+        WHERE inv.quantity + COALESCE(inv.ordered,0) <= it.reorder_point AND it.reorder_point > 0
+    """).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "replenish.db")
+        generate(path, items=args.items, movements=args.items * 10, reservations=args.items // 10,
+                 orders=args.items // 5, seed=args.seed)
+        raw = sqlite3.connect(path)
+        check_orders(raw)
+        before = below_reorder(raw)
+
+        conn = connect(path)
+        t0 = time.perf_counter()
+        result = replenish(conn, factor=2.0)
+        elapsed = time.perf_counter() - t0
+        print(f"発注点以下 {before} 件 → {result['orders']} 件・{len(result['suppliers'])} 仕入先の発注を作成 "
+              f"({elapsed:.2f} 秒)")
+        assert below_reorder(raw) == 0
+        check_orders(raw)
+        assert replenish(conn, factor=2.0)["orders"] == 0, "続けて実行すると同じ品目を再発注しています"
+        assert replenish(conn, factor=2.0, interval=3600) is None, "間隔内に再実行されました"
+
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        ordered_items = [row[0] for row in raw.execute("SELECT DISTINCT inv.inventory_id FROM orders AS o "
+                                                       "JOIN inventory AS inv ON inv.item_id = o.item_id "
+                                                       "WHERE o.run_id = ?", (result["run_id"],))]
+        rnd = random.Random(args.seed)
+        for _ in range(args.requests):
+            inventory_id = rnd.choice(ordered_items)
+            r = rnd.random()
+            if r < 0.6:
+                payload = {"inventory_id": inventory_id, "qty": rnd.randint(1, 80)}
+                if r < 0.2:
+                    payload["supplier_id"] = rnd.randint(1, 10)
+                body = client.post("/stock/in", json=payload).get_json()
+                assert body["status"] == "ok", body
+                ordered = raw.execute("SELECT COALESCE(ordered,0) FROM inventory WHERE inventory_id = ?",
+                                      (inventory_id,)).fetchone()[0]
+                assert body["ordered_remaining"] == ordered
+            elif r < 0.8:
+                lines = [{"inventory_id": rnd.choice(ordered_items), "qty": rnd.randint(1, 40)} for _ in range(10)]
+                client.post("/stock/in/batch", json={"lines": lines})
+            else:
+                client.post("/stock/out", json={"inventory_id": inventory_id, "qty": rnd.randint(1, 30)})
+        check_orders(raw)
+
+        # 存在しない仕入先（外部キーは強制していないのでアプリで断る）。省略・null は既定の仕入先
+        counts = raw.execute("SELECT (SELECT COUNT(*) FROM stockin), (SELECT COUNT(*) FROM lots)").fetchone()
+        line = {"inventory_id": ordered_items[0], "qty": 3, "supplier_id": 999}
+        assert client.post("/stock/in", json=line).status_code == 404
+        body = client.post("/stock/in/batch", json={"lines": [line]}).get_json()
+        assert body["applied"] == 0 and body["results"][0]["message"] == "仕入先が見つかりません", body
+        assert client.post("/stock/in/batch", json={"lines": [line], "mode": "atomic"}).status_code == 400
+        assert raw.execute("SELECT (SELECT COUNT(*) FROM stockin), (SELECT COUNT(*) FROM lots)").fetchone() == counts
+        for path in ("/stock/in", "/stock/in/batch"):
+            payload = {"inventory_id": ordered_items[0], "qty": 1, "supplier_id": None}
+            assert client.post(path, json=payload if path == "/stock/in" else {"lines": [payload]}).status_code == 200
+            assert raw.execute("SELECT supplier_id FROM stockin ORDER BY stockin_id DESC LIMIT 1").fetchone()[0] == 1
+        check_orders(raw)
+        received = raw.execute("SELECT COUNT(*) FROM orders WHERE run_id = ? AND status = '入荷済'",
+                               (result["run_id"],)).fetchone()[0]
+        print(f"入庫後: 入荷済 {received} / {result['orders']} 件")
+
+        second = replenish(conn, factor=2.0)
+        check_orders(raw)
+        assert below_reorder(raw) == 0
+        print(f"2 回目: {second['orders']} 件")
+        conn.close()
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# 品目検索（/items/search）の検証
+# サンプルデータに品目の追加・改名を行ったうえで、ランダムな語（品目名の一部、1〜6 文字、複数語を含む）を検索し、
+#   - 返した品目がすべての語を商品名かカテゴリーに含むこと
+#   - 該当が limit 件未満なら LIKE による全件判定と同じ集合を返すこと（limit 件以上なら limit 件返すこと）
+#   - 品目の追加で増えた trigram が 2 文字の語の展開（語彙のキャッシュ）に反映されること
+#   - 大量に一致する語でも、rowid の小さい一致ではなく rank（bm25）の上位を返すこと
+#     （順位を付けるのは新しい方から RANK_CANDIDATES 件の一致。それ以下の一致なら索引全体の rank 順）
+# を確認する。応答時間（p50 / p99）も表示する
+#
+#   python test/check_search.py [--items 100000] [--queries 500]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+from search import RANK_CANDIDATES  # noqa: E402
+
+LIMIT = 10
+
+
+def expected_ids(conn, terms):
+    where = " AND ".join("(instr(lower(item_name), ?) > 0 OR instr(lower(COALESCE(category,'')), ?) > 0)" for _ in terms)
+    params = [p for t in terms for p in (t.lower(), t.lower())]
+    return {row[0] for row in conn.execute(f"SELECT item_id FROM items WHERE {where}", params)}
+
+
+def random_query(rnd, names):
+    terms = []
+    for _ in range(rnd.choice([1, 1, 1, 2])):
+        name = rnd.choice(names)
+        n = rnd.randint(1, min(6, len(name)))
+        start = rnd.randint(0, len(name) - n)
+        terms.append(name[start:start + n].strip() or name[:1])
+    return " ".join(terms)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "search.db")
+        generate(path, items=args.items, movements=args.items, reservations=10, orders=10, seed=args.seed)
+
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+
+        # 追加・改名した品目も索引に反映される（トリガー）
+        client.post("/item/add", json={"item_name": "エチオピア モカ シダモ", "category": "コーヒー"})
+        raw = sqlite3.connect(path)
+        with raw:
+            raw.execute("UPDATE items SET item_name = 'グアテマラ アンティグア' WHERE item_id = 20")
+        for q, name in (("シダモ", "エチオピア モカ シダモ"), ("アンティ", "グアテマラ アンティグア"), ("モカ エチ", "エチオピア モカ シダモ")):
+            items = client.get("/items/search", query_string={"q": q}).get_json()["items"]
+            assert any(item["item_name"] == name for item in items), f"{q}: 追加・改名した品目が見つかりません"
+
+        # 前方一致のない語: 部分一致の結果は新しい方から RANK_CANDIDATES 件の一致の rank 順の上位と一致する
+        # （後から追加した品目も含む）
+        assert client.get("/items/search", query_string={"q": "煎り"}).get_json()["items"] == []
+        client.post("/item/add", json={"item_name": "深煎りコーヒー", "category": "コーヒー"})
+        items = client.get("/items/search", query_string={"q": "ーヒー", "limit": LIMIT}).get_json()["items"]
+        ranked = [row[0] for row in raw.execute(
+            "SELECT rowid FROM (SELECT rowid, rank FROM items_fts WHERE items_fts MATCH '\"ーヒー\"' "
+            "ORDER BY rowid DESC LIMIT ?) ORDER BY rank, rowid DESC LIMIT ?", (RANK_CANDIDATES, LIMIT))]
+        assert [item["item_id"] for item in items] == ranked, "rank の上位を返していません"
+        assert "深煎りコーヒー" in [item["item_name"] for item in items], "後から追加した品目が rank の上位に入りません"
+        # 2 文字の語は語彙の trigram に展開する（追加で増えた trigram もキャッシュ越しに見える）
+        items = client.get("/items/search", query_string={"q": "煎り"}).get_json()["items"]
+        assert [item["item_name"] for item in items] == ["深煎りコーヒー"], items
+
+        names = [row[0] for row in raw.execute("SELECT item_name FROM items ORDER BY random() LIMIT 2000")]
+        rnd = random.Random(args.seed)
+        queries = [random_query(rnd, names) for _ in range(args.queries)]
+        queries += ["コーヒー", "茶", "ー", "-", "9 9", "コー 豆", "存在しない品目"]
+
+        elapsed = []
+        for q in queries:
+            t0 = time.perf_counter()
+            resp = client.get("/items/search", query_string={"q": q, "limit": LIMIT})
+            elapsed.append(time.perf_counter() - t0)
+            got = {item["item_id"] for item in resp.get_json()["items"]}
+            expected = expected_ids(raw, q.split())
+            assert got <= expected, f"{q!r}: 語を含まない品目を返しました"
+            if len(expected) < LIMIT:
+                assert got == expected, f"{q!r}: {len(got)} 件（全件判定 {len(expected)} 件）"
+            else:
+                assert len(got) == LIMIT, f"{q!r}: {len(got)} 件（全件判定 {len(expected)} 件）"
+        raw.close()
+
+        elapsed.sort()
+        p99 = elapsed[int(len(elapsed) * 0.99)]
+        print(f"{len(queries)} 件: p50 {statistics.median(elapsed) * 1000:.1f}ms  p99 {p99 * 1000:.1f}ms  "
+              f"max {elapsed[-1] * 1000:.1f}ms")
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# /stock/stream（SSE）のスレッド占有の検証
+# gunicorn（gthread、1 ワーカー・--threads 本）を起動し、
+#   - 同時に開けるストリームは STREAM_MAX_CLIENTS 本（省略時は --threads - API_THREADS 本）までで、
+#     それ以上は 503（Retry-After・retry:）になること
+#   - ストリームで枠が埋まっていても通常の API（/stock）が待たされないこと
+#   - 差分を送ったストリームはその時点で終わり（ロングポーリング）、差分がなければ STREAM_MAX_SECONDS で終わること
+# を確認する
+#
+#   python test/check_stream.py [--threads 6] [--max-clients N] [--streams 8]
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+from stream import API_THREADS  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/stock?limit=1")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise AssertionError("gunicorn が起動しませんでした")
+
+
+def open_stream(port, query=""):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", "/stock/stream" + query)
+    return conn, conn.getresponse()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=6)
+    parser.add_argument("--max-clients", type=int)
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--max-seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    server = None
+    try:
+        path = os.path.join(workdir, "stream.db")
+        generate(path, items=1000, movements=5000)
+        port = free_port()
+        env = dict(os.environ,
+                   INVENTORY_DB_PATH=path,
+                   INVENTORY_BIND=f"127.0.0.1:{port}",
+                   INVENTORY_WORKERS="1",
+                   INVENTORY_THREADS=str(args.threads),
+                   INVENTORY_STREAM_MAX_SECONDS=str(args.max_seconds),
+                   INVENTORY_STREAM_POLL_INTERVAL="0.1")
+        if args.max_clients is None:
+            args.max_clients = max(1, args.threads - API_THREADS)
+        else:
+            env["INVENTORY_STREAM_MAX_CLIENTS"] = str(args.max_clients)
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_ready(port)
+
+        # 枠を超えるストリームは 503
+        streams = [open_stream(port) for _ in range(args.streams)]
+        statuses = [resp.status for _, resp in streams]
+        assert statuses.count(200) == args.max_clients, statuses
+        rejected = next(resp for _, resp in streams if resp.status == 503)
+        assert rejected.getheader("Retry-After") and rejected.read().startswith(b"retry: ")
+        print(f"ストリーム {args.streams} 本: {statuses.count(200)} 本配信・{statuses.count(503)} 本は 503")
+
+        # 枠が埋まっていても API は待たされない
+        latencies = []
+        for _ in range(10):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            t0 = time.perf_counter()
+            conn.request("GET", "/stock?limit=50")
+            assert conn.getresponse().read()
+            latencies.append(time.perf_counter() - t0)
+            conn.close()
+        print(f"ストリーム配信中の /stock: 最大 {max(latencies) * 1000:.0f}ms")
+        assert max(latencies) < 1.0
+        for conn, _ in streams:
+            conn.close()
+
+        # 切断したストリームの枠はサーバーが次に書き込むか STREAM_MAX_SECONDS で返る
+        time.sleep(args.max_seconds + 1)
+
+        # 差分がなければ STREAM_MAX_SECONDS で終わる
+        raw = sqlite3.connect(path)
+        last_id = raw.execute("SELECT COALESCE(MAX(event_id), 0) FROM stock_events").fetchone()[0]
+        conn, resp = open_stream(port, f"?last_event_id={last_id}")
+        assert resp.status == 200
+        t0 = time.perf_counter()
+        resp.read()
+        idle = time.perf_counter() - t0
+        assert args.max_seconds - 0.5 <= idle <= args.max_seconds + 2, idle
+        conn.close()
+
+        # 差分を送ったらその時点で終わる
+        conn, resp = open_stream(port, f"?last_event_id={last_id}")
+        assert resp.status == 200
+
+        def write():
+            time.sleep(0.5)
+            writer = sqlite3.connect(path)
+            with writer:
+                writer.execute("UPDATE inventory SET quantity = quantity + 1 WHERE inventory_id = 1")
+            writer.close()
+
+        threading.Thread(target=write).start()
+        t0 = time.perf_counter()
+        body = resp.read().decode()
+        delivered = time.perf_counter() - t0
+        assert "event: stock" in body, body
+        assert delivered < args.max_seconds - 0.5, delivered
+        conn.close()
+        raw.close()
+        print(f"待機のみ {idle:.1f} 秒で終了・差分を送って {delivered:.1f} 秒で終了")
+        print("OK")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# /stock の差分同期（since=<sync_token>）の検証
+# sync_token（stock_events の event_id）で差分を取りながら入出庫・予約を繰り返し、
+#   - 前回の一覧に差分を適用した結果が毎回 since なしの全件と一致すること
+#   - last_update が巻き戻った（時計が戻った・同じミリ秒の）書き込みも差分に含まれること
+#   - 保持期間外の since は 410、整数でない since は 400 になること
+# を確認する
+#
+#   python test/check_sync.py [--items 5000] [--rounds 50]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_data import generate  # noqa: E402
+
+
+def read_all(client, since=None):
+    rows, cursor = {}, 0
+    token = None
+    while True:
+        url = f"/stock?limit=1000&cursor={cursor}" + (f"&since={since}" if since is not None else "")
+        body = client.get(url).get_json()
+        if token is None:
+            token = body["sync_token"]
+        rows.update((row["inventory_id"], row) for row in body["items"])
+        if body["next_cursor"] is None:
+            return rows, token
+        cursor = body["next_cursor"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "sync.db")
+        generate(path, items=args.items, movements=args.items * 5, seed=args.seed)
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        raw = sqlite3.connect(path)
+
+        local, token = read_all(client)
+        rnd = random.Random(args.seed)
+        changed_total = 0
+        for _ in range(args.rounds):
+            for _ in range(rnd.randint(0, 20)):
+                inventory_id = rnd.randint(1, args.items)
+                url = rnd.choice(["/stock/in", "/stock/out", "/reservation/create"])
+                client.post(url, json={"inventory_id": inventory_id, "qty": rnd.randint(1, 3)})
+            if rnd.random() < 0.3:
+                # 時計が戻った書き込み（last_update が前回の同期より古い）
+                with raw:
+                    raw.execute("UPDATE inventory SET quantity = quantity + 1, last_update = '2000-01-01 00:00:00.000' "
+                                "WHERE inventory_id = ?", (rnd.randint(1, args.items),))
+            delta, token = read_all(client, token)
+            local.update(delta)
+            changed_total += len(delta)
+            full, _ = read_all(client)
+            assert local == full, f"差分を適用した一覧が全件と一致しません（{len(set(local) ^ set(full))} 行）"
+        print(f"{args.rounds} 回の差分同期で {changed_total} 行を更新")
+
+        assert client.get("/stock?since=2026-01-01 00:00:00&limit=10").status_code == 400
+        assert client.get(f"/stock?since={token + 10 ** 6}&limit=10").status_code == 410
+        with raw:
+            raw.execute("DELETE FROM stock_events WHERE event_id < ?", (token,))
+        assert client.get("/stock?since=0&limit=10").status_code == 410
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
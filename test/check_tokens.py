@@ -0,0 +1,134 @@
+# API トークン（Authorization: Bearer）の検証
+# 同じ DB を開いた 2 つのアプリ（別プロセスの代わり。トークンキャッシュはアプリごと）で
+#   - owner / staff のトークンで role_required のルートが通る・403 になること、不正なトークンは 401 になること
+#   - DB にはトークンそのものではなく HMAC だけが保存されていること
+#   - 別のプロセスでのロール変更（users.role の UPDATE）がキャッシュ越しでも TOKEN_RECHECK 秒以内に反映されること
+#   - /tokens/<id>/revoke の失効は同じアプリでは即時、もう一方のアプリでも TOKEN_RECHECK 秒以内に反映されること
+#   - TokenCache の TTL・件数上限
+#   - INVENTORY_TOKEN_HASH_KEY が未設定（またはセッションの鍵と同じ）ならトークンの発行・検証を 503 で断ること
+# を確認し、/login 1 回の時間とキャッシュ済みトークンの解決時間を表示する
+#
+#   python test/check_tokens.py [--recheck 0.2]
+import argparse
+import hashlib
+import hmac
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from auth import TokenCache, resolve_token  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+
+def stock_in(client, token, inventory_id=1):
+    return client.post("/stock/in", json={"inventory_id": inventory_id, "qty": 1},
+                       headers={"Authorization": f"Bearer {token}"}).status_code
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return time.monotonic() - (deadline - timeout)
+        time.sleep(0.02)
+    raise AssertionError("時間内に反映されませんでした")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recheck", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    cache = TokenCache(max_entries=2, ttl=10, recheck=1)
+    for n, key in enumerate("abc"):
+        cache.put(key, (key, "owner"), cache.generation, now=n)
+    assert cache.get("a", 3) is None and cache.get("c", 3) == ("c", "owner"), "件数上限を超えた古い項目が残っています"
+    assert cache.get("c", 12) is None, "TTL を過ぎた項目が返りました"
+    generation = cache.generation
+    cache.clear()
+    cache.put("d", ("d", "owner"), generation, now=0)
+    assert cache.get("d", 1) is None, "破棄前に引いた結果がキャッシュされました"
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "tokens.db")
+        generate(path, items=100, movements=1000, seed=args.seed)
+        for key in (None, "secret_key_here"):
+            disabled = create_app({"DB_PATH": path, "TOKEN_HASH_KEY": key})
+            c = disabled.test_client()
+            c.post("/login", data={"username": "owner", "password": "ownerpass"})
+            assert c.post("/tokens", json={"name": "x"}).status_code == 503, key
+            assert stock_in(disabled.test_client(), "inv_x") == 503, key
+
+        config = {"DB_PATH": path, "TOKEN_RECHECK": args.recheck, "TOKEN_HASH_KEY": "check-tokens-key"}
+        app, other_app = create_app(config), create_app(config)
+        admin = app.test_client()
+        admin.post("/login", data={"username": "owner", "password": "ownerpass"})
+        owner = admin.post("/tokens", json={"name": "scanner"}).get_json()
+        staff = admin.post("/tokens", json={"name": "script", "username": "staff"}).get_json()
+        assert owner["role"] == "owner" and staff["role"] == "staff", (owner, staff)
+
+        raw = sqlite3.connect(path)
+        stored = {row[0] for row in raw.execute("SELECT token_hash FROM api_tokens")}
+        key = app.config["TOKEN_HASH_KEY"].encode()
+        for body in (owner, staff):
+            assert body["token"] not in stored
+            assert hmac.new(key, body["token"].encode(), hashlib.sha256).hexdigest() in stored
+
+        client, other = app.test_client(), other_app.test_client()
+        for c in (client, other):
+            assert stock_in(c, owner["token"]) == 200
+            assert stock_in(c, staff["token"]) == 403
+            assert stock_in(c, owner["token"] + "x") == 401
+            assert c.post("/stock/in", json={"inventory_id": 1, "qty": 1}).status_code == 302
+        assert client.get("/tokens", headers={"Authorization": f"Bearer {staff['token']}"}).status_code == 403
+
+        # 別プロセス（CLI の user-role 相当）でのロール変更
+        with raw:
+            raw.execute("UPDATE users SET role = 'manager' WHERE username = 'staff'")
+        for c in (client, other):
+            elapsed = wait_for(lambda: stock_in(c, staff["token"]) == 200, args.recheck * 5 + 1)
+            print(f"ロール変更の反映: {elapsed * 1000:.0f}ms")
+
+        # 失効（同じアプリは即時、もう一方はキャッシュ済みでも auth_version の確認で）
+        assert stock_in(other, owner["token"]) == 200
+        assert admin.post(f"/tokens/{owner['token_id']}/revoke").status_code == 200
+        assert stock_in(client, owner["token"]) == 401, "失効が即時に反映されていません"
+        elapsed = wait_for(lambda: stock_in(other, owner["token"]) == 401, args.recheck * 5 + 1)
+        print(f"失効の反映（別プロセス）: {elapsed * 1000:.0f}ms")
+        assert admin.post(f"/tokens/{owner['token_id']}/revoke").status_code == 404
+        listed = {row["token_id"]: row for row in admin.get("/tokens").get_json()["tokens"]}
+        assert listed[owner["token_id"]]["revoked_at"] and not listed[staff["token_id"]]["revoked_at"]
+
+        # 時間: /login（パスワード検証）と、キャッシュ済みトークンの解決
+        t0 = time.perf_counter()
+        for _ in range(5):
+            app.test_client().post("/login", data={"username": "owner", "password": "ownerpass"})
+        login = (time.perf_counter() - t0) / 5
+        with app.test_request_context():
+            resolve_token(staff["token"])
+            before = app.extensions["token_cache"].stats()
+            t0 = time.perf_counter()
+            for _ in range(10000):
+                assert resolve_token(staff["token"]) == ("staff", "manager")
+            resolve = (time.perf_counter() - t0) / 10000
+            after = app.extensions["token_cache"].stats()
+        assert after["misses"] == before["misses"], "キャッシュ済みのトークンで DB を引いています"
+        print(f"/login {login * 1000:.1f}ms  トークンの解決（キャッシュ） {resolve * 1e6:.1f}µs")
+        raw.close()
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
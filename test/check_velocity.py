@@ -0,0 +1,167 @@
+# 消費ペース分析（/analytics/velocity）の検証
+# サンプルデータ（--days 日分の入出庫）で全品目をまとめて計算し、ランダムに選んだ品目について
+# 出庫履歴から 1 日ずつ Python で求めた移動平均・指数平滑・標準偏差・在庫日数と一致することを確認する。
+# /analytics/velocity をカーソルで全ページ読んだ結果が、並び順ごとに全品目を並べた順と過不足なく一致すること、
+# app の import では numpy を読み込まないこと、同時の要求は同じ引数なら 1 回だけ計算し、別の引数の計算は
+# 並行して進むことも確認する。
+# 全品目の計算時間と、その間に確保したメモリの最大値も表示する
+#
+#   python test/check_velocity.py [--items 100000] [--days 730] [--movements 4000000]
+import argparse
+import math
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analytics  # noqa: E402
+from analytics import SORT_KEYS, compute_velocity, sort_order  # noqa: E402
+from sample_data import generate  # noqa: E402
+
+
+def reference(conn, item_id, days, window, alpha, today):
+    start = today - timedelta(days=days)
+    daily = [0] * days
+    for date, quantity in conn.execute(
+        "SELECT date, quantity FROM stockout WHERE item_id = ? AND date >= ? AND date < ?",
+        (item_id, start.isoformat(), today.isoformat()),
+    ):
+        daily[(datetime.fromisoformat(date).date() - start).days] += quantity
+    ewma = 0.0
+    for x in daily:
+        ewma = alpha * x + (1 - alpha) * ewma
+    return {
+        "total": sum(daily),
+        "sma": sum(daily[-window:]) / window,
+        "ewma": ewma,
+        "std": statistics.pstdev(daily),
+    }
+
+
+def read_pages(client, query, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        url = f"/analytics/velocity?{query}&limit={limit}" + (f"&cursor={quote(cursor)}" if cursor else "")
+        body = client.get(url).get_json()
+        assert "items" in body, (url, body)
+        ids += [row["item_id"] for row in body["items"]]
+        pages += 1
+        if body["next_cursor"] is None:
+            return ids, body["count"], pages
+        cursor = body["next_cursor"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--movements", type=int, default=4000000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "velocity.db")
+        generate(path, items=args.items, movements=args.movements, reservations=args.items // 10,
+                 orders=args.items // 10, days=args.days, seed=args.seed)
+        conn = sqlite3.connect(path)
+        today = datetime.now(timezone.utc).date()
+        window, alpha, lead_time, z = 28, 0.1, 7, 1.65
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = compute_velocity(conn, args.days, window, alpha, lead_time, z, today=today)
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # tracemalloc 有効時は遅くなるので時間は計り直す
+        t0 = time.perf_counter()
+        compute_velocity(conn, args.days, window, alpha, lead_time, z, today=today)
+        elapsed = time.perf_counter() - t0
+
+        rnd = random.Random(args.seed)
+        positions = dict(conn.execute("""
+            SELECT item_id, SUM(quantity - COALESCE(allocated,0) + COALESCE(ordered,0)) FROM inventory GROUP BY item_id
+        """))
+        for i in rnd.sample(range(len(result["item_id"])), min(args.samples, len(result["item_id"]))):
+            item_id = int(result["item_id"][i])
+            ref = reference(conn, item_id, args.days, window, alpha, today)
+            for key, value in ref.items():
+                assert math.isclose(result[key][i], value, rel_tol=1e-9, abs_tol=1e-9), (item_id, key, result[key][i], value)
+            position = positions.get(item_id, 0)
+            assert result["position"][i] == position, (item_id, "position")
+            cover = position / ref["ewma"] if ref["ewma"] > 0 else math.inf
+            assert math.isclose(result["days_of_cover"][i], cover, rel_tol=1e-9), (item_id, "days_of_cover")
+            suggested = math.ceil(ref["ewma"] * lead_time + z * ref["std"] * math.sqrt(lead_time))
+            assert abs(result["suggested_reorder_point"][i] - suggested) <= 1, (item_id, "suggested_reorder_point")
+        conn.close()
+
+        # カーソルでのページング（並び順ごと・カテゴリーの絞り込みあり）
+        from app import create_app
+        app = create_app({"DB_PATH": path})
+        client = app.test_client()
+        client.post("/login", data={"username": "owner", "password": "ownerpass"})
+        query = f"days={args.days}&window={window}&alpha={alpha}&lead_time={lead_time}&z={z}"
+        for sort in SORT_KEYS:
+            expected = result["item_id"][sort_order(result, sort)].tolist()
+            ids, count, pages = read_pages(client, f"{query}&sort={sort}", 5000)
+            assert ids == expected and count == len(expected), f"sort={sort}: ページを順に読んだ結果が一致しません"
+            mask = [c == "紅茶" for c in result["category"]]
+            expected = result["item_id"][sort_order(result, sort, mask)].tolist()
+            ids, count, _ = read_pages(client, f"{query}&sort={sort}&category=紅茶", 777)
+            assert ids == expected and count == len(expected), f"sort={sort}&category: 一致しません"
+            print(f"sort={sort}: {pages} ページ")
+        assert client.get(f"/analytics/velocity?{query}&cursor=abc").status_code == 400
+
+        # 同時の要求: 引数（window）ごとに計算は 1 回、別の引数の計算は待たずに重なる
+        calls = []
+
+        def traced(conn, *params, **kwargs):
+            started = time.monotonic()
+            value = compute_velocity(conn, *params, **kwargs)
+            calls.append((params[1], started, time.monotonic()))
+            return value
+
+        def request(w):
+            c = app.test_client()
+            c.post("/login", data={"username": "owner", "password": "ownerpass"})
+            assert c.get(f"/analytics/velocity?days={args.days}&window={w}&limit=1").status_code == 200
+
+        analytics.compute_velocity = traced
+        try:
+            threads = [threading.Thread(target=request, args=(w,)) for w in (14, 14, 14, 7, 7, 7)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            analytics.compute_velocity = compute_velocity
+        assert sorted(w for w, _, _ in calls) == [7, 14], calls
+        (_, s1, e1), (_, s2, e2) = calls
+        assert max(s1, s2) < min(e1, e2), "別の引数の計算が直列になっています"
+
+        probe = "import sys, app; assert 'numpy' not in sys.modules"
+        subprocess.run([sys.executable, "-c", probe], cwd=ROOT, check=True, capture_output=True,
+                       env=dict(os.environ, INVENTORY_DB_PATH=path))
+
+        print(f"{len(result['item_id'])} 品目 × {args.days} 日: {elapsed:.2f} 秒  メモリ最大 {peak / 1e6:.0f} MB")
+        print("OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
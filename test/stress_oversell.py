@@ -0,0 +1,117 @@
+# 同時実行ストレステスト: 1 つの在庫行に多数スレッドから出庫・予約を浴びせ、過剰引当が起きないことを確認する
+#
+#   python test/stress_oversell.py --threads 16 --requests 200 --quantity 1000
+#
+# 検証内容
+#   - 成功した出庫数量の合計 + 成功した予約数量の合計 <= 初期在庫
+#   - 最終的な quantity / allocated が成功したリクエストの合計と一致する
+#   - stockout / reservations の履歴件数が成功件数と一致する
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="スレッドあたりのリクエスト数")
+    parser.add_argument("--quantity", type=int, default=1000, help="初期在庫")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "inventory.db")
+    os.environ["INVENTORY_DB_PATH"] = path
+    os.environ.setdefault("INVENTORY_DB_POOL_SIZE", str(args.threads))
+    try:
+        import app as appmod
+        import migrations
+
+        migrations.migrate_path(os.environ["INVENTORY_DB_PATH"])
+
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO items (item_id, item_name, reorder_point) VALUES (1, 'stress', 0)")
+        conn.execute("INSERT INTO inventory (inventory_id, item_id, quantity) VALUES (1, 1, ?)", (args.quantity,))
+        conn.commit()
+
+        # ログインは 1 回だけ行い、セッション Cookie を各クライアントで共有する
+        login = appmod.app.test_client()
+        login.post("/login", data={"username": "owner", "password": "ownerpass"})
+        cookie = login.get_cookie("session").value
+
+        lock = threading.Lock()
+        totals = {"out": 0, "out_ok": 0, "reserve": 0, "reserve_ok": 0, "rejected": 0, "busy": 0, "other": 0}
+        barrier = threading.Barrier(args.threads)
+
+        def worker(n):
+            rnd = random.Random(args.seed + n)
+            client = appmod.app.test_client()
+            client.set_cookie("session", cookie)
+            local = dict.fromkeys(totals, 0)
+            barrier.wait()
+            for _ in range(args.requests):
+                qty = rnd.randint(1, 5)
+                if rnd.random() < 0.5:
+                    resp = client.post("/stock/out", json={"inventory_id": 1, "qty": qty})
+                    kind = "out"
+                else:
+                    resp = client.post("/reservation/create", json={"inventory_id": 1, "qty": qty, "usage": "stress"})
+                    kind = "reserve"
+                if resp.status_code == 200:
+                    local[kind] += qty
+                    local[kind + "_ok"] += 1
+                elif resp.status_code == 400:
+                    local["rejected"] += 1
+                elif resp.status_code == 503:
+                    local["busy"] += 1
+                else:
+                    local["other"] += 1
+            with lock:
+                for key, value in local.items():
+                    totals[key] += value
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        quantity, allocated = conn.execute("SELECT quantity, allocated FROM inventory WHERE inventory_id = 1").fetchone()
+        out_rows = conn.execute("SELECT COUNT(*) FROM stockout").fetchone()[0]
+        res_rows = conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+        conn.close()
+
+        total_requests = args.threads * args.requests
+        print(f"requests      : {total_requests} ({args.threads} threads)")
+        print(f"elapsed       : {elapsed:.2f} s")
+        print(f"throughput    : {total_requests / elapsed:.0f} req/s")
+        print(f"stock out ok  : {totals['out_ok']} ({totals['out']} units)")
+        print(f"reserve ok    : {totals['reserve_ok']} ({totals['reserve']} units)")
+        print(f"rejected(400) : {totals['rejected']}")
+        print(f"busy(503)     : {totals['busy']}")
+        print(f"final         : quantity={quantity} allocated={allocated}")
+
+        assert totals["other"] == 0, "想定外のステータスが返りました"
+        assert totals["out"] + totals["reserve"] <= args.quantity, "過剰引当（oversell）が発生しました"
+        assert quantity == args.quantity - totals["out"]
+        assert allocated == totals["reserve"]
+        assert quantity - allocated >= 0
+        assert out_rows == totals["out_ok"] and res_rows == totals["reserve_ok"]
+        print("OK: 過剰引当なし")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
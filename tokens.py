@@ -0,0 +1,189 @@
+import os
+import secrets
+
+import click
+from flask import Blueprint, current_app, g, jsonify, request
+
+import migrations
+from auth import TokenCache, TokensDisabled, hash_token, role_required, token_key
+from db import connect, get_read_db, run_write
+from metrics import log
+
+# API トークン（スキャナー・連携スクリプトなどの機械クライアント用）
+# /login のパスワード検証（PBKDF2）は意図的に重いので、頻繁にログインし直すクライアントには
+# ユーザーごとのトークンを発行し、Authorization: Bearer <token> で role_required のルートを呼んでもらう。
+#   - DB には HMAC-SHA256(TOKEN_HASH_KEY, token) だけを保存する（トークンは発行時に一度だけ返す）。
+#     鍵は INVENTORY_TOKEN_HASH_KEY で必ず設定する。未設定・セッションの鍵と同じ場合は発行も検証もしない（503）
+#   - ロールはトークンのユーザーの users.role（ロールを変えればトークンにも反映される）
+#   - 解決結果はプロセス内の TokenCache（TTL 付き LRU）に持ち、認証済みリクエストで DB を引かない。
+#     失効・ロール変更は同じプロセスでは即時、他のプロセスでも TOKEN_RECHECK 秒以内に反映される
+#
+#   POST /tokens {"name": "scanner-1"[, "username": "staff"]}  発行（既定は自分のトークン）
+#   GET  /tokens                                               一覧
+#   POST /tokens/<token_id>/revoke                             失効
+#   flask token-create USERNAME NAME / token-revoke TOKEN_ID / token-list / user-role USERNAME ROLE
+
+bp = Blueprint("tokens", __name__)
+
+TOKEN_PREFIX = "inv_"
+ROLES = ("owner", "manager", "staff")
+
+
+def new_token():
+    return TOKEN_PREFIX + secrets.token_urlsafe(32)
+
+
+def create_token(cur, username, name):
+    cur.execute("SELECT id, role FROM users WHERE username = ?", (username,))
+    user = cur.fetchone()
+    if user is None:
+        return {"status": "error", "message": "ユーザーが見つかりません"}, 404
+    token = new_token()
+    cur.execute("""
+        INSERT INTO api_tokens (user_id, name, token_hash) VALUES (?, ?, ?)
+        RETURNING token_id, created_at
+    """, (user[0], name, hash_token(token)))
+    token_id, created_at = cur.fetchone()
+    return {
+        "status": "ok",
+        "token_id": token_id,
+        "token": token,
+        "username": username,
+        "role": user[1],
+        "name": name,
+        "created_at": created_at,
+    }, 201
+
+
+def revoke_token(cur, token_id):
+    cur.execute("""
+        UPDATE api_tokens SET revoked_at = datetime('now') WHERE token_id = ? AND revoked_at IS NULL
+    """, (token_id,))
+    if cur.rowcount == 0:
+        return {"status": "error", "message": "トークンが見つからないか失効済みです"}, 404
+    return {"status": "ok", "token_id": token_id}, 200
+
+
+LIST_SQL = """
+    SELECT t.token_id, u.username, u.role, t.name, t.created_at, t.revoked_at
+    FROM api_tokens AS t
+    JOIN users AS u ON u.id = t.user_id
+    ORDER BY t.token_id
+"""
+
+
+@bp.route("/tokens", methods=["POST"])
+@role_required("owner")
+def create_token_route():
+    data = request.get_json(silent=True) or {}
+    name = str(data.get("name") or "").strip()
+    if not name:
+        return jsonify({"status": "error", "message": "name を指定してください"}), 400
+    try:
+        token_key()
+    except TokensDisabled as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    username = data.get("username") or g.user
+    body, status = run_write(lambda cur: create_token(cur, username, name))
+    return jsonify(body), status
+
+
+@bp.route("/tokens", methods=["GET"])
+@role_required("owner")
+def list_tokens():
+    return jsonify({"tokens": [dict(row) for row in get_read_db().execute(LIST_SQL)]})
+
+
+@bp.route("/tokens/<int:token_id>/revoke", methods=["POST"])
+@role_required("owner")
+def revoke_token_route(token_id):
+    body, status = run_write(lambda cur: revoke_token(cur, token_id))
+    if status == 200:
+        # このプロセスのキャッシュは即時に捨てる（他のプロセスは auth_version の確認で捨てる）
+        current_app.extensions["token_cache"].clear()
+    return jsonify(body), status
+
+
+def cli_write(fn):
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            body, status = fn(conn.cursor())
+            conn.execute("COMMIT" if status < 400 else "ROLLBACK")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    if status >= 400:
+        raise click.ClickException(body["message"])
+    return body
+
+
+# flask --app app token-create USERNAME NAME
+@click.command("token-create")
+@click.argument("username")
+@click.argument("name")
+def token_create_command(username, name):
+    try:
+        token_key()
+    except TokensDisabled as e:
+        raise click.ClickException(str(e))
+    body = cli_write(lambda cur: create_token(cur, username, name))
+    click.echo(f"token {body['token_id']} ({body['username']} / {body['role']}): {body['token']}")
+    click.echo("トークンはこの場でしか表示されません。安全な場所に保存してください")
+
+
+# flask --app app token-revoke TOKEN_ID
+@click.command("token-revoke")
+@click.argument("token_id", type=int)
+def token_revoke_command(token_id):
+    cli_write(lambda cur: revoke_token(cur, token_id))
+    click.echo(f"token {token_id} を失効しました")
+
+
+# flask --app app token-list
+@click.command("token-list")
+def token_list_command():
+    path = current_app.config["DB_PATH"]
+    migrations.migrate_path(path)
+    conn = connect(path)
+    try:
+        for token_id, username, role, name, created_at, revoked_at in conn.execute(LIST_SQL):
+            state = f"失効 {revoked_at}" if revoked_at else "有効"
+            click.echo(f"{token_id}\t{username}\t{role}\t{name}\t{created_at}\t{state}")
+    finally:
+        conn.close()
+
+
+def set_role(cur, username, role):
+    cur.execute("UPDATE users SET role = ? WHERE username = ?", (role, username))
+    if cur.rowcount == 0:
+        return {"status": "error", "message": "ユーザーが見つかりません"}, 404
+    return {"status": "ok"}, 200
+
+
+# flask --app app user-role USERNAME ROLE（そのユーザーのトークンのロールも変わる）
+@click.command("user-role")
+@click.argument("username")
+@click.argument("role", type=click.Choice(ROLES))
+def user_role_command(username, role):
+    cli_write(lambda cur: set_role(cur, username, role))
+    click.echo(f"{username} のロールを {role} に変更しました")
+
+
+def init_app(app):
+    app.config.setdefault("TOKEN_HASH_KEY", os.environ.get("INVENTORY_TOKEN_HASH_KEY"))
+    if not app.config["TOKEN_HASH_KEY"] or app.config["TOKEN_HASH_KEY"] == app.secret_key:
+        log.warning("INVENTORY_TOKEN_HASH_KEY が未設定（またはセッションの鍵と同じ）のため、API トークンの発行・検証を無効にしています")
+    app.config.setdefault("TOKEN_CACHE_SIZE", int(os.environ.get("INVENTORY_TOKEN_CACHE_SIZE", 1024)))
+    app.config.setdefault("TOKEN_CACHE_TTL", float(os.environ.get("INVENTORY_TOKEN_CACHE_TTL", 300)))
+    app.config.setdefault("TOKEN_RECHECK", float(os.environ.get("INVENTORY_TOKEN_RECHECK", 1.0)))
+    app.extensions["token_cache"] = TokenCache(
+        app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL"], app.config["TOKEN_RECHECK"])
+    app.register_blueprint(bp)
+    for command in (token_create_command, token_revoke_command, token_list_command, user_role_command):
+        app.cli.add_command(command)